@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+#
+# bench_api.py -- latency and throughput benchmark of tournament.py
+#
+# Populates PostgreSQL with synthetic tournaments (players x rounds x
+# concurrent tournaments) through the public functions of tournament.py, then
+# measures registerPlayer, reportMatch, playerStandings,
+# playerStandingsWithBye, playerStandingsWithTiebreaks and swissPairings on
+# the populated tournaments: latency percentiles, throughput and the number
+# of SQL statements, connections and pool checkouts per call.
+#
+# Results are written as JSON. A previous result file can be given with
+# --compare; functions which got slower by more than --threshold or run more
+# statements or connections per call are reported as regressions and the
+# exit status is 1.
+#
+# ALL PLAYERS AND MATCHES OF THE DATABASE ARE DELETED. Run it against a
+# database created for benchmarks; --reset is required if the database is
+# not empty.
+#
+# Usage:
+#   python benchmarks/bench_api.py [--players 16,256,...] [--rounds N,...]
+#                                  [--tournaments N,...] [--samples N]
+#                                  [--threads N] [--no-pool] [--dsn DSN]
+#                                  [--buffer-batch N] [--buffer-delay S]
+#                                  [--output FILE] [--compare FILE]
+#                                  [--threshold R] [--min-delta-ms MS]
+#                                  [--seed N] [--reset]
+#
+
+from __future__ import division, print_function
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from timeit import default_timer as timer
+
+import psycopg2
+import psycopg2.extensions
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import tournament  # noqa
+
+MEASURED_FUNCTIONS = ['playerStandings', 'playerStandingsWithBye',
+                      'playerStandingsWithTiebreaks', 'swissPairings',
+                      'reportMatch', 'registerPlayer']
+
+_counters = {'statements': 0, 'connections': 0}
+_countersLock = threading.Lock()
+
+
+def _count(name, number=1):
+    with _countersLock:
+        _counters[name] += number
+
+
+class CountingCursor(psycopg2.extensions.cursor):
+    """Cursor, which counts statements sent to the server."""
+
+    def execute(self, query, vars=None):
+        _count('statements')
+        return super(CountingCursor, self).execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        _count('statements', len(vars_list))
+        return super(CountingCursor, self).executemany(query, vars_list)
+
+    def copy_expert(self, sql, file, size=8192):
+        _count('statements')
+        return super(CountingCursor, self).copy_expert(sql, file, size)
+
+
+def countingConnect():
+    """Replacement of tournament.connect, which counts connections and
+    statements."""
+    _count('connections')
+    return psycopg2.connect(tournament.DSN, cursor_factory=CountingCursor)
+
+
+def percentile(values, p):
+    """Returns the p-th percentile (nearest rank) of sorted values."""
+    if not values:
+        return None
+    rank = max(1, int(round(p / 100.0 * len(values) + 0.4999)))
+    return values[min(rank, len(values)) - 1]
+
+
+def measure(function, calls, threads):
+    """Runs function(*args) for every args of calls, returns statistics.
+
+    With threads > 1 calls are split between threads, which run at the same
+    time (the pool gives every thread its own connection).
+    """
+    latencies = [[] for i in range(threads)]
+
+    def run(index):
+        for args in calls[index::threads]:
+            start = timer()
+            function(*args)
+            latencies[index].append(timer() - start)
+
+    before = dict(_counters)
+    checkouts = tournament.poolStats().get('checkouts', 0)
+    start = timer()
+    if threads > 1:
+        workers = [threading.Thread(target=run, args=(i,))
+                   for i in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+    else:
+        run(0)
+    wall = timer() - start
+
+    times = sorted(t * 1000 for t in itertools.chain(*latencies))
+    n = len(times)
+    return {
+        'calls': n,
+        'meanMs': sum(times) / n,
+        'p50Ms': percentile(times, 50),
+        'p90Ms': percentile(times, 90),
+        'p99Ms': percentile(times, 99),
+        'maxMs': times[-1],
+        'callsPerSecond': n / max(wall, 1e-9),
+        'statementsPerCall': (_counters['statements'] -
+                              before['statements']) / n,
+        'connectionsPerCall': (_counters['connections'] -
+                               before['connections']) / n,
+        'checkoutsPerCall': (tournament.poolStats().get('checkouts', 0) -
+                             checkouts) / n,
+    }
+
+
+def populate(players, rounds, tournaments, rnd):
+    """Registers players of every tournament and plays rounds with random
+    results, using the bulk functions. Returns the list of tournament IDs."""
+    tournament.deleteMatches()
+    tournament.deletePlayers()
+    tids = list(range(1, tournaments + 1))
+    for tid in tids:
+        tournament.registerPlayers(
+            ['Player %d-%d' % (tid, i) for i in range(players)], tid)
+    for r in range(rounds):
+        for tid in tids:
+            results = []
+            for id1, name1, id2, name2 in tournament.swissPairings(tid):
+                results.append((id1, id2) if rnd.random() < 0.5
+                               else (id2, id1))
+            tournament.reportMatches(results, tid)
+    return tids
+
+
+def runScenario(players, rounds, tournaments, samples, threads, rnd):
+    """Populates one scenario and measures every function of
+    MEASURED_FUNCTIONS. Returns a list of result dicts."""
+    tids = populate(players, rounds, tournaments, rnd)
+    scenario = {'players': players, 'rounds': rounds,
+                'tournaments': tournaments}
+    readCalls = [(tids[i % len(tids)],) for i in range(samples)]
+
+    # results of the next round, reported one match at a time
+    matchCalls = []
+    for tid in tids:
+        for id1, name1, id2, name2 in tournament.swissPairings(tid):
+            matchCalls.append((id1, id2, False, tid))
+    matchCalls = matchCalls[:samples]
+
+    registerCalls = [('New player %d' % i, tids[i % len(tids)])
+                     for i in range(samples)]
+
+    calls = {
+        'playerStandings': readCalls,
+        'playerStandingsWithBye': readCalls,
+        'playerStandingsWithTiebreaks': readCalls,
+        'swissPairings': readCalls,
+        'reportMatch': matchCalls,
+        'registerPlayer': registerCalls,
+    }
+    results = []
+    for name in MEASURED_FUNCTIONS:
+        stats = measure(getattr(tournament, name), calls[name], threads)
+        stats.update(scenario, function=name)
+        results.append(stats)
+    return results
+
+
+def compare(results, baseline, threshold, minDeltaMs):
+    """Compares results with a baseline run.
+
+    Returns:
+      A list of regression descriptions (strings).
+    """
+    def key(result):
+        return (result['function'], result['players'], result['rounds'],
+                result['tournaments'])
+
+    old = dict((key(result), result) for result in baseline['results'])
+    regressions = []
+    for result in results:
+        previous = old.get(key(result))
+        if previous is None:
+            continue
+        where = '%s (%d players, %d rounds, %d tournaments)' % key(result)
+        for metric in ('p50Ms', 'p99Ms'):
+            delta = result[metric] - previous[metric]
+            if (delta > minDeltaMs and
+                    result[metric] > previous[metric] * (1 + threshold)):
+                regressions.append('%s: %s %.2f -> %.2f ms' % (
+                    where, metric, previous[metric], result[metric]))
+        for metric in ('statementsPerCall', 'connectionsPerCall'):
+            if result[metric] > previous[metric] + 1e-9:
+                regressions.append('%s: %s %.2f -> %.2f' % (
+                    where, metric, previous[metric], result[metric]))
+    return regressions
+
+
+def _intList(text):
+    return [int(value) for value in text.split(',')]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Latency and throughput benchmark of tournament.py")
+    parser.add_argument('--players', type=_intList, default=[16, 256, 1024],
+                        help="comma separated players per tournament")
+    parser.add_argument('--rounds', type=_intList, default=[5],
+                        help="comma separated rounds played before measuring")
+    parser.add_argument('--tournaments', type=_intList, default=[4],
+                        help="comma separated numbers of tournaments")
+    parser.add_argument('--samples', type=int, default=200,
+                        help="measured calls per function")
+    parser.add_argument('--threads', type=int, default=1,
+                        help="threads making the measured calls")
+    parser.add_argument('--no-pool', action='store_true',
+                        help="open a new connection for every call")
+    parser.add_argument('--buffer-batch', type=int, default=0,
+                        help="buffer reported results, up to N per commit "
+                        "(0 writes every result at once)")
+    parser.add_argument('--buffer-delay', type=float,
+                        default=tournament.REPORT_MAX_DELAY,
+                        help="seconds a buffered result waits for others")
+    parser.add_argument('--dsn', default=tournament.DSN)
+    parser.add_argument('--output', default='bench_api.json')
+    parser.add_argument('--compare', help="result file of a previous run")
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help="relative slowdown reported as a regression")
+    parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                        help="smaller slowdowns are never reported")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reset', action='store_true',
+                        help="allow deleting existing players and matches")
+    args = parser.parse_args(argv)
+
+    tournament.DSN = args.dsn
+    tournament.connect = countingConnect
+    if args.no_pool:
+        tournament.configurePool(enabled=False)
+    else:
+        tournament.configurePool(maxSize=max(tournament.POOL_MAX_SIZE,
+                                             args.threads))
+    if args.buffer_batch:
+        tournament.configureReportBuffer(args.buffer_batch,
+                                         args.buffer_delay)
+
+    if tournament.countPlayers() and not args.reset:
+        raise SystemExit("The database has players, use --reset to delete "
+                         "them and run the benchmark")
+    with tournament.getConnection() as conn:
+        c = conn.cursor()
+        c.execute("SHOW server_version")
+        serverVersion = c.fetchone()[0]
+
+    rnd = random.Random(args.seed)
+    print("%-28s %7s %6s %5s %9s %9s %9s %9s %7s %6s" % (
+        'function', 'players', 'rounds', 'tours', 'p50 (ms)', 'p99 (ms)',
+        'max (ms)', 'calls/s', 'stmts', 'conns'))
+    results = []
+    for players, rounds, tournaments in itertools.product(
+            args.players, args.rounds, args.tournaments):
+        for result in runScenario(players, rounds, tournaments,
+                                  args.samples, args.threads, rnd):
+            results.append(result)
+            print("%-28s %7d %6d %5d %9.2f %9.2f %9.2f %9.0f %7.2f %6.2f" % (
+                result['function'], players, rounds, tournaments,
+                result['p50Ms'], result['p99Ms'], result['maxMs'],
+                result['callsPerSecond'], result['statementsPerCall'],
+                result['connectionsPerCall']))
+    tournament.deleteMatches()
+    tournament.deletePlayers()
+
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'postgres': serverVersion,
+            'samples': args.samples,
+            'threads': args.threads,
+            'pool': not args.no_pool,
+            'bufferBatch': args.buffer_batch,
+            'bufferDelay': args.buffer_delay if args.buffer_batch else None,
+            'seed': args.seed,
+        },
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print("Results written to " + args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold,
+                              args.min_delta_ms)
+        for regression in regressions:
+            print("REGRESSION " + regression)
+        if regressions:
+            return 1
+        print("No regressions compared to " + args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
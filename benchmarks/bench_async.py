@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+#
+# bench_async.py -- concurrency benchmark of tournament_async.py against the
+# synchronous API of tournament.py
+#
+# Populates PostgreSQL with synthetic tournaments like bench_api.py, then
+# lets many clients of one asyncio event loop (e.g. websocket connections of
+# a scoreboard service) call a mix of playerStandings,
+# playerStandingsWithBye, playerStandingsWithTiebreaks, swissPairings and
+# reportMatch at the same time, in three modes:
+#
+#   blocking  the synchronous functions called on the loop
+#   threads   the synchronous functions run in a thread pool (one thread
+#             per client)
+#   async     the coroutines of tournament_async.py
+#
+# For every mode it reports throughput, latency percentiles of the calls and
+# the lag of the event loop: how late a coroutine, which sleeps 10 ms at a
+# time, wakes up. A blocked loop delays every other client by this lag.
+#
+# ALL PLAYERS AND MATCHES OF THE DATABASE ARE DELETED. Run it against a
+# database created for benchmarks; --reset is required if the database is
+# not empty.
+#
+# Usage:
+#   python benchmarks/bench_async.py [--players N] [--rounds N]
+#                                    [--tournaments N] [--clients N]
+#                                    [--calls N] [--modes M,...]
+#                                    [--dsn DSN] [--seed N] [--reset]
+#
+
+import argparse
+import asyncio
+import functools
+import os
+import random
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import tournament  # noqa
+import tournament_async  # noqa
+from bench_api import percentile, populate  # noqa
+
+MODES = ['blocking', 'threads', 'async']
+
+# share of the calls of every function
+MIX = [('playerStandings', 0.6), ('playerStandingsWithBye', 0.1),
+       ('playerStandingsWithTiebreaks', 0.1), ('swissPairings', 0.1),
+       ('reportMatch', 0.1)]
+
+HEARTBEAT_INTERVAL = 0.01  # seconds
+
+
+def makeCalls(tids, count, rnd):
+    """Returns a list of count calls (function name, args) of MIX. Reported
+    results are between random members of the tournament."""
+    members = dict((tid, [row[0] for row in tournament.playerStandings(tid)])
+                   for tid in tids)
+    names = [name for name, share in MIX]
+    weights = [share for name, share in MIX]
+    calls = []
+    for name in rnd.choices(names, weights, k=count):
+        tid = rnd.choice(tids)
+        if name == 'reportMatch':
+            winner, loser = rnd.sample(members[tid], 2)
+            calls.append((name, (winner, loser, False, tid)))
+        else:
+            calls.append((name, (tid,)))
+    return calls
+
+
+async def heartbeat(lags, stopped):
+    """Measures how late the loop wakes a sleeping coroutine until stopped
+    is set."""
+    loop = asyncio.get_running_loop()
+    while not stopped.is_set():
+        start = loop.time()
+        await asyncio.sleep(HEARTBEAT_INTERVAL)
+        lags.append(loop.time() - start - HEARTBEAT_INTERVAL)
+
+
+async def runMode(mode, calls, clients):
+    """Makes calls from clients coroutines at once in mode. Returns a dict
+    with statistics."""
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(clients) if mode == 'threads' else None
+
+    async def call(name, args):
+        if mode == 'async':
+            return await getattr(tournament_async, name)(*args)
+        function = getattr(tournament, name)
+        if mode == 'threads':
+            return await loop.run_in_executor(
+                executor, functools.partial(function, *args))
+        result = function(*args)
+        # let other clients run, as a blocking service does between requests
+        await asyncio.sleep(0)
+        return result
+
+    latencies = []
+
+    async def client(index):
+        for name, args in calls[index::clients]:
+            start = timer()
+            await call(name, args)
+            latencies.append(timer() - start)
+
+    # every client opens its connection before the measurement
+    await asyncio.gather(*[call('countPlayers', ()) for i in range(clients)])
+
+    lags = []
+    stopped = asyncio.Event()
+    beat = asyncio.ensure_future(heartbeat(lags, stopped))
+    start = timer()
+    await asyncio.gather(*[client(i) for i in range(clients)])
+    wall = timer() - start
+    stopped.set()
+    await beat
+    if executor is not None:
+        executor.shutdown()
+
+    times = sorted(t * 1000 for t in latencies)
+    lags = sorted(lag * 1000 for lag in lags) or [0.0]
+    return {'mode': mode, 'calls': len(times),
+            'callsPerSecond': len(times) / max(wall, 1e-9),
+            'p50Ms': percentile(times, 50), 'p99Ms': percentile(times, 99),
+            'maxMs': times[-1], 'lagP99Ms': percentile(lags, 99),
+            'lagMaxMs': lags[-1]}
+
+
+async def run(modes, calls, clients):
+    results = []
+    for mode in modes:
+        results.append(await runMode(mode, calls, clients))
+    # connections of the async pool belong to this loop
+    tournament_async.configurePool()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Concurrency benchmark of tournament_async.py")
+    parser.add_argument('--players', type=int, default=1024,
+                        help="players per tournament")
+    parser.add_argument('--rounds', type=int, default=5,
+                        help="rounds played before measuring")
+    parser.add_argument('--tournaments', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=32,
+                        help="clients making calls at the same time")
+    parser.add_argument('--calls', type=int, default=2000,
+                        help="measured calls of every mode")
+    parser.add_argument('--modes', default=','.join(MODES),
+                        help="comma separated modes to measure")
+    parser.add_argument('--dsn', default=tournament.DSN)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reset', action='store_true',
+                        help="allow deleting existing players and matches")
+    args = parser.parse_args(argv)
+
+    modes = args.modes.split(',')
+    for mode in modes:
+        if mode not in MODES:
+            parser.error("unknown mode " + mode)
+
+    tournament.DSN = args.dsn
+    tournament.configurePool(maxSize=max(tournament.POOL_MAX_SIZE,
+                                         args.clients))
+    tournament_async.configurePool(
+        maxSize=max(tournament_async.POOL_MAX_SIZE, args.clients))
+    if tournament.countPlayers() and not args.reset:
+        raise SystemExit("The database has players, use --reset to delete "
+                         "them and run the benchmark")
+
+    rnd = random.Random(args.seed)
+    tids = populate(args.players, args.rounds, args.tournaments, rnd)
+    calls = makeCalls(tids, args.calls, rnd)
+    results = asyncio.run(run(modes, calls, args.clients))
+
+    print("%-9s %7s %9s %9s %9s %9s %13s %13s" % (
+        'mode', 'clients', 'calls/s', 'p50 (ms)', 'p99 (ms)', 'max (ms)',
+        'lag p99 (ms)', 'lag max (ms)'))
+    for result in results:
+        print("%-9s %7d %9.0f %9.2f %9.2f %9.2f %13.2f %13.2f" % (
+            result['mode'], args.clients, result['callsPerSecond'],
+            result['p50Ms'], result['p99Ms'], result['maxMs'],
+            result['lagP99Ms'], result['lagMaxMs']))
+    tournament.deleteMatches()
+    tournament.deletePlayers()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+#
+# bench_daemon.py -- latency benchmark of tournament_daemon.py against the
+# direct database path of tournament.py
+#
+# Populates PostgreSQL with synthetic tournaments like bench_api.py, starts
+# the daemon in a process of its own, which loads them, and measures
+# playerStandings, playerStandingsWithBye, playerStandingsWithTiebreaks,
+# swissPairings and reportMatch called one at a time, directly (every call
+# goes to the database) and through DaemonBackend (reads are answered from
+# memory). Reads are measured twice: repeated, when the daemon answers from
+# its cache of encoded answers, and right after a result was reported in the
+# same tournament, when the answer is computed from memory again.
+#
+# ALL PLAYERS AND MATCHES OF THE DATABASE ARE DELETED. Run it against a
+# database created for benchmarks; --reset is required if the database is
+# not empty.
+#
+# Usage:
+#   python benchmarks/bench_daemon.py [--players N] [--rounds N]
+#                                     [--tournaments N] [--samples N]
+#                                     [--socket PATH] [--dsn DSN]
+#                                     [--seed N] [--reset]
+#
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+from timeit import default_timer as timer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import tournament  # noqa
+import tournament_daemon  # noqa
+from bench_api import percentile, populate  # noqa
+
+READS = ['playerStandings', 'playerStandingsWithBye',
+         'playerStandingsWithTiebreaks', 'swissPairings']
+
+START_TIMEOUT = 60  # seconds to wait for the daemon to load
+
+
+def startDaemon(path, dsn, tids):
+    """Starts the daemon, which loads tournaments tids. Returns (process,
+    client, seconds until it answered)."""
+    start = timer()
+    process = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, 'tournament_daemon.py'),
+        '--socket', path, '--dsn', dsn,
+        '--tids', ','.join(str(tid) for tid in tids)])
+    client = tournament_daemon.DaemonBackend(path)
+    while True:
+        try:
+            client.stats()
+            return process, client, timer() - start
+        except tournament_daemon.DaemonError:
+            if process.poll() is not None or timer() - start > START_TIMEOUT:
+                process.kill()
+                raise SystemExit("The daemon did not start")
+
+
+def measure(api, tids, samples, members, rnd):
+    """Measures the functions of api (the tournament module or a
+    DaemonBackend). Returns a dict {label: sorted latencies in ms}."""
+    def report(tid):
+        winner, loser = rnd.sample(members[tid], 2)
+        return api.reportMatch(winner, loser, False, tid)
+
+    times = {}
+    for name in READS:
+        function = getattr(api, name)
+        for label, write in ((name, False), (name + ' after write', True)):
+            latencies = []
+            for i in range(samples):
+                tid = tids[i % len(tids)]
+                if write:
+                    report(tid)
+                start = timer()
+                function(tid)
+                latencies.append((timer() - start) * 1000)
+            times[label] = sorted(latencies)
+    latencies = []
+    for i in range(samples):
+        start = timer()
+        report(tids[i % len(tids)])
+        latencies.append((timer() - start) * 1000)
+    times['reportMatch'] = sorted(latencies)
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Latency benchmark of tournament_daemon.py")
+    parser.add_argument('--players', type=int, default=1024,
+                        help="players per tournament")
+    parser.add_argument('--rounds', type=int, default=5,
+                        help="rounds played before measuring")
+    parser.add_argument('--tournaments', type=int, default=4)
+    parser.add_argument('--samples', type=int, default=200,
+                        help="measured calls of every function")
+    parser.add_argument('--socket', default='/tmp/bench_daemon.sock')
+    parser.add_argument('--dsn', default=tournament.DSN)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reset', action='store_true',
+                        help="allow deleting existing players and matches")
+    args = parser.parse_args(argv)
+
+    tournament.DSN = args.dsn
+    if tournament.countPlayers() and not args.reset:
+        raise SystemExit("The database has players, use --reset to delete "
+                         "them and run the benchmark")
+
+    rnd = random.Random(args.seed)
+    tids = populate(args.players, args.rounds, args.tournaments, rnd)
+    members = dict((tid, [row[0] for row in tournament.playerStandings(tid)])
+                   for tid in tids)
+
+    direct = measure(tournament, tids, args.samples, members, rnd)
+    process, client, seconds = startDaemon(args.socket, args.dsn, tids)
+    try:
+        print("daemon loaded %d tournaments in %.2f s" % (len(tids),
+                                                          seconds))
+        daemon = measure(client, tids, args.samples, members, rnd)
+        drift = [tid for tid in tids if tournament.verifyStandings(tid) or
+                 client.playerStandings(tid) !=
+                 tournament.playerStandings(tid)]
+    finally:
+        client.close()
+        process.terminate()
+        process.wait()
+
+    print("%-42s %12s %12s %12s %12s %8s" % (
+        'function', 'direct p50', 'direct p99', 'daemon p50', 'daemon p99',
+        'speedup'))
+    for label in sorted(direct, key=list(direct).index):
+        print("%-42s %9.3f ms %9.3f ms %9.3f ms %9.3f ms %7.1fx" % (
+            label, percentile(direct[label], 50),
+            percentile(direct[label], 99), percentile(daemon[label], 50),
+            percentile(daemon[label], 99),
+            percentile(direct[label], 50) / percentile(daemon[label], 50)))
+    tournament.deleteMatches()
+    tournament.deletePlayers()
+    if drift:
+        print("Standings of tournaments %s differ between the daemon and "
+              "the database" % drift)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
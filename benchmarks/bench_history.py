@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+#
+# bench_history.py -- benchmark of player records (playerCareer,
+# playerHistory, headToHead) against queries of Matches
+#
+# Populates PostgreSQL with a circuit of tournaments, which the same regular
+# players all join, so each of them plays thousands of matches, and with
+# other tournaments of one-time players, which make Matches large. Then the
+# records of regular players are read through the functions of
+# tournament.py, which use PlayerResults, and with the naive query, which
+# finds the matches of a player in Matches by player1 OR player2 (UNION of
+# both). Both must return the same records; the exit status is 1 if they do
+# not.
+#
+# ALL PLAYERS AND MATCHES OF THE DATABASE ARE DELETED. Run it against a
+# database created for benchmarks; --reset is required if the database is
+# not empty.
+#
+# Usage:
+#   python benchmarks/bench_history.py [--regulars N] [--circuit N]
+#                                      [--rounds N] [--others N]
+#                                      [--samples N] [--dsn DSN] [--seed N]
+#                                      [--reset]
+#
+
+from __future__ import division, print_function
+
+import argparse
+import os
+import random
+import sys
+from timeit import default_timer as timer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import tournament  # noqa
+from bench_load import percentile  # noqa
+
+NAIVE_HISTORY_SQL = '''SELECT tid, count(*),
+                            count(CASE WHEN points > opponentPoints
+                                       THEN 1 END),
+                            count(CASE WHEN points = opponentPoints
+                                       THEN 1 END),
+                            count(CASE WHEN points < opponentPoints
+                                       THEN 1 END),
+                            sum(points)
+                     FROM (SELECT tournament, p1points, p2points
+                           FROM Matches
+                           WHERE player1 = %(pid)s
+                           UNION ALL
+                           SELECT tournament, p2points, p1points
+                           FROM Matches
+                           WHERE player2 = %(pid)s)
+                          AS results (tid, points, opponentPoints)
+                     GROUP BY tid
+                     ORDER BY tid'''
+
+NAIVE_HEAD_TO_HEAD_SQL = '''SELECT count(*),
+                                 count(CASE WHEN points > opponentPoints
+                                            THEN 1 END),
+                                 count(CASE WHEN points = opponentPoints
+                                            THEN 1 END),
+                                 count(CASE WHEN points < opponentPoints
+                                            THEN 1 END),
+                                 coalesce(sum(points), 0),
+                                 coalesce(sum(opponentPoints), 0)
+                          FROM (SELECT p1points, p2points
+                                FROM Matches
+                                WHERE player1 = %(pid)s
+                                AND player2 = %(opponent)s
+                                UNION ALL
+                                SELECT p2points, p1points
+                                FROM Matches
+                                WHERE player1 = %(opponent)s
+                                AND player2 = %(pid)s)
+                               AS results (points, opponentPoints)'''
+
+
+def playRandomRounds(tid, pids, rounds, rnd):
+    """Reports rounds of random pairs of pids (draws too) in tournament
+    tid."""
+    for r in range(rounds):
+        order = list(pids)
+        rnd.shuffle(order)
+        tournament.reportMatches(
+            [(order[i], order[i + 1], rnd.random() < 0.1)
+             for i in range(0, len(order) - 1, 2)], tid)
+
+
+def populate(regulars, circuit, rounds, others, rnd):
+    """Plays a circuit of tournaments of the regular players and other
+    tournaments of one-time players. Returns the ids of the regulars."""
+    tournament.deleteMatches()
+    tournament.deletePlayers()
+    pids = tournament.registerPlayers(
+        ['Regular %d' % i for i in range(regulars)], 1)
+    for tid in range(1, circuit + 1):
+        if tid > 1:
+            for pid in pids:
+                tournament.registerPlayerForTournament(pid, tid)
+        playRandomRounds(tid, pids, rounds, rnd)
+    for tid in range(circuit + 1, circuit + others + 1):
+        playRandomRounds(tid, tournament.registerPlayers(
+            ['Player %d-%d' % (tid, i) for i in range(256)], tid), rounds,
+            rnd)
+    return pids
+
+
+def measure(name, calls):
+    """Runs calls (functions without arguments) and prints latency
+    percentiles. Returns their results."""
+    times = []
+    results = []
+    for call in calls:
+        start = timer()
+        results.append(call())
+        times.append((timer() - start) * 1000)
+    times.sort()
+    print("%-22s %6d calls  p50 %9.3f ms  p99 %9.3f ms  max %9.3f ms" % (
+        name, len(times), percentile(times, 50), percentile(times, 99),
+        times[-1]))
+    return results
+
+
+def naive(sql, params):
+    with tournament.getConnection() as conn:
+        c = conn.cursor()
+        c.execute(sql, params)
+        return c.fetchall()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark of player records against queries of "
+                    "Matches")
+    parser.add_argument('--regulars', type=int, default=64,
+                        help="players who join every tournament of the "
+                             "circuit")
+    parser.add_argument('--circuit', type=int, default=100,
+                        help="tournaments of the regular players")
+    parser.add_argument('--rounds', type=int, default=30,
+                        help="rounds of every tournament")
+    parser.add_argument('--others', type=int, default=100,
+                        help="tournaments of 256 one-time players each")
+    parser.add_argument('--samples', type=int, default=100,
+                        help="measured calls of every query")
+    parser.add_argument('--dsn', default=tournament.DSN)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reset', action='store_true',
+                        help="allow deleting existing players and matches")
+    args = parser.parse_args(argv)
+
+    tournament.DSN = args.dsn
+    if tournament.countPlayers() and not args.reset:
+        raise SystemExit("The database has players, use --reset to delete "
+                         "them and run the benchmark")
+
+    rnd = random.Random(args.seed)
+    start = timer()
+    pids = populate(args.regulars, args.circuit, args.rounds, args.others,
+                    rnd)
+    with tournament.getConnection() as conn:
+        c = conn.cursor()
+        c.execute("ANALYZE Matches")
+        c.execute("ANALYZE PlayerResults")
+        c.execute("SELECT count(*) FROM Matches")
+        matches = c.fetchone()[0]
+    print("%d matches, %d per regular player, populated in %.1f s" % (
+        matches, args.circuit * args.rounds, timer() - start))
+
+    players = [rnd.choice(pids) for i in range(args.samples)]
+    pairs = [tuple(rnd.sample(pids, 2)) for i in range(args.samples)]
+    career = measure('playerCareer', [
+        lambda pid=pid: tournament.playerCareer(pid) for pid in players])
+    history = measure('playerHistory', [
+        lambda pid=pid: tournament.playerHistory(pid) for pid in players])
+    naiveHistory = measure('naive history', [
+        lambda pid=pid: naive(NAIVE_HISTORY_SQL, {'pid': pid})
+        for pid in players])
+    headToHead = measure('headToHead', [
+        lambda pair=pair: tournament.headToHead(*pair) for pair in pairs])
+    naiveHeadToHead = measure('naive head-to-head', [
+        lambda pair=pair: naive(NAIVE_HEAD_TO_HEAD_SQL,
+                                {'pid': pair[0], 'opponent': pair[1]})[0]
+        for pair in pairs])
+
+    differences = 0
+    if history != naiveHistory:
+        differences += 1
+        print("DIFFERENCE playerHistory does not match Matches")
+    if career != [tournament._careerRecord(rows) for rows in naiveHistory]:
+        differences += 1
+        print("DIFFERENCE playerCareer does not match Matches")
+    if headToHead != naiveHeadToHead:
+        differences += 1
+        print("DIFFERENCE headToHead does not match Matches")
+    tournament.deleteMatches()
+    tournament.deletePlayers()
+    return 1 if differences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+#
+# bench_load.py -- concurrent-writer load test of tournament.py
+#
+# Hammers PostgreSQL from many worker processes through the public functions
+# of tournament.py, as scorekeeper terminals do during a round: first all
+# players are registered one by one (every name twice, by different
+# workers), then every round is started and each of its results is reported
+# by the scorekeepers of both players at about the same moment, so one of
+# the reports is a duplicate, which the database has to reject.
+#
+# Reports throughput and latency of registerPlayer and reportMatch and
+# checks invariants afterwards: every registration got its own player with
+# its name, member and standings counts of every tournament, one result per
+# pairing, no duplicate results in any round and standings totals equal to
+# the results (also by verifyStandings). The exit status is 1 if any
+# invariant is violated.
+#
+# ALL PLAYERS AND MATCHES OF THE DATABASE ARE DELETED. Run it against a
+# database created for benchmarks; --reset is required if the database is
+# not empty.
+#
+# Usage:
+#   python benchmarks/bench_load.py [--workers N] [--tournaments N]
+#                                   [--players N] [--rounds N]
+#                                   [--duplicates R] [--dsn DSN]
+#                                   [--seed N] [--reset]
+#
+
+from __future__ import division, print_function
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+from timeit import default_timer as timer
+
+import psycopg2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import tournament  # noqa
+
+
+def _initWorker(dsn):
+    tournament.DSN = dsn
+
+
+def _register(calls):
+    """Worker: registers players (tid, name) one by one. Returns a list of
+    (tid, name, pid, seconds)."""
+    registered = []
+    for tid, name in calls:
+        start = timer()
+        pid = tournament.registerPlayer(name, tid)
+        registered.append((tid, name, pid, timer() - start))
+    return registered
+
+
+def _report(calls):
+    """Worker: reports results (tid, winner, loser) one by one. Returns a
+    tuple (mids, rejected, seconds) of accepted results, the number of
+    results rejected as duplicates and latencies of all calls."""
+    mids = []
+    rejected = 0
+    seconds = []
+    for tid, winner, loser in calls:
+        start = timer()
+        try:
+            mids.append(tournament.reportMatch(winner, loser, tid=tid))
+        except psycopg2.IntegrityError:
+            rejected += 1
+        seconds.append(timer() - start)
+    return mids, rejected, seconds
+
+
+def percentile(values, p):
+    """Returns the p-th percentile (nearest rank) of sorted values."""
+    if not values:
+        return None
+    rank = max(1, int(round(p / 100.0 * len(values) + 0.4999)))
+    return values[min(rank, len(values)) - 1]
+
+
+def _split(calls, workers):
+    return [calls[i::workers] for i in range(workers)]
+
+
+def _printStats(name, seconds, wall, extra=''):
+    times = sorted(t * 1000 for t in seconds)
+    print("%-14s %8d calls %9.0f calls/s  p50 %7.2f ms  p99 %7.2f ms  "
+          "max %8.2f ms%s" % (name, len(times), len(times) / max(wall, 1e-9),
+                              percentile(times, 50), percentile(times, 99),
+                              times[-1], extra))
+
+
+def registerAll(pool, workers, tids, players):
+    """Registers players of every tournament from all workers at once.
+    Returns a list of (tid, name, pid) and a list of violations."""
+    calls = [(tid, 'Player %d-%d' % (tid, i // 2))
+             for i in range(players) for tid in tids]
+    start = timer()
+    registered = sum(pool.map(_register, _split(calls, workers)), [])
+    _printStats('registerPlayer', [row[3] for row in registered],
+                timer() - start)
+
+    violations = []
+    pids = [row[2] for row in registered]
+    if len(set(pids)) != len(calls):
+        violations.append("%d registrations got %d distinct ids" % (
+            len(calls), len(set(pids))))
+    with tournament.getConnection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT pid, name FROM Players WHERE pid = ANY (%s)",
+                  (pids,))
+        names = dict(c.fetchall())
+        wrong = [row for row in registered if names.get(row[2]) != row[1]]
+        if wrong:
+            violations.append("%d registrations returned the id of another "
+                              "player, e.g. %r" % (len(wrong), wrong[0][:3]))
+        for table, column in (('TournamentMembers', 'tid'),
+                              ('Standings', 'tid')):
+            c.execute('''SELECT {column}, count(*)
+                        FROM {table}
+                        WHERE {column} = ANY (%s)
+                        GROUP BY 1'''.format(table=table, column=column),
+                      (tids,))
+            counts = dict(c.fetchall())
+            for tid in tids:
+                if counts.get(tid, 0) != players:
+                    violations.append("Tournament %d has %d rows in %s "
+                                      "instead of %d" % (
+                                          tid, counts.get(tid, 0), table,
+                                          players))
+    return [row[:3] for row in registered], violations
+
+
+def playRound(pool, workers, tids, duplicates, rnd):
+    """Starts the next round of every tournament and reports its results
+    from all workers at once, duplicates of them from the scorekeepers of
+    the other players. Returns a list of violations."""
+    calls = []
+    pairings = 0
+    for tid in tids:
+        number, pairs, bye = tournament.startRound(tid)
+        pairings += len(pairs)
+        for id1, name1, id2, name2 in pairs:
+            calls.append((tid, id1, id2) if rnd.random() < 0.5
+                         else (tid, id2, id1))
+            if rnd.random() < duplicates:
+                # the other scorekeeper may see the result the other way
+                calls.append((tid, id1, id2) if rnd.random() < 0.5
+                             else (tid, id2, id1))
+    rnd.shuffle(calls)
+
+    start = timer()
+    outcomes = pool.map(_report, _split(calls, workers))
+    wall = timer() - start
+    mids = sum((outcome[0] for outcome in outcomes), [])
+    rejected = sum(outcome[1] for outcome in outcomes)
+    _printStats('reportMatch', sum((outcome[2] for outcome in outcomes), []),
+                wall, '  %d rejected' % rejected)
+
+    violations = []
+    if len(mids) != pairings or len(set(mids)) != pairings:
+        violations.append("%d pairings got %d results" % (pairings,
+                                                          len(mids)))
+    if rejected != len(calls) - pairings:
+        violations.append("%d duplicates were rejected instead of %d" % (
+            rejected, len(calls) - pairings))
+    return violations
+
+
+def checkResults(tids):
+    """Checks results and standings of tournaments tids. Returns a list of
+    violations."""
+    violations = []
+    with tournament.getConnection() as conn:
+        c = conn.cursor()
+        c.execute('''SELECT tournament, round, least(player1, player2),
+                           greatest(player1, player2)
+                    FROM Matches
+                    WHERE tournament = ANY (%s)
+                    AND round > 0
+                    GROUP BY 1, 2, 3, 4
+                    HAVING count(*) > 1''', (tids,))
+        for row in c.fetchall():
+            violations.append("Players %d and %d have more than one result "
+                              "in round %d of tournament %d" % (
+                                  row[2], row[3], row[1], row[0]))
+        c.execute('''SELECT tid, round, board
+                    FROM Pairings
+                    WHERE tid = ANY (%s)
+                    AND player2 IS NOT NULL
+                    AND mid IS NULL''', (tids,))
+        for row in c.fetchall():
+            violations.append("Pairing %d of round %d of tournament %d has "
+                              "no result" % (row[2], row[1], row[0]))
+        c.execute('''SELECT results.tid, results.matches, results.points,
+                           standings.matches, standings.points
+                    FROM (SELECT tournament AS tid, 2 * count(*) AS matches,
+                                 sum(p1points + p2points) AS points
+                          FROM Matches
+                          WHERE tournament = ANY (%(tids)s)
+                          GROUP BY 1) AS results
+                    JOIN (SELECT tid, sum(matches) AS matches,
+                                 sum(points) AS points
+                          FROM Standings
+                          WHERE tid = ANY (%(tids)s)
+                          GROUP BY 1) AS standings
+                    ON standings.tid = results.tid''', {'tids': tids})
+        for tid, matches, points, standingMatches, standingPoints in (
+                c.fetchall()):
+            if (matches, points) != (standingMatches, standingPoints):
+                violations.append(
+                    "Standings of tournament %d count %d matches and %d "
+                    "points, results %d and %d" % (
+                        tid, standingMatches, standingPoints, matches,
+                        points))
+    for tid in tids:
+        if tournament.verifyStandings(tid):
+            violations.append("Standings of tournament %d drifted from "
+                              "Matches" % tid)
+    return violations
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Concurrent-writer load test of tournament.py")
+    parser.add_argument('--workers', type=int, default=8,
+                        help="worker processes making the calls")
+    parser.add_argument('--tournaments', type=int, default=4)
+    parser.add_argument('--players', type=int, default=256,
+                        help="players per tournament")
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--duplicates', type=float, default=1.0,
+                        help="share of results reported twice")
+    parser.add_argument('--dsn', default=tournament.DSN)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reset', action='store_true',
+                        help="allow deleting existing players and matches")
+    args = parser.parse_args(argv)
+
+    # workers are started before this process connects, so they do not
+    # inherit its connections
+    pool = multiprocessing.Pool(args.workers, _initWorker, (args.dsn,))
+    tournament.DSN = args.dsn
+    try:
+        if tournament.countPlayers() and not args.reset:
+            raise SystemExit("The database has players, use --reset to "
+                             "delete them and run the load test")
+        tournament.deleteMatches()
+        tournament.deletePlayers()
+
+        rnd = random.Random(args.seed)
+        tids = list(range(1, args.tournaments + 1))
+        registered, violations = registerAll(pool, args.workers, tids,
+                                             args.players)
+        for r in range(args.rounds):
+            violations += playRound(pool, args.workers, tids,
+                                    args.duplicates, rnd)
+        violations += checkResults(tids)
+    finally:
+        pool.close()
+        pool.join()
+
+    for violation in violations:
+        print("VIOLATION " + violation)
+    if violations:
+        return 1
+    print("All invariants hold")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+#
+# bench_pairing.py -- scaling benchmark of the Swiss pairing engine
+#
+# Simulates tournaments of growing size in memory (no database needed) and
+# measures how long the pairing engine takes to pair one round, and the
+# quality of the pairing (rematches, total score gap within pairs). For
+# smaller sizes the greedy pairing algorithm as it was implemented before
+# tournament_pairing.py (list membership checks and list.pop) is run on the
+# same standings too, to check that the output of swissPairs is identical
+# and to compare the time.
+#
+# Usage:
+#   python benchmarks/bench_pairing.py [--sizes 100,1000,...] [--rounds N]
+#                                      [--mode greedy|optimal]
+#                                      [--legacy-max N] [--seed N]
+#
+
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from tournament_pairing import (PAIRING_GREEDY, PAIRING_OPTIMAL,  # noqa
+                                opponentSets, pairRound, pairingQuality)
+
+
+def legacySwissPairs(standing, pairs):
+    """Pairing loop of swissPairings before the pairing engine was added.
+
+    Args:
+      standing: list of (id, name, points, matches), it is consumed
+      pairs: list of (id1, id2) of previously played matches
+    """
+    def findPair(standing, pairs, index):
+        numOfPlayers = len(standing)
+        if numOfPlayers < 2:
+            return -1
+
+        for i in range(1, len(standing)):
+            curr = standing[index][0]
+            if index + i < numOfPlayers:
+                next = standing[index+i][0]
+                if (curr, next) not in pairs and (next, curr) not in pairs:
+                    return index + i
+            if index - i >= 0:
+                prev = standing[index-i][0]
+                if (curr, prev) not in pairs and (prev, curr) not in pairs:
+                    return index - i
+
+        if index + 1 == numOfPlayers:
+            return index - 1
+        else:
+            return index + 1
+
+    def checkLowNumOfMatches(standing, max):
+        for i in range(len(standing)):
+            if standing[i][3] < max:
+                return i
+        return -1
+
+    final_pairs = []
+    maxMatches = 0
+    for i in standing:
+        if i[3] > maxMatches:
+            maxMatches = i[3]
+
+    while len(standing) > 1:
+        low = checkLowNumOfMatches(standing, maxMatches)
+        if low == -1:
+            low = 0
+        pair = findPair(standing, pairs, low)
+        final_pairs.append((standing[low][0], standing[low][1],
+                            standing[pair][0], standing[pair][1]))
+        standing.pop(max(low, pair))
+        standing.pop(min(low, pair))
+
+    return final_pairs
+
+
+def simulate(players, rounds, rnd, mode=PAIRING_GREEDY):
+    """Plays rounds of a random tournament, yields (standing, matches)
+    before every round."""
+    points = dict((pid, 0) for pid in range(1, players + 1))
+    matches = dict((pid, 0) for pid in points)
+    played = []
+    for r in range(rounds):
+        standing = sorted(((pid, 'Player %d' % pid, points[pid], matches[pid])
+                           for pid in points),
+                          key=lambda row: (-row[2], -row[3], row[0]))
+        yield standing, played
+        for id1, name1, id2, name2 in pairRound(standing,
+                                                opponentSets(played), mode):
+            winner, loser = (id1, id2) if rnd.random() < 0.5 else (id2, id1)
+            points[winner] += 1
+            matches[winner] += 1
+            matches[loser] += 1
+            played.append((winner, loser))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', default='100,1000,5000,10000,50000',
+                        help="comma separated numbers of players")
+    parser.add_argument('--rounds', type=int, default=8,
+                        help="rounds played before the measured round")
+    parser.add_argument('--mode', default=PAIRING_GREEDY,
+                        choices=[PAIRING_GREEDY, PAIRING_OPTIMAL])
+    parser.add_argument('--legacy-max', type=int, default=2000,
+                        help="largest size to run the legacy algorithm for")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    print("%8s %6s %12s %12s %10s %10s %12s %8s" % (
+        'players', 'round', 'index (ms)', 'pairing (ms)', 'rematches',
+        'score gap', 'legacy (ms)', 'speedup'))
+    for players in [int(size) for size in args.sizes.split(',')]:
+        rnd = random.Random(args.seed)
+        for standing, played in simulate(players, args.rounds + 1, rnd,
+                                         args.mode):
+            pass  # only the last (most expensive) round is measured
+
+        start = time.time()
+        opponents = opponentSets(played)
+        indexed = time.time()
+        pairs = pairRound(standing, opponents, args.mode)
+        paired = time.time()
+        indexTime = (indexed - start) * 1000
+        pairTime = (paired - indexed) * 1000
+
+        legacy = '-'
+        speedup = '-'
+        quality = pairingQuality(pairs, standing, opponents)
+        if args.mode == PAIRING_GREEDY and players <= args.legacy_max:
+            start = time.time()
+            legacyPairs = legacySwissPairs(list(standing), played)
+            legacyTime = (time.time() - start) * 1000
+            if legacyPairs != pairs:
+                raise SystemExit("Pairings differ from the legacy algorithm "
+                                 "for %d players" % players)
+            legacy = '%.1f' % legacyTime
+            speedup = '%.0fx' % (legacyTime / max(indexTime + pairTime,
+                                                  1e-3))
+        print("%8d %6d %12.1f %12.1f %10d %10d %12s %8s" % (
+            players, args.rounds + 1, indexTime, pairTime,
+            quality['rematches'], quality['totalScoreGap'], legacy, speedup))
+
+
+if __name__ == '__main__':
+    main()
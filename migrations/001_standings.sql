@@ -0,0 +1,23 @@
+-- Points and number of matches of every player in every tournament, kept up
+-- to date by every function which changes results (see tournament.py)
+
+CREATE TABLE IF NOT EXISTS Standings (
+	tid			integer,
+	pid			integer REFERENCES Players (pid),
+	points		integer NOT NULL DEFAULT 0,
+	matches		integer NOT NULL DEFAULT 0,
+	PRIMARY KEY (tid, pid)
+);
+
+-- Databases created before Standings existed already have results
+DELETE FROM Standings;
+INSERT INTO Standings (tid, pid, points, matches)
+	SELECT tid, pid, sum(points), sum(matches)
+	FROM (
+		SELECT tid, pid, 0 AS points, 0 AS matches FROM TournamentMembers
+		UNION ALL
+		SELECT tournament, player1, p1points, 1 FROM Matches
+		UNION ALL
+		SELECT tournament, player2, p2points, 1 FROM Matches
+	) AS results
+	GROUP BY tid, pid;
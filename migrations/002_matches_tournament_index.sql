@@ -0,0 +1,5 @@
+-- Match history of one tournament (swissPairings) is read from the index
+-- only, without visiting matches of all other tournaments
+
+CREATE INDEX matches_tournament_players_idx
+	ON Matches (tournament, player1, player2);
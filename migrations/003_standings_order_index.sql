@@ -0,0 +1,5 @@
+-- Standings of one tournament (playerStandings, playerStandingsWithBye) are
+-- read in their final order, without scanning or sorting other tournaments
+
+CREATE INDEX standings_tid_order_idx
+	ON Standings (tid, points DESC, matches DESC, pid);
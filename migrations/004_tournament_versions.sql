@@ -0,0 +1,16 @@
+-- Version of every tournament, incremented in the same transaction as every
+-- write to the tournament. Processes which cache standings and pairings
+-- (tournament.configureCache(mode=CACHE_SHARED)) compare it with the version
+-- of their cached results
+
+CREATE TABLE IF NOT EXISTS TournamentVersions (
+	tid			integer PRIMARY KEY,
+	version		bigint NOT NULL DEFAULT 0
+);
+
+INSERT INTO TournamentVersions (tid)
+	SELECT tid FROM Standings
+	UNION
+	SELECT tournament FROM Matches WHERE tournament IS NOT NULL
+	EXCEPT
+	SELECT tid FROM TournamentVersions;
@@ -0,0 +1,10 @@
+-- Standings of one tournament are read in their final order (points and
+-- matches descending, then pid) by playerStandings and page by page by
+-- standingsPage, which continues after the last row of the previous page by
+-- comparing (-points, -matches, pid) as one row value. An index on the negated
+-- columns serves both, so it replaces standings_tid_order_idx
+
+CREATE INDEX standings_tid_rank_idx
+	ON Standings (tid, (-points), (-matches), pid);
+
+DROP INDEX IF EXISTS standings_tid_order_idx;
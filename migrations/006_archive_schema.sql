@@ -0,0 +1,5 @@
+-- Archived tournaments (tournament.archiveTournament) are kept as tables
+-- archive.matches_t<tid>, archive.tournamentmembers_t<tid> and
+-- archive.standings_t<tid>, out of the tables used by live tournaments
+
+CREATE SCHEMA IF NOT EXISTS archive;
@@ -0,0 +1,10 @@
+-- Elo rating and number of rated matches of every player who has played,
+-- updated by every reported match (see tournament_ratings.py). Players
+-- without a row have the initial rating. Existing results are rated by
+-- "python tournament_admin.py recompute-ratings"
+
+CREATE TABLE IF NOT EXISTS Ratings (
+	pid			integer PRIMARY KEY REFERENCES Players (pid),
+	rating		double precision NOT NULL DEFAULT 1500,
+	games		integer NOT NULL DEFAULT 0
+);
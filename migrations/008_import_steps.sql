@@ -0,0 +1,20 @@
+-- Bulk imports (see tournament_transfer.py) run in steps, every step is one
+-- transaction, which records itself here, so a failed import continues with
+-- the failed step. ImportedPlayers maps player ids of the exported history
+-- to the ids given to them by the import
+
+CREATE TABLE IF NOT EXISTS ImportSteps (
+	job			text,
+	step		text,
+	rows		bigint NOT NULL,
+	seconds		double precision NOT NULL,
+	finished	timestamp NOT NULL DEFAULT now(),
+	PRIMARY KEY (job, step)
+);
+
+CREATE TABLE IF NOT EXISTS ImportedPlayers (
+	job			text,
+	oldPid		integer,
+	pid			integer NOT NULL,
+	PRIMARY KEY (job, oldPid)
+);
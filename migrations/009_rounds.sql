@@ -0,0 +1,31 @@
+-- Rounds started by tournament.startRound with their pairings. A pairing
+-- without player2 is a bye of player1, a pairing without mid waits for its
+-- result, which reportMatch fills in. Standings.byes counts the stored byes
+-- of every player, so bye points are not derived from numbers of matches
+
+CREATE TABLE IF NOT EXISTS Rounds (
+	tid			integer,
+	round		integer,
+	started		timestamp NOT NULL DEFAULT now(),
+	PRIMARY KEY (tid, round)
+);
+
+CREATE TABLE IF NOT EXISTS Pairings (
+	tid			integer,
+	round		integer,
+	board		integer,  -- position of the pairing in the round, from 1
+	player1		integer NOT NULL REFERENCES Players (pid),
+	player2		integer REFERENCES Players (pid),
+	mid			integer,  -- id of the reported match
+	PRIMARY KEY (tid, round, board),
+	FOREIGN KEY (tid, round) REFERENCES Rounds (tid, round)
+);
+
+-- pairings waiting for their result, found by the players of a reported
+-- match in either order
+CREATE INDEX pairings_open_idx
+	ON Pairings (tid, round, least(player1, player2),
+				 greatest(player1, player2))
+	WHERE mid IS NULL AND player2 IS NOT NULL;
+
+ALTER TABLE Standings ADD COLUMN byes integer NOT NULL DEFAULT 0;
@@ -0,0 +1,22 @@
+-- Results are tagged with the round started by tournament.startRound they
+-- were reported in (0 before the first one). Every few rounds startRound
+-- checkpoints the cumulative standings of the finished round in
+-- StandingsSnapshots, so standings after any round are read from the
+-- nearest checkpoint and the results of the rounds after it
+
+ALTER TABLE Matches ADD COLUMN round integer NOT NULL DEFAULT 0;
+
+CREATE INDEX matches_tournament_round_idx
+	ON Matches (tournament, round);
+
+ALTER TABLE Rounds ADD COLUMN snapshot boolean NOT NULL DEFAULT false;
+
+CREATE TABLE IF NOT EXISTS StandingsSnapshots (
+	tid			integer,
+	round		integer,
+	pid			integer REFERENCES Players (pid),
+	points		integer NOT NULL DEFAULT 0,
+	matches		integer NOT NULL DEFAULT 0,
+	PRIMARY KEY (tid, round, pid),
+	FOREIGN KEY (tid, round) REFERENCES Rounds (tid, round)
+);
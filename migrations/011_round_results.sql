@@ -0,0 +1,9 @@
+-- Every pair of players has at most one result in a round started by
+-- tournament.startRound, so a result reported twice (e.g. by the
+-- scorekeepers of both players, also at the same moment) is rejected.
+-- Results reported before the first round are not limited
+
+CREATE UNIQUE INDEX matches_round_result_idx
+	ON Matches (tournament, round, least(player1, player2),
+				greatest(player1, player2))
+	WHERE round > 0;
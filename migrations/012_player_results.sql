@@ -0,0 +1,28 @@
+-- Results of every player, one row per player of every match in Matches,
+-- kept up to date by every function which changes results (see
+-- tournament.py). Career records, per-tournament records and head-to-head
+-- records of a player are read from the rows of the player, instead of
+-- scanning Matches for player1 or player2. Rows are removed with their
+-- matches, so there are no foreign keys
+
+CREATE TABLE IF NOT EXISTS PlayerResults (
+	pid				integer NOT NULL,
+	opponent		integer NOT NULL,
+	mid				integer NOT NULL,
+	tid				integer NOT NULL,
+	points			integer NOT NULL,
+	opponentPoints	integer NOT NULL,
+	PRIMARY KEY (pid, opponent, mid)
+);
+
+-- deleteTournament and archiveTournament remove the rows of a tournament
+CREATE INDEX player_results_tid_idx ON PlayerResults (tid);
+
+-- Databases created before PlayerResults existed already have results
+DELETE FROM PlayerResults;
+INSERT INTO PlayerResults (pid, opponent, mid, tid, points, opponentPoints)
+	SELECT player1, player2, mid, tournament, p1points, p2points
+	FROM Matches
+	UNION ALL
+	SELECT player2, player1, mid, tournament, p2points, p1points
+	FROM Matches;
@@ -3,55 +3,1754 @@
 # tournament.py -- implementation of a Swiss-system tournament
 #
 
+import atexit
+import functools
+import multiprocessing
+import re
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from timeit import default_timer as timer
+
 import psycopg2
+from psycopg2.extensions import quote_ident
+from psycopg2.extras import execute_values
+
+from tournament_buffer import ReportBuffer, ReportTicket
+from tournament_cache import TournamentCache
+from tournament_metrics import (KIND_CHECKOUT, KIND_CONNECT, KIND_FUNCTION,
+                                KIND_PAIRING, HistogramSink, MeasuredCursor,
+                                Metrics)
+from tournament_pairing import (PAIRING_GREEDY, PAIRING_OPTIMAL,
+                                opponentSets, pairRound, seededStanding)
+from tournament_pairing import pairingQuality as measurePairing
+from tournament_pool import ConnectionPool
+from tournament_ratings import INITIAL_RATING, replayRatings, updateRatings
 
 POINTS_FOR_WIN = 1   # Such default configuration is done to be compatible
 POINTS_FOR_DRAW = 0  # with default tests. It is more interesting to have 3
 POINTS_FOR_BYE = 1   # points for win and 1 point for draw
 
+DSN = "dbname=tournament"
+
+PAIRING_TIME_BUDGET = 2.0  # seconds for PAIRING_OPTIMAL, see swissPairings
+PAIRING_PROCESSES = None   # workers of swissPairingsBatch, None: one per CPU
+
+BATCH_PAGE_SIZE = 1000  # rows per multi-row INSERT statement in bulk writes
+STREAM_BATCH_SIZE = 1000  # rows fetched at a time by iterStandings
+STANDINGS_PAGE_SIZE = 50  # default page size of standingsPage
+SNAPSHOT_INTERVAL = 4  # rounds between checkpoints of standings, startRound
+
+# Hot read queries, kept here to be shared by all functions which need them.
+# Standings are ordered by negated points and matches, which is the order of
+# index standings_tid_rank_idx
+STANDINGS_SQL = '''SELECT Standings.pid, Players.name,
+                        Standings.points, Standings.matches
+                 FROM Standings, Players
+                 WHERE Standings.tid = (%s)
+                 AND Standings.pid = Players.pid
+                 ORDER BY -Standings.points, -Standings.matches,
+                          Standings.pid'''
+
+# Standings after a round: the nearest checkpoint at or before the round
+# (members with zero results, if there is none) and the results of the
+# rounds after the checkpoint up to the round
+ROUND_STANDINGS_SQL = '''WITH checkpoint AS (
+                            SELECT coalesce(max(round), -1) AS round
+                            FROM Rounds
+                            WHERE tid = %(tid)s
+                            AND round <= %(round)s
+                            AND snapshot
+                        ),
+                        results AS (
+                            SELECT pid, points, matches
+                            FROM StandingsSnapshots
+                            WHERE tid = %(tid)s
+                            AND round = (SELECT round FROM checkpoint)
+
+                            UNION ALL
+
+                            SELECT pid, 0, 0
+                            FROM TournamentMembers
+                            WHERE tid = %(tid)s
+                            AND (SELECT round FROM checkpoint) < 0
+
+                            UNION ALL
+
+                            SELECT player1, p1points, 1
+                            FROM Matches
+                            WHERE tournament = %(tid)s
+                            AND round > (SELECT round FROM checkpoint)
+                            AND round <= %(round)s
+
+                            UNION ALL
+
+                            SELECT player2, p2points, 1
+                            FROM Matches
+                            WHERE tournament = %(tid)s
+                            AND round > (SELECT round FROM checkpoint)
+                            AND round <= %(round)s
+                        ),
+                        totals AS (
+                            SELECT pid, sum(points) AS points,
+                                   sum(matches) AS matches
+                            FROM results
+                            GROUP BY pid
+                        )
+                        SELECT totals.pid, Players.name,
+                               totals.points, totals.matches
+                        FROM totals
+                        JOIN Players ON Players.pid = totals.pid
+                        ORDER BY 3 DESC, 4 DESC, 1'''
+
+# One page of standings: the first one, or the one after the row with the
+# given (negated) points and matches and pid
+_STANDINGS_PAGE_SQL = '''SELECT Standings.pid, Players.name,
+                              Standings.points, Standings.matches
+                       FROM Standings, Players
+                       WHERE Standings.tid = %(tid)s
+                       AND Standings.pid = Players.pid {after}
+                       ORDER BY -Standings.points, -Standings.matches,
+                                Standings.pid
+                       LIMIT %(limit)s OFFSET %(offset)s'''
+
+STANDINGS_FIRST_PAGE_SQL = _STANDINGS_PAGE_SQL.format(after='')
+
+STANDINGS_NEXT_PAGE_SQL = _STANDINGS_PAGE_SQL.format(
+    after='''AND (-Standings.points, -Standings.matches, Standings.pid)
+                           > (%(points)s, %(matches)s, %(pid)s)''')
+
+# Byes of tournaments with stored rounds (see startRound) are counted in
+# Standings, other tournaments count every match a player played less than
+# the maximum as a bye
+_BYES_SQL = '''CASE WHEN EXISTS (SELECT 1 FROM Rounds WHERE tid = %(tid)s)
+                   THEN Standings.byes
+                   ELSE max(Standings.matches) OVER () - Standings.matches
+              END'''
+
+STANDINGS_WITH_BYE_SQL = '''SELECT Standings.pid, Players.name,
+                                 Standings.points
+                                 + ''' + _BYES_SQL + ''' * %(bye)s,
+                                 Standings.matches
+                          FROM Standings, Players
+                          WHERE Standings.tid = %(tid)s
+                          AND Standings.pid = Players.pid
+                          ORDER BY -Standings.points,
+                                   -Standings.matches,
+                                   Standings.pid'''
+
+# Opponents' match-win percentages below this are raised to it, so players
+# are not punished too much for beating very weak opponents
+MIN_MATCH_WIN_PERCENT = 1.0 / 3
+
+# Standings with bye points (as STANDINGS_WITH_BYE_SQL) and tiebreaks, all
+# computed in one pass over the matches of the tournament
+TIEBREAK_STANDINGS_SQL = ('''WITH scores AS (
+                                SELECT pid, matches,
+                                       points + ''' + _BYES_SQL + '''
+                                           * %(bye)s AS points,
+                                       max(matches) OVER () AS rounds
+                                FROM Standings
+                                WHERE tid = %(tid)s
+                            ),
+                            games AS (
+                                SELECT player1 AS pid, p1points AS points,
+                                       player2 AS opponent
+                                FROM Matches
+                                WHERE tournament = %(tid)s
+
+                                UNION ALL
+
+                                SELECT player2, p2points, player1
+                                FROM Matches
+                                WHERE tournament = %(tid)s
+                            ),
+                            tiebreaks AS (
+                                SELECT games.pid,
+                                       sum(opp.points) AS buchholz,
+                                       sum(opp.points * games.points)::float
+                                           / %(win)s AS sonnebornBerger,
+                                       avg(greatest(
+                                           %(minWin)s,
+                                           opp.points::float
+                                           / (%(win)s * opp.rounds)))
+                                           AS omw
+                                FROM games, scores AS opp
+                                WHERE opp.pid = games.opponent
+                                GROUP BY games.pid
+                            )
+                            SELECT scores.pid, Players.name,
+                                   scores.points, scores.matches,
+                                   coalesce(buchholz, 0),
+                                   coalesce(sonnebornBerger, 0),
+                                   coalesce(omw, 0)
+                            FROM scores
+                            JOIN Players ON Players.pid = scores.pid
+                            LEFT JOIN tiebreaks
+                                ON tiebreaks.pid = scores.pid
+                            ORDER BY 3 DESC, 5 DESC, 6 DESC, 7 DESC,
+                                     scores.pid''')
+
+# Members of a tournament (everybody in its standings) by rating, players who
+# have not played yet have the initial rating
+RATINGS_SQL = '''SELECT Standings.pid, Players.name,
+                      coalesce(Ratings.rating, %(initial)s),
+                      coalesce(Ratings.games, 0)
+               FROM Standings
+               JOIN Players ON Players.pid = Standings.pid
+               LEFT JOIN Ratings ON Ratings.pid = Standings.pid
+               WHERE Standings.tid = %(tid)s
+               ORDER BY 3 DESC, Standings.pid'''
+
+# Record of a player in every tournament (see playerHistory) and against one
+# opponent (see headToHead), read from the rows of the player in
+# PlayerResults
+PLAYER_HISTORY_SQL = '''SELECT tid, count(*),
+                             count(CASE WHEN points > opponentPoints
+                                        THEN 1 END),
+                             count(CASE WHEN points = opponentPoints
+                                        THEN 1 END),
+                             count(CASE WHEN points < opponentPoints
+                                        THEN 1 END),
+                             sum(points)
+                      FROM PlayerResults
+                      WHERE pid = %(pid)s
+                      GROUP BY tid
+                      ORDER BY tid'''
+
+HEAD_TO_HEAD_SQL = '''SELECT count(*),
+                           count(CASE WHEN points > opponentPoints
+                                      THEN 1 END),
+                           count(CASE WHEN points = opponentPoints
+                                      THEN 1 END),
+                           count(CASE WHEN points < opponentPoints
+                                      THEN 1 END),
+                           coalesce(sum(points), 0),
+                           coalesce(sum(opponentPoints), 0)
+                    FROM PlayerResults
+                    WHERE pid = %(pid)s
+                    AND opponent = %(opponent)s'''
+
+PAIRING_HISTORY_SQL = '''SELECT player1, player2
+                       FROM Matches
+                       WHERE tournament = (%s)'''
+
+# Standings and pairing history of many tournaments, see swissPairingsBatch
+BATCH_STANDINGS_SQL = '''SELECT Standings.tid, Standings.pid, Players.name,
+                              Standings.points, Standings.matches
+                       FROM Standings, Players
+                       WHERE Standings.tid = ANY (%s)
+                       AND Standings.pid = Players.pid
+                       ORDER BY Standings.tid, -Standings.points,
+                                -Standings.matches, Standings.pid'''
+
+BATCH_PAIRING_HISTORY_SQL = '''SELECT tournament, player1, player2
+                             FROM Matches
+                             WHERE tournament = ANY (%s)'''
+
+# The last stored round of tournaments (see startRound) and whether some of
+# its pairings wait for their results
+ROUND_STATE_SQL = '''SELECT last.tid, last.round,
+                          EXISTS (SELECT 1
+                                  FROM Pairings
+                                  WHERE Pairings.tid = last.tid
+                                  AND Pairings.round = last.round
+                                  AND Pairings.mid IS NULL
+                                  AND Pairings.player2 IS NOT NULL)
+                   FROM (SELECT tid, max(round) AS round
+                         FROM Rounds
+                         WHERE tid = ANY (%s)
+                         GROUP BY tid) AS last'''
+
+# Pairings of one stored round by board, the bye (without second player) is
+# the last one
+ROUND_PAIRINGS_SQL = '''SELECT Pairings.player1, first.name,
+                             Pairings.player2, second.name, Pairings.mid
+                      FROM Pairings
+                      JOIN Players AS first ON first.pid = Pairings.player1
+                      LEFT JOIN Players AS second
+                          ON second.pid = Pairings.player2
+                      WHERE Pairings.tid = (%s)
+                      AND Pairings.round = (%s)
+                      ORDER BY Pairings.board'''
+
+# Stored byes of players of tournaments, who had any
+STORED_BYES_SQL = '''SELECT tid, pid, byes
+                   FROM Standings
+                   WHERE tid = ANY (%s)
+                   AND byes > 0'''
+
+# Standings recomputed from scratch: members with zero games and everybody,
+# who has played in the tournament
+_ACTUAL_STANDINGS_SQL = '''SELECT tid, pid,
+                                 sum(points) AS points,
+                                 sum(matches) AS matches,
+                                 sum(byes) AS byes
+                          FROM
+                            (
+                                SELECT tid, pid, 0 AS points, 0 AS matches,
+                                       0 AS byes
+                                FROM TournamentMembers
+                                WHERE (%(tid)s IS NULL OR tid = %(tid)s)
+
+                                UNION ALL
+
+                                SELECT tournament, player1, p1points, 1, 0
+                                FROM Matches
+                                WHERE (%(tid)s IS NULL
+                                       OR tournament = %(tid)s)
+
+                                UNION ALL
+
+                                SELECT tournament, player2, p2points, 1, 0
+                                FROM Matches
+                                WHERE (%(tid)s IS NULL
+                                       OR tournament = %(tid)s)
+
+                                UNION ALL
+
+                                SELECT tid, player1, 0, 0, 1
+                                FROM Pairings
+                                WHERE player2 IS NULL
+                                AND (%(tid)s IS NULL OR tid = %(tid)s)
+                            ) AS results
+                          GROUP BY tid, pid'''
+
+STANDINGS_DRIFT_SQL = ('''SELECT coalesce(actual.tid, Standings.tid),
+                               coalesce(actual.pid, Standings.pid),
+                               Standings.points, Standings.matches,
+                               actual.points, actual.matches
+                        FROM (''' + _ACTUAL_STANDINGS_SQL + ''') AS actual
+                        FULL OUTER JOIN
+                            (
+                                SELECT *
+                                FROM Standings
+                                WHERE (%(tid)s IS NULL OR tid = %(tid)s)
+                            ) AS Standings
+                        ON actual.tid = Standings.tid
+                        AND actual.pid = Standings.pid
+                        WHERE Standings.points IS DISTINCT FROM actual.points
+                        OR Standings.matches IS DISTINCT FROM actual.matches
+                        OR Standings.byes IS DISTINCT FROM actual.byes
+                        ORDER BY 1, 2''')
+
+# Registration of new players in one statement: players, their memberships
+# and zero standings, and the version of the tournament (see _bumpVersions).
+# Ids are taken from the sequence in the order of names, which are numbered
+# by generate_subscripts (unnest WITH ORDINALITY needs PostgreSQL 9.4).
+# Executed as a prepared statement, see _executePrepared
+REGISTER_PLAYERS_SQL = '''WITH new AS (
+                             SELECT nextval(pg_get_serial_sequence(
+                                        'Players', 'pid')) AS pid,
+                                    (%(names)s::text[])[n] AS name, n
+                             FROM generate_subscripts(%(names)s::text[], 1)
+                                  AS n
+                         ),
+                         players AS (
+                             INSERT INTO Players (pid, name)
+                             SELECT pid, name FROM new
+                         ),
+                         members AS (
+                             INSERT INTO TournamentMembers (tid, pid)
+                             SELECT %(tid)s::integer, pid FROM new
+                         ),
+                         standings AS (
+                             INSERT INTO Standings (tid, pid)
+                             SELECT %(tid)s::integer, pid FROM new
+                         ),
+                         versions AS (
+                             UPDATE TournamentVersions
+                             SET version = version + 1
+                             WHERE tid = %(tid)s
+                             RETURNING tid
+                         )
+                         SELECT array(SELECT pid FROM new ORDER BY n),
+                                EXISTS (SELECT 1 FROM versions)'''
+
+# Results of one tournament in one statement: the matches (tagged with the
+# last started round), their pairings, standings of the players and their
+# rows in PlayerResults. Returns
+# ids of the matches in the order of results, players without standings and
+# the locked ratings of the players (see _updateRatings). Executed as a
+# prepared statement
+REPORT_MATCHES_SQL = '''WITH new AS (
+                           SELECT nextval(pg_get_serial_sequence(
+                                      'Matches', 'mid')) AS mid,
+                                  (%(player1)s::integer[])[n] AS player1,
+                                  (%(p1points)s::integer[])[n] AS p1points,
+                                  (%(player2)s::integer[])[n] AS player2,
+                                  (%(p2points)s::integer[])[n] AS p2points,
+                                  n
+                           FROM generate_subscripts(%(player1)s::integer[],
+                                                    1) AS n
+                       ),
+                       last AS (
+                           SELECT coalesce(max(round), 0) AS round
+                           FROM Rounds
+                           WHERE tid = %(tid)s
+                       ),
+                       matches AS (
+                           INSERT INTO Matches (mid, player1, p1points,
+                                                player2, p2points,
+                                                tournament, round)
+                           SELECT new.mid, new.player1, new.p1points,
+                                  new.player2, new.p2points,
+                                  %(tid)s::integer, last.round
+                           FROM new, last
+                       ),
+                       history AS (
+                           INSERT INTO PlayerResults (pid, opponent, mid, tid,
+                                                      points, opponentPoints)
+                           SELECT player1, player2, mid, %(tid)s::integer,
+                                  p1points, p2points
+                           FROM new
+                           UNION ALL
+                           SELECT player2, player1, mid, %(tid)s::integer,
+                                  p2points, p1points
+                           FROM new
+                       ),
+                       pairings AS (
+                           UPDATE Pairings
+                           SET mid = new.mid
+                           FROM new
+                           WHERE Pairings.tid = %(tid)s
+                           AND Pairings.round = (SELECT round FROM last)
+                           AND Pairings.mid IS NULL
+                           AND Pairings.player2 IS NOT NULL
+                           AND least(Pairings.player1, Pairings.player2)
+                               = least(new.player1, new.player2)
+                           AND greatest(Pairings.player1, Pairings.player2)
+                               = greatest(new.player1, new.player2)
+                       ),
+                       deltas AS (
+                           SELECT pid, sum(points) AS points,
+                                  count(*) AS matches
+                           FROM (SELECT player1, p1points FROM new
+                                 UNION ALL
+                                 SELECT player2, p2points FROM new)
+                                AS results (pid, points)
+                           GROUP BY pid
+                       ),
+                       standings AS (
+                           UPDATE Standings
+                           SET points = Standings.points + deltas.points,
+                               matches = Standings.matches + deltas.matches
+                           FROM deltas
+                           WHERE Standings.tid = %(tid)s
+                           AND Standings.pid = deltas.pid
+                           RETURNING Standings.pid
+                       ),
+                       ratings AS (
+                           SELECT pid, rating, games
+                           FROM Ratings
+                           WHERE pid IN (SELECT pid FROM deltas)
+                           ORDER BY pid
+                           FOR UPDATE
+                       )
+                       SELECT array(SELECT mid FROM new ORDER BY n),
+                              array(SELECT pid FROM deltas
+                                    WHERE pid NOT IN (SELECT pid
+                                                      FROM standings)),
+                              array(SELECT pid FROM ratings ORDER BY pid),
+                              array(SELECT rating FROM ratings ORDER BY pid),
+                              array(SELECT games FROM ratings ORDER BY pid)'''
+
+# Statements of the write helpers (_bumpVersions, _createVersions,
+# _lockKeys, _insertStandings, _updateRatings and partitions of a session),
+# shared with tournament_async.py. VALUES %s is filled with rows by
+# execute_values
+BUMP_VERSIONS_SQL = '''UPDATE TournamentVersions
+                       SET version = version + 1
+                       WHERE tid = ANY (%s)
+                       RETURNING tid'''
+
+CREATE_VERSIONS_SQL = '''WITH bumped AS (
+                            UPDATE TournamentVersions
+                            SET version = version + 1
+                            WHERE tid = ANY (%(tids)s)
+                            RETURNING tid
+                        )
+                        INSERT INTO TournamentVersions (tid, version)
+                        SELECT new.tid, 1
+                        FROM unnest(%(tids)s::integer[]) AS new (tid)
+                        WHERE new.tid NOT IN (SELECT tid FROM bumped)'''
+
+LOCK_KEYS_SQL = '''SELECT pg_advisory_xact_lock(%s, id)
+                   FROM unnest(%s::integer[]) AS id'''
+
+INSERT_STANDINGS_SQL = '''WITH d (tid, pid, points, matches) AS (
+                             VALUES %s
+                         ),
+                         updated AS (
+                             UPDATE Standings
+                             SET points = Standings.points + d.points,
+                                 matches = Standings.matches + d.matches
+                             FROM d
+                             WHERE Standings.tid = d.tid
+                             AND Standings.pid = d.pid
+                             RETURNING Standings.tid, Standings.pid
+                         )
+                         INSERT INTO Standings (tid, pid, points, matches)
+                         SELECT d.tid, d.pid, d.points, d.matches
+                         FROM d
+                         WHERE NOT EXISTS (SELECT 1
+                                           FROM updated
+                                           WHERE updated.tid = d.tid
+                                           AND updated.pid = d.pid)'''
+
+LOCK_RATINGS_SQL = '''SELECT pid, rating, games
+                      FROM Ratings
+                      WHERE pid = ANY (%s)
+                      ORDER BY pid
+                      FOR UPDATE'''
+
+WRITE_RATINGS_SQL = '''WITH new (pid, rating, games) AS (
+                          VALUES %s
+                      ),
+                      updated AS (
+                          UPDATE Ratings
+                          SET rating = new.rating, games = new.games
+                          FROM new
+                          WHERE Ratings.pid = new.pid
+                          RETURNING Ratings.pid
+                      )
+                      INSERT INTO Ratings (pid, rating, games)
+                      SELECT pid, rating, games
+                      FROM new
+                      WHERE pid NOT IN (SELECT pid FROM updated)'''
+
+PARTITIONED_SQL = '''SELECT relkind = 'p'
+                     FROM pg_class
+                     WHERE oid = 'Matches'::regclass'''
+
+CREATE_PARTITIONS_SQL = '''SELECT tournament_partitions(tid)
+                           FROM unnest(%s) AS tid'''
+
+# Default connection pool configuration, see configurePool()
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 10
+POOL_IDLE_TIMEOUT = 300  # seconds
+
+_pool = None            # created lazily on the first getConnection()
+_poolOptions = {'minSize': POOL_MIN_SIZE,
+                'maxSize': POOL_MAX_SIZE,
+                'idleTimeout': POOL_IDLE_TIMEOUT}
+_poolEnabled = True
+_poolLock = threading.Lock()
+
+# Where module functions keep the data, see setBackend()
+BACKEND_POSTGRES = 'postgres'
+BACKEND_MEMORY = 'memory'
+
+_backend = None  # None means PostgreSQL
+
+# Cache of standings and pairings, see configureCache()
+CACHE_LOCAL = 'local'
+CACHE_SHARED = 'shared'
+CACHE_MAX_TOURNAMENTS = 128
+
+_cache = None  # None means that caching is disabled
+_cacheMode = CACHE_LOCAL
+
+# Instrumentation, see configureMetrics()
+SLOW_QUERY_THRESHOLD = 0.1  # seconds
+
+_metrics = None  # None means that metrics are disabled
+
+# Buffered reporting of results, see configureReportBuffer()
+REPORT_BATCH_SIZE = 500
+REPORT_MAX_DELAY = 0.01  # seconds
+
+_reportBuffer = None  # None means that results are written at once
+_reportBufferLock = threading.Lock()
+
+# Tables partitioned by tournament (see tournament_partitions.sql), with
+# their tournament id columns, and the schema of archived tournaments
+PARTITIONED_TABLES = (('matches', 'tournament'), ('tournamentmembers', 'tid'),
+                      ('standings', 'tid'))
+ARCHIVE_SCHEMA = 'archive'
+
+# Key of the advisory locks of startRound, the second key is the tid
+_ROUNDS_LOCK = 0x726f756e
+# Keys of the advisory locks of first writes of rows of TournamentVersions
+# (the second key is the tid), Standings and Ratings (the pid), see
+# _lockKeys
+_VERSIONS_LOCK = 0x76657273
+_STANDINGS_LOCK = 0x7374616e
+_RATINGS_LOCK = 0x72617469
+
+_partitioned = None  # whether the tables are partitioned, None: not known
+_prepared = weakref.WeakKeyDictionary()  # connection -> prepared statements
+_PARAMETER = re.compile(r'%\((\w+)\)s')
+_partitions = set()  # tournaments whose partitions are known to exist
+
+
+def setBackend(backend=BACKEND_POSTGRES):
+    """Selects where the module functions keep players and results.
+
+    Args:
+      backend: BACKEND_POSTGRES (the database, default), BACKEND_MEMORY (a
+        new, empty in-memory backend, see tournament_memory.py) or an object
+        with methods of the same names and signatures as the module functions
+
+    Returns:
+      The backend object, or None for PostgreSQL.
+    """
+    global _backend
+
+    # results queued for the previous backend are written to it
+    flushReports()
+    if backend == BACKEND_POSTGRES:
+        backend = None
+    elif backend == BACKEND_MEMORY:
+        from tournament_memory import MemoryBackend
+        backend = MemoryBackend()
+    _backend = backend
+    return backend
+
+
+def _dispatch(function):
+    """Decorator, which calls the method of the same name of the selected
+    backend instead of the function, unless the backend is PostgreSQL.
+    Calls are measured if metrics are enabled (see configureMetrics)."""
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        target = function if _backend is None else getattr(_backend, name)
+        metrics = _metrics
+        if metrics is None:
+            return target(*args, **kwargs)
+
+        start = timer()
+        result = target(*args, **kwargs)
+        metrics.record(KIND_FUNCTION, name, timer() - start,
+                       len(result) if isinstance(result, list) else None)
+        return result
+    return wrapper
+
+
+def configureMetrics(sinks=None, slowQueryThreshold=SLOW_QUERY_THRESHOLD,
+                     enabled=True):
+    """Enables or disables instrumentation of this module.
+
+    When enabled, records (kind, name, seconds, rows) are passed to sinks
+    for every call of a public function (KIND_FUNCTION), every SQL statement
+    (KIND_QUERY, named "function#n" for the n-th statement of the call),
+    every new connection (KIND_CONNECT), every connection checkout
+    (KIND_CHECKOUT) and the pairing of players in Python (KIND_PAIRING).
+    When disabled (the default until this is called), a call costs one
+    extra check of a global variable. See tournament_metrics.py.
+
+    Args:
+      sinks: list of sinks (LoggingSink, HistogramSink, StatsdSink or any
+        object with the method record(kind, name, seconds, rows)), a new
+        HistogramSink by default
+      slowQueryThreshold: statements running at least this number of
+        seconds are logged to the 'tournament.slowquery' logger with their
+        SQL and parameters (None logs nothing)
+      enabled: False to disable metrics
+
+    Returns:
+      The Metrics object with the sinks, or None if metrics are disabled.
+    """
+    global _metrics
+
+    if not enabled:
+        _metrics = None
+        return None
+    if sinks is None:
+        sinks = [HistogramSink()]
+    _metrics = Metrics(sinks, slowQueryThreshold)
+    return _metrics
+
+
+def configureCache(maxTournaments=CACHE_MAX_TOURNAMENTS, mode=CACHE_LOCAL,
+                   enabled=True):
+    """Enables, sizes or disables caching of standings and pairings.
+
+    Results of playerStandings, playerStandingsWithBye,
+    playerStandingsWithTiebreaks and swissPairings are cached per tournament
+    until the next write to the tournament. Every write function increments
+    the version of the tournaments it changes (TournamentVersions table) in
+    its transaction and, after the commit, invalidates them in the cache of
+    this process. Previously cached results are dropped by every call.
+
+    Args:
+      maxTournaments: tournaments whose results are kept (least recently
+        used tournaments are evicted)
+      mode: CACHE_LOCAL trusts the cache of this process, so it is only
+        correct if all writes are made by this process. CACHE_SHARED checks
+        the version of the tournament in the database on every read (one
+        primary key lookup), so writes of other processes invalidate the
+        cache as well
+      enabled: False to disable caching (the default until this is called)
+    """
+    global _cache, _cacheMode
+
+    if mode not in (CACHE_LOCAL, CACHE_SHARED):
+        raise ValueError("Unknown cache mode {mode}".format(mode=mode))
+    _cacheMode = mode
+    _cache = TournamentCache(maxTournaments) if enabled else None
+
+
+def configureReportBuffer(maxBatch=REPORT_BATCH_SIZE,
+                          maxDelay=REPORT_MAX_DELAY, enabled=True):
+    """Enables, tunes or disables buffered reporting of results.
+
+    When enabled, reportMatch and queueMatch queue results, which a writer
+    thread records in batches by reportMatches, one transaction (and one
+    commit) per batch of up to maxBatch results. A batch is written when it
+    is full or its oldest result has waited maxDelay seconds. reportMatch
+    waits until the batch of its result is committed; a result which can
+    not be recorded (e.g. of an unknown player) fails alone, the rest of its
+    batch is committed. swissPairings, swissPairingsBatch, startRound and
+    the functions which delete or archive results write the queued results
+    of their tournaments first, so they never miss a reported result. The
+    current buffer (if any) is flushed and closed, also at exit.
+
+    Only results of the PostgreSQL backend are buffered, other backends
+    record them at once.
+
+    Args:
+      maxBatch: most results written in one transaction
+      maxDelay: seconds a result may wait for more results (0 writes the
+        queued results as soon as the previous batch is committed)
+      enabled: False to write every result at once (the default until this
+        is called)
+    """
+    global _reportBuffer
+
+    newBuffer = (ReportBuffer(_writeReports, maxBatch, maxDelay)
+                 if enabled else None)
+    with _reportBufferLock:
+        oldBuffer, _reportBuffer = _reportBuffer, newBuffer
+    if oldBuffer is not None:
+        oldBuffer.close()
+
+
+atexit.register(configureReportBuffer, enabled=False)
+
+
+def reportBufferStats():
+    """Returns statistics of buffered reporting.
+
+    Returns:
+      A dict with counters: queued, written, failed (results), batches
+      (transactions), largestBatch and flushes (calls which waited for
+      queued results), the number of pending results and maxBatch and
+      maxDelay. An empty dict is returned if buffering is disabled.
+    """
+    buffer = _reportBuffer
+    if buffer is None:
+        return {}
+    return buffer.stats()
+
+
+def flushReports(tids=None):
+    """Writes the queued results without delay and waits until they are
+    committed, see configureReportBuffer.
+
+    Args:
+      tids: tournaments whose results are written (None means all)
+    """
+    buffer = _reportBuffer
+    if buffer is not None:
+        buffer.flush(tids)
+
+
+def _writeReports(results):
+    """Records buffered results (tid, winner, loser, isDraw) in one
+    transaction. Returns a list with the id of the match or the error of
+    every result."""
+    byTournament = {}
+    for i, result in enumerate(results):
+        byTournament.setdefault(result[0], []).append(i)
+
+    outcomes = [None] * len(results)
+    with Tournament() as session:
+        for tid in sorted(byTournament):
+            indexes = byTournament[tid]
+            try:
+                with session.savepoint():
+                    mids = session.reportMatches(
+                        [results[i][1:] for i in indexes], tid)
+            except Exception:
+                # find the results which fail, record the others
+                mids = []
+                for i in indexes:
+                    try:
+                        with session.savepoint():
+                            mids.extend(session.reportMatches(
+                                [results[i][1:]], tid))
+                    except Exception as e:
+                        mids.append(e)
+            for i, mid in zip(indexes, mids):
+                outcomes[i] = mid
+    return outcomes
+
+
+def cacheStats():
+    """Returns statistics of the cache of standings and pairings.
+
+    Returns:
+      A dict with counters: hits, misses, evictions, invalidations and the
+      current number of cached tournaments and maxTournaments. An empty dict
+      is returned if caching is disabled.
+    """
+    cache = _cache
+    if cache is None:
+        return {}
+    return cache.stats()
+
+
+def _cached(function):
+    """Decorator, which serves results of a read function of one tournament
+    from the cache, if it is enabled (see configureCache). The tournament ID
+    is the first argument of the function."""
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        cache = _cache
+        if cache is None:
+            return function(*args, **kwargs)
+
+        tid = args[0] if args else kwargs.get('tid', 0)
+        key = (name, args[1:], tuple(sorted(kwargs.items())))
+        # the generation is taken before the data is read, so results read
+        # before a write was committed are never cached as a newer generation
+        generation = cache.generation(tid)
+        if _cacheMode == CACHE_SHARED:
+            generation += (_tournamentVersion(tid),)
+        rows = cache.get(tid, key, generation)
+        if rows is None:
+            rows = function(*args, **kwargs)
+            cache.put(tid, key, generation, rows)
+        return rows
+    return wrapper
+
+
+def _tournamentVersion(tid):
+    """Returns the version of tournament tid from TournamentVersions."""
+    with getConnection() as conn:
+        c = conn.cursor()
+
+        c.execute("SELECT version FROM TournamentVersions WHERE tid = (%s)",
+                  (tid,))
+        row = c.fetchone()
+    return row[0] if row is not None else 0
+
+
+def _bumpVersions(c, tids=None):
+    """Increments versions of tournaments tids (None means all tournaments)
+    in TournamentVersions using cursor c, see configureCache()."""
+    if tids is None:
+        c.execute("UPDATE TournamentVersions SET version = version + 1")
+        return
+
+    tids = sorted(set(tids))
+    c.execute(BUMP_VERSIONS_SQL, (tids,))
+    missing = set(tids).difference(row[0] for row in c.fetchall())
+    if missing:
+        _createVersions(c, missing)
+
+
+def _createVersions(c, tids):
+    """Creates rows of TournamentVersions for the first writes to
+    tournaments tids (readers have seen version 0 so far) using cursor c.
+
+    Concurrent first writes of a tournament wait for each other's advisory
+    lock, so the later one bumps the row of the earlier one instead of
+    failing on its primary key.
+    """
+    tids = sorted(tids)
+    _lockKeys(c, _VERSIONS_LOCK, tids)
+    c.execute(CREATE_VERSIONS_SQL, {'tids': tids})
+
+
+def _executePrepared(c, name, sql, params):
+    """Executes sql with named parameters (dict params) using cursor c as
+    the prepared statement name of its connection.
+
+    The statement is prepared on its first use by a connection, so it is
+    planned once per connection instead of on every call. Prepared
+    statements outlive transactions, also rolled back ones.
+    """
+    prepare, execute = _preparedStatement(name, sql)
+    prepared = _prepared.setdefault(c.connection, set())
+    if name not in prepared:
+        c.execute(prepare)
+        prepared.add(name)
+    c.execute(execute, params)
+
+
+def _preparedStatement(name, sql):
+    """Returns a tuple (PREPARE statement, EXECUTE statement with named
+    parameters) of sql as the prepared statement name. Parameters are
+    numbered in the order they first appear in sql."""
+    keys = []
+    for key in _PARAMETER.findall(sql):
+        if key not in keys:
+            keys.append(key)
+    prepare = 'PREPARE {name} AS {sql}'.format(
+        name=name, sql=_PARAMETER.sub(
+            lambda match: '$%d' % (keys.index(match.group(1)) + 1), sql))
+    execute = 'EXECUTE {name} ({values})'.format(
+        name=name, values=', '.join('%({key})s'.format(key=key)
+                                    for key in keys))
+    return prepare, execute
+
+
+def _lockKeys(c, key, ids):
+    """Takes advisory transaction locks (key, id) of ids using cursor c, in
+    ascending order, so transactions which lock the same ids wait for each
+    other and never deadlock on them."""
+    c.execute(LOCK_KEYS_SQL, (key, sorted(set(ids))))
+
+
+def _invalidateCache(tids=None):
+    """Drops cached results of tournaments tids (None means all tournaments)
+    from the cache of this process. Called after the write is committed."""
+    cache = _cache
+    if cache is not None:
+        if tids is None:
+            cache.invalidateAll()
+        else:
+            cache.invalidate(tids)
+
 
 def connect():
     """Connect to the PostgreSQL database.  Returns a database connection."""
-    return psycopg2.connect("dbname=tournament")
+    return psycopg2.connect(DSN)
 
 
-def deleteMatches():
-    """Remove all the match records from the database."""
-    conn = connect()
-    c = conn.cursor()
+def configurePool(minSize=POOL_MIN_SIZE, maxSize=POOL_MAX_SIZE,
+                  idleTimeout=POOL_IDLE_TIMEOUT, enabled=True, **options):
+    """Sizes, tunes or disables the connection pool used by this module.
 
-    c.execute("DELETE FROM Matches;")
+    The current pool (if any) is closed and a new one is created on the next
+    database call, so it is safe to call this at any time.
 
-    conn.commit()
-    conn.close()
+    Args:
+      minSize: connections kept open even when idle
+      maxSize: maximum number of connections open at the same time
+      idleTimeout: seconds after which idle connections above minSize are
+        closed (None keeps them forever)
+      enabled: False to open a new connection for every call, as it was done
+        before pooling was introduced
+      options: other ConnectionPool arguments (checkoutTimeout,
+        healthCheckAfter)
+    """
+    global _pool, _poolEnabled, _poolOptions
 
+    options.update(minSize=minSize, maxSize=maxSize, idleTimeout=idleTimeout)
+    with _poolLock:
+        oldPool = _pool
+        _pool = None
+        _poolEnabled = enabled
+        _poolOptions = options
+    if oldPool is not None:
+        oldPool.closeall()
 
-def deletePlayers():
-    """Remove all the player records from the database."""
+
+def poolStats():
+    """Returns statistics of the connection pool.
+
+    Returns:
+      A dict with counters: checkouts, waits (checkouts which had to wait for
+      a free connection), waitTime (seconds), timeouts, created, closed,
+      healthCheckFailures and the current size, idle, inUse, minSize and
+      maxSize. An empty dict is returned if pooling is disabled or the pool
+      was not used yet.
+    """
+    pool = _pool
+    if pool is None:
+        return {}
+    return pool.stats()
+
+
+def _openConnection():
+    """Opens a new connection with connect(), measured if metrics are
+    enabled."""
+    metrics = _metrics
+    if metrics is None:
+        return connect()
+    start = timer()
     conn = connect()
-    c = conn.cursor()
+    metrics.record(KIND_CONNECT, 'connect', timer() - start)
+    return conn
 
-    c.execute("DELETE FROM TournamentMembers;")
-    c.execute("DELETE FROM Players;")
 
-    conn.commit()
-    conn.close()
+def _getPool():
+    """Returns the module connection pool, creating it if needed."""
+    global _pool
 
+    with _poolLock:
+        if _pool is None and _poolEnabled:
+            # connect() is called through the module namespace, so it can
+            # be replaced (e.g. to count new connections)
+            _pool = ConnectionPool(_openConnection, **_poolOptions)
+        return _pool
 
-def countPlayers():
-    """Returns the number of players currently registered."""
-    conn = connect()
-    c = conn.cursor()
 
-    c.execute("SELECT COUNT(pid) FROM Players;")
-    count = c.fetchone()[0]
+@contextmanager
+def getConnection():
+    """Context manager, which provides a database connection.
 
-    conn.commit()
-    conn.close()
+    The connection is taken from the pool (or opened, if pooling is
+    disabled). The transaction is committed when the block exits normally
+    and rolled back if it raises, then the connection is given back.
+    """
+    metrics = _metrics
+    start = timer() if metrics is not None else None
+    pool = _getPool()
+    conn = pool.getconn() if pool is not None else _openConnection()
+    if metrics is not None:
+        metrics.record(KIND_CHECKOUT, 'getConnection', timer() - start)
+    broken = False
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        # also GeneratorExit, when a generator using the connection (like
+        # iterStandings) is closed before it is exhausted
+        try:
+            conn.rollback()
+        except Exception:
+            broken = True
+        raise
+    finally:
+        if pool is not None:
+            pool.putconn(conn, discard=broken or bool(conn.closed))
+        else:
+            conn.close()
+
+
+def _sessionDispatch(method):
+    """Decorator of Tournament methods, which calls the method of the same
+    name of the session's backend instead, unless it is PostgreSQL."""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self._backend is not None:
+            return getattr(self._backend, name)(*args, **kwargs)
+        if self._metrics is not None:
+            # statements are named after the method which runs them
+            self._cursor.start(name)
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+class Tournament(object):
+    """A session, which runs the data functions of this module in one
+    transaction over one connection.
+
+    Methods have the same names, arguments and results as the module
+    functions (which run every call as a session of its own). Calls of a
+    session see the changes made by its previous calls. The transaction is
+    committed when the with block exits normally and rolled back if it
+    raises, so a whole round is recorded with one commit:
+
+        with Tournament() as session:
+            session.reportMatches(results, tid)
+            pairings = session.swissPairings(tid)
+
+    Reads of a session are not cached, the cache of the changed tournaments
+    is invalidated after the commit. A session uses the backend selected
+    when it starts. The memory backend is locked for other threads until
+    the session ends; other backends need the methods begin, end, snapshot
+    and restore of MemoryBackend. A session must be used by one thread.
+    """
+
+    def __init__(self):
+        self._backend = None
+        self._metrics = None
+        self._context = None     # getConnection() of the session
+        self._conn = None
+        self._cursor = None
+        self._snapshot = None    # memory backend state to roll back to
+        self._changedTids = set()
+        self._changedAll = False
+        self._newPartitions = set()       # tids of partitions created and
+        self._detachedPartitions = set()  # detached by the transaction
+        self._savepoints = 0     # savepoints and named cursors created
+        self._cursors = 0
+
+    def __enter__(self):
+        if self._context is not None or self._snapshot is not None:
+            raise ValueError("The session is already open")
+        self._backend = _backend
+        self._metrics = _metrics
+        if self._backend is None:
+            self._context = getConnection()
+            self._conn = self._context.__enter__()
+            self._cursor = self._measured(self._conn.cursor())
+        else:
+            self._snapshot = self._backend.begin()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        context, self._context = self._context, None
+        snapshot, self._snapshot = self._snapshot, None
+        self._conn = self._cursor = None
+        if self._backend is None:
+            # commits or rolls back and gives the connection back
+            context.__exit__(excType, excValue, traceback)
+        else:
+            if excType is not None:
+                self._backend.restore(snapshot)
+            self._backend.end()
+        if excType is None:
+            self._committed()
+        else:
+            self._forgetChanges()
+        return False
+
+    def commit(self):
+        """Commits the changes made so far, the session continues in a new
+        transaction."""
+        if self._backend is None:
+            self._conn.commit()
+        else:
+            self._snapshot = self._backend.snapshot()
+        self._committed()
+
+    def rollback(self):
+        """Rolls back the changes made since the session started or was
+        committed, the session continues in a new transaction."""
+        if self._backend is None:
+            self._conn.rollback()
+        else:
+            self._backend.restore(self._snapshot)
+            self._snapshot = self._backend.snapshot()
+        self._forgetChanges()
+
+    @contextmanager
+    def savepoint(self):
+        """Context manager, which rolls back the changes made in its block
+        if the block raises (the exception is raised again). Changes made
+        before the block stay in the transaction, so the session can
+        continue after the error is handled:
+
+            with session.savepoint():
+                session.reportMatch(winner, loser, tid=tid)
+        """
+        if self._backend is None:
+            self._savepoints += 1
+            name = 'savepoint{n}'.format(n=self._savepoints)
+            self._cursor.execute('SAVEPOINT ' + name)
+            partitions = (set(self._newPartitions),
+                          set(self._detachedPartitions))
+        else:
+            snapshot = self._backend.snapshot()
+        try:
+            yield self
+        except BaseException:
+            if self._backend is None:
+                self._cursor.execute('ROLLBACK TO SAVEPOINT ' + name)
+                self._newPartitions, self._detachedPartitions = partitions
+            else:
+                self._backend.restore(snapshot)
+            raise
+        if self._backend is None:
+            self._cursor.execute('RELEASE SAVEPOINT ' + name)
+
+    def _measured(self, cursor):
+        """Returns cursor, which records statements if metrics are on."""
+        if self._metrics is None:
+            return cursor
+        measured = MeasuredCursor(cursor, self._metrics)
+        if self._cursor is not None:
+            measured.start(self._cursor.operation)
+        return measured
+
+    def _recordChange(self, tids=None):
+        """Remembers tournaments tids (None means all) to be invalidated in
+        the cache after the commit."""
+        if tids is None:
+            self._changedAll = True
+        else:
+            self._changedTids.update(tids)
+
+    def _committed(self):
+        """Applies the changes of the committed transaction to the cache and
+        to the known partitions of this process."""
+        if self._changedAll:
+            _invalidateCache()
+        elif self._changedTids:
+            _invalidateCache(self._changedTids)
+        _partitions.update(self._newPartitions)
+        _partitions.difference_update(self._detachedPartitions)
+        self._forgetChanges()
+
+    def _forgetChanges(self):
+        self._changedTids = set()
+        self._changedAll = False
+        self._newPartitions = set()
+        self._detachedPartitions = set()
+
+    def _ensurePartitions(self, tids):
+        """Creates the partitions of tournaments tids, which do not exist
+        yet, if the tables are partitioned by tournament."""
+        if not _isPartitioned(self._cursor):
+            return
+        missing = set(tids) - _partitions - self._newPartitions
+        if missing:
+            self._cursor.execute(CREATE_PARTITIONS_SQL, (sorted(missing),))
+            self._newPartitions.update(missing)
+
+    @_sessionDispatch
+    def deleteMatches(self):
+        """See deleteMatches()."""
+        c = self._cursor
+        c.execute("DELETE FROM Matches;")
+        c.execute("DELETE FROM PlayerResults;")
+        c.execute("DELETE FROM StandingsSnapshots;")
+        c.execute("DELETE FROM Pairings;")
+        c.execute("DELETE FROM Rounds;")
+        c.execute("DELETE FROM Ratings;")
+        _rebuildStandings(c)
+        _bumpVersions(c)
+        self._recordChange()
+
+    @_sessionDispatch
+    def deletePlayers(self):
+        """See deletePlayers()."""
+        c = self._cursor
+        c.execute("DELETE FROM Standings;")
+        c.execute("DELETE FROM TournamentMembers;")
+        c.execute("DELETE FROM StandingsSnapshots;")
+        c.execute("DELETE FROM Pairings;")
+        c.execute("DELETE FROM Rounds;")
+        c.execute("DELETE FROM Ratings;")
+        c.execute("DELETE FROM Players;")
+        _bumpVersions(c)
+        self._recordChange()
+
+    @_sessionDispatch
+    def countPlayers(self):
+        """See countPlayers()."""
+        c = self._cursor
+        c.execute("SELECT COUNT(pid) FROM Players;")
+        return c.fetchone()[0]
+
+    @_sessionDispatch
+    def registerPlayer(self, name, tid=0):
+        """See registerPlayer()."""
+        return self.registerPlayers([name], tid)[0]
+
+    @_sessionDispatch
+    def registerPlayers(self, names, tid=0):
+        """See registerPlayers()."""
+        names = list(names)
+        if not names:
+            return []
+
+        self._ensurePartitions([tid])
+        c = self._cursor
+        # players, their membership in tournament tid and their standings
+        # are inserted by one statement, see REGISTER_PLAYERS_SQL
+        _executePrepared(c, 'register_players', REGISTER_PLAYERS_SQL,
+                         {'names': names, 'tid': tid})
+        pids, bumped = c.fetchone()
+        if not bumped:
+            _createVersions(c, [tid])
+        self._recordChange([tid])
+        return pids
+
+    @_sessionDispatch
+    def registerPlayerForTournament(self, pid, tid=0):
+        """See registerPlayerForTournament()."""
+        self._ensurePartitions([tid])
+        _addTournamentMembers(self._cursor, [pid], tid)
+        self._recordChange([tid])
+
+    @_sessionDispatch
+    def playerStandings(self, tid=0, round=None):
+        """See playerStandings()."""
+        c = self._cursor
+        if round is not None and round < _lastRound(c, tid):
+            c.execute(ROUND_STANDINGS_SQL, {'tid': tid, 'round': round})
+            return c.fetchall()
+        # Standings is kept up to date by every write, which changes results,
+        # so it already contains members with zero games as well
+        c.execute(STANDINGS_SQL, (tid,))
+        return c.fetchall()
+
+    @_sessionDispatch
+    def iterStandings(self, tid=0, batchSize=STREAM_BATCH_SIZE):
+        """See iterStandings()."""
+        self._cursors += 1
+        # named cursors are server-side cursors
+        c = self._conn.cursor('iterStandings{n}'.format(n=self._cursors))
+        c.itersize = batchSize
+        c = self._measured(c)
+
+        c.execute(STANDINGS_FIRST_PAGE_SQL,
+                  {'tid': tid, 'limit': None, 'offset': 0})
+        for row in c:
+            yield row
+        c.close()
+
+    @_sessionDispatch
+    def standingsPage(self, tid=0, limit=STANDINGS_PAGE_SIZE, after=None,
+                      offset=0):
+        """See standingsPage()."""
+        c = self._cursor
+        params = {'tid': tid, 'limit': limit, 'offset': offset}
+        if after is None:
+            c.execute(STANDINGS_FIRST_PAGE_SQL, params)
+        else:
+            params.update(pid=after[0], points=-after[2], matches=-after[3])
+            c.execute(STANDINGS_NEXT_PAGE_SQL, params)
+        return c.fetchall()
+
+    @_sessionDispatch
+    def playerStandingsWithBye(self, tid=0):
+        """See playerStandingsWithBye()."""
+        c = self._cursor
+        # every player gets POINTS_FOR_BYE for each stored bye or, without
+        # stored rounds, for each match he has played less than the maximum
+        # number of matches (usually number of rounds)
+        c.execute(STANDINGS_WITH_BYE_SQL, {'bye': POINTS_FOR_BYE, 'tid': tid})
+        return c.fetchall()
+
+    @_sessionDispatch
+    def playerStandingsWithTiebreaks(self, tid=0):
+        """See playerStandingsWithTiebreaks()."""
+        c = self._cursor
+        c.execute(TIEBREAK_STANDINGS_SQL,
+                  {'tid': tid, 'bye': POINTS_FOR_BYE, 'win': POINTS_FOR_WIN,
+                   'minWin': MIN_MATCH_WIN_PERCENT})
+        return c.fetchall()
+
+    @_sessionDispatch
+    def reportMatch(self, winner, loser, isDraw=False, tid=0):
+        """See reportMatch()."""
+        return self.reportMatches([(winner, loser, isDraw)], tid)[0]
+
+    @_sessionDispatch
+    def reportMatches(self, results, tid=0):
+        """See reportMatches()."""
+        rows, deltas = _resultRows(results, tid)
+        if not rows:
+            return []
+
+        self._ensurePartitions([tid])
+        c = self._cursor
+        # results belong to the last started round (0 before the first one),
+        # everything but ratings and the version is written by one statement
+        _executePrepared(c, 'report_matches', REPORT_MATCHES_SQL,
+                         {'tid': tid, 'player1': [row[0] for row in rows],
+                          'p1points': [row[1] for row in rows],
+                          'player2': [row[2] for row in rows],
+                          'p2points': [row[3] for row in rows]})
+        mids, unlisted, pids, ratings, games = c.fetchone()
+        if unlisted:
+            # players may play without being registered for the tournament
+            _insertStandings(c, [(tid, pid) + tuple(deltas[(tid, pid)])
+                                 for pid in unlisted])
+        _updateRatings(c, rows, dict(zip(pids, zip(ratings, games))))
+        # last, the version row serializes writers of the tournament
+        _bumpVersions(c, [tid])
+        self._recordChange([tid])
+        return mids
+
+    @_sessionDispatch
+    def correctMatch(self, mid, winner, loser, isDraw=False):
+        """See correctMatch()."""
+        p1points, p2points = _matchPoints(isDraw)
+
+        c = self._cursor
+        c.execute('''SELECT tournament, player1, p1points, player2, p2points,
+                           round
+                    FROM Matches
+                    WHERE mid = (%s)
+                    FOR UPDATE''', (mid,))
+        old = c.fetchone()
+        if old is None:
+            raise ValueError("There is no match with id {mid}".format(mid=mid))
+        tid = old[0]
+
+        c.execute('''UPDATE Matches
+                    SET player1 = (%s), p1points = (%s),
+                        player2 = (%s), p2points = (%s)
+                    WHERE mid = (%s)''',
+                  (winner, p1points, loser, p2points, mid))
+        _deletePlayerResults(c, mid, old[1], old[3])
+        _insertPlayerResults(c, tid, mid, winner, p1points, loser, p2points)
+
+        deltas = {}
+        _addStandingsDelta(deltas, tid, old[1], -old[2], -1)
+        _addStandingsDelta(deltas, tid, old[3], -old[4], -1)
+        _addStandingsDelta(deltas, tid, winner, p1points, 1)
+        _addStandingsDelta(deltas, tid, loser, p2points, 1)
+        _updateStandings(c, deltas)
+        _updateSnapshots(c, tid, old[5], deltas)
+        _bumpVersions(c, [tid])
+        self._recordChange([tid])
+
+    @_sessionDispatch
+    def deleteMatch(self, mid):
+        """See deleteMatch()."""
+        c = self._cursor
+        c.execute('''DELETE FROM Matches
+                    WHERE mid = (%s)
+                    RETURNING tournament, player1, p1points,
+                              player2, p2points, round''', (mid,))
+        old = c.fetchone()
+        if old is None:
+            raise ValueError("There is no match with id {mid}".format(mid=mid))
+        _deletePlayerResults(c, mid, old[1], old[3])
+
+        # a pairing of the last round waits for the result again
+        c.execute('''UPDATE Pairings
+                    SET mid = NULL
+                    WHERE tid = (%s)
+                    AND mid = (%s)''', (old[0], mid))
+
+        deltas = {}
+        _addStandingsDelta(deltas, old[0], old[1], -old[2], -1)
+        _addStandingsDelta(deltas, old[0], old[3], -old[4], -1)
+        _updateStandings(c, deltas)
+        _updateSnapshots(c, old[0], old[5], deltas)
+        _bumpVersions(c, [old[0]])
+        self._recordChange([old[0]])
+
+    @_sessionDispatch
+    def deleteTournament(self, tid):
+        """See deleteTournament()."""
+        c = self._cursor
+        if not _isPartitioned(c):
+            for table, column in PARTITIONED_TABLES:
+                c.execute("DELETE FROM {table} WHERE {column} = (%s)".format(
+                    table=table, column=column), (tid,))
+        elif self._hasPartitions(tid):
+            # the partitions stay, they are empty and ready for new rows
+            c.execute("TRUNCATE " + ", ".join(_partitionNames(tid)))
+        c.execute("DELETE FROM PlayerResults WHERE tid = (%s)", (tid,))
+        _deleteRounds(c, tid)
+        c.execute("DROP TABLE IF EXISTS " + ", ".join(
+            ARCHIVE_SCHEMA + '.' + name for name in _partitionNames(tid)))
+        _bumpVersions(c, [tid])
+        self._recordChange([tid])
+
+    @_sessionDispatch
+    def archiveTournament(self, tid):
+        """See archiveTournament()."""
+        c = self._cursor
+        names = _partitionNames(tid)
+        c.execute("""SELECT count(*)
+                    FROM pg_tables
+                    WHERE schemaname = (%s)
+                    AND tablename = ANY (%s)""", (ARCHIVE_SCHEMA, names))
+        if c.fetchone()[0]:
+            raise ValueError("Tournament {tid} is already archived".format(
+                tid=tid))
+        c.execute("SELECT EXISTS (SELECT 1 FROM Standings WHERE tid = (%s))",
+                  (tid,))
+        if not c.fetchone()[0]:
+            raise ValueError("There is no tournament with id {tid}".format(
+                tid=tid))
+
+        if _isPartitioned(c):
+            for (table, column), name in zip(PARTITIONED_TABLES, names):
+                c.execute("ALTER TABLE {table} DETACH PARTITION {name}".format(
+                    table=table, name=name))
+                c.execute("ALTER TABLE {name} SET SCHEMA {schema}".format(
+                    name=name, schema=ARCHIVE_SCHEMA))
+                self._dropForeignKeys(ARCHIVE_SCHEMA + '.' + name)
+            self._detachedPartitions.add(tid)
+        else:
+            for (table, column), name in zip(PARTITIONED_TABLES, names):
+                c.execute("""CREATE TABLE {schema}.{name} AS
+                            SELECT * FROM {table} WHERE {column} = (%s)
+                            """.format(schema=ARCHIVE_SCHEMA, name=name,
+                                       table=table, column=column), (tid,))
+                c.execute("DELETE FROM {table} WHERE {column} = (%s)".format(
+                    table=table, column=column), (tid,))
+        # archived matches are not counted in player records
+        c.execute("DELETE FROM PlayerResults WHERE tid = (%s)", (tid,))
+        # byes stay counted in the archived standings
+        _deleteRounds(c, tid)
+        _bumpVersions(c, [tid])
+        self._recordChange([tid])
+
+    def _hasPartitions(self, tid):
+        """Returns whether the partitions of tournament tid exist."""
+        if tid in _partitions or tid in self._newPartitions:
+            return True
+        self._cursor.execute("SELECT to_regclass(%s) IS NOT NULL",
+                             (_partitionNames(tid)[0],))
+        return self._cursor.fetchone()[0]
+
+    def _dropForeignKeys(self, table):
+        """Drops foreign keys of an archived table, so that archived results
+        do not prevent deleting players."""
+        c = self._cursor
+        c.execute("""SELECT conname
+                    FROM pg_constraint
+                    WHERE conrelid = (%s)::regclass
+                    AND contype = 'f'""", (table,))
+        for row in c.fetchall():
+            c.execute("ALTER TABLE {table} DROP CONSTRAINT {name}".format(
+                table=table, name=quote_ident(row[0], self._conn)))
+
+    @_sessionDispatch
+    def verifyStandings(self, tid=None):
+        """See verifyStandings()."""
+        c = self._cursor
+        c.execute(STANDINGS_DRIFT_SQL, {'tid': tid})
+        return c.fetchall()
+
+    @_sessionDispatch
+    def rebuildStandings(self, tid=None):
+        """See rebuildStandings()."""
+        c = self._cursor
+        c.execute("LOCK TABLE Matches, Standings IN SHARE ROW EXCLUSIVE MODE")
+        c.execute(STANDINGS_DRIFT_SQL, {'tid': tid})
+        drift = c.fetchall()
+        if drift:
+            _rebuildStandings(c, tid)
+            _bumpVersions(c, [row[0] for row in drift])
+            self._recordChange([row[0] for row in drift])
+        return drift
+
+    @_sessionDispatch
+    def playerRatings(self, tid=0):
+        """See playerRatings()."""
+        c = self._cursor
+        c.execute(RATINGS_SQL, {'tid': tid, 'initial': INITIAL_RATING})
+        return c.fetchall()
+
+    @_sessionDispatch
+    def recomputeRatings(self):
+        """See recomputeRatings()."""
+        c = self._cursor
+        c.execute("LOCK TABLE Matches, Ratings IN SHARE ROW EXCLUSIVE MODE")
+        c.execute('''SELECT player1, p1points, player2, p2points
+                    FROM Matches
+                    ORDER BY mid''')
+        ratings = replayRatings(c.fetchall())
+        c.execute("DELETE FROM Ratings")
+        execute_values(c, "INSERT INTO Ratings (pid, rating, games) VALUES %s",
+                       sorted((pid,) + value
+                              for pid, value in ratings.items()),
+                       page_size=BATCH_PAGE_SIZE)
+        return len(ratings)
+
+    @_sessionDispatch
+    def playerCareer(self, pid):
+        """See playerCareer()."""
+        return _careerRecord(self.playerHistory(pid))
+
+    @_sessionDispatch
+    def playerHistory(self, pid):
+        """See playerHistory()."""
+        c = self._cursor
+        c.execute(PLAYER_HISTORY_SQL, {'pid': pid})
+        return c.fetchall()
+
+    @_sessionDispatch
+    def headToHead(self, pid, opponent):
+        """See headToHead()."""
+        c = self._cursor
+        c.execute(HEAD_TO_HEAD_SQL, {'pid': pid, 'opponent': opponent})
+        return c.fetchone()
+
+    @_sessionDispatch
+    def swissPairings(self, tid=0, mode=PAIRING_GREEDY,
+                      timeBudget=PAIRING_TIME_BUDGET, seeded=False):
+        """See swissPairings()."""
+        state = self._roundState(tid)
+        if state is not None and state[1]:
+            # a started round is not paired again until it is finished
+            return [row[:4] for row in self.roundPairings(tid, state[0])
+                    if row[2] is not None]
+        return self._pairNextRound(tid, mode, timeBudget, seeded, state)[0]
+
+    @_sessionDispatch
+    def startRound(self, tid=0, mode=PAIRING_GREEDY,
+                   timeBudget=PAIRING_TIME_BUDGET, seeded=False):
+        """See startRound()."""
+        c = self._cursor
+        # rounds of one tournament are started one at a time
+        c.execute("SELECT pg_advisory_xact_lock(%s, %s)", (_ROUNDS_LOCK, tid))
+        state = self._roundState(tid)
+        if state is not None and state[1]:
+            pairings = self.roundPairings(tid, state[0])
+            byes = [row[0] for row in pairings if row[2] is None]
+            return (state[0], [row[:4] for row in pairings
+                               if row[2] is not None],
+                    byes[0] if byes else None)
+
+        pairs, standing = self._pairNextRound(tid, mode, timeBudget, seeded,
+                                              state)
+        if not standing:
+            raise ValueError("There is no tournament with id {tid}".format(
+                tid=tid))
+        paired = set([pair[0] for pair in pairs] + [pair[2] for pair in pairs])
+        byes = [row[0] for row in standing if row[0] not in paired]
+        bye = byes[0] if byes else None
+
+        number = state[0] + 1 if state is not None else 1
+        if state is not None and state[0] % SNAPSHOT_INTERVAL == 0:
+            # all results so far belong to the finished round or before
+            c.execute("""INSERT INTO StandingsSnapshots (tid, round, pid,
+                                                        points, matches)
+                        SELECT tid, (%s), pid, points, matches
+                        FROM Standings
+                        WHERE tid = (%s)""", (state[0], tid))
+            c.execute("""UPDATE Rounds
+                        SET snapshot = true
+                        WHERE tid = (%s)
+                        AND round = (%s)""", (tid, state[0]))
+        c.execute("INSERT INTO Rounds (tid, round) VALUES (%s, %s)",
+                  (tid, number))
+        rows = [(tid, number, board, pair[0], pair[2])
+                for board, pair in enumerate(pairs, 1)]
+        if bye is not None:
+            rows.append((tid, number, len(pairs) + 1, bye, None))
+            c.execute("""UPDATE Standings
+                        SET byes = byes + 1
+                        WHERE tid = (%s)
+                        AND pid = (%s)""", (tid, bye))
+        execute_values(c, """INSERT INTO Pairings (tid, round, board, player1,
+                                                 player2)
+                       VALUES %s""", rows, page_size=BATCH_PAGE_SIZE)
+        _bumpVersions(c, [tid])
+        self._recordChange([tid])
+        return number, pairs, bye
+
+    @_sessionDispatch
+    def roundPairings(self, tid=0, round=None):
+        """See roundPairings()."""
+        if round is None:
+            state = self._roundState(tid)
+            if state is None:
+                return []
+            round = state[0]
+        c = self._cursor
+        c.execute(ROUND_PAIRINGS_SQL, (tid, round))
+        return c.fetchall()
+
+    @_sessionDispatch
+    def pairingQuality(self, pairings, tid=0):
+        """See pairingQuality()."""
+        standing, opponents = self._pairingInput(tid)
+        return measurePairing(pairings, standing, opponents,
+                              self._storedByes(tid, self._roundState(tid)))
+
+    @_sessionDispatch
+    def swissPairingsBatch(self, tids, mode=PAIRING_GREEDY,
+                           timeBudget=PAIRING_TIME_BUDGET,
+                           processes=PAIRING_PROCESSES):
+        """See swissPairingsBatch()."""
+        tids = sorted(set(tids))
+        standings = dict((tid, []) for tid in tids)
+        history = dict((tid, []) for tid in tids)
+        byes = {}     # tid -> stored byes of tournaments with stored rounds
+        started = {}  # tid -> pairings of rounds waiting for results
+        if tids:
+            c = self._cursor
+            c.execute(BATCH_STANDINGS_SQL, (tids,))
+            for row in c.fetchall():
+                standings[row[0]].append(row[1:])
+            c.execute(BATCH_PAIRING_HISTORY_SQL, (tids,))
+            for tid, player1, player2 in c.fetchall():
+                history[tid].append((player1, player2))
+            c.execute(ROUND_STATE_SQL, (tids,))
+            for tid, number, waiting in c.fetchall():
+                byes[tid] = {}
+                if waiting:
+                    started[tid] = [row[:4]
+                                    for row in self.roundPairings(tid, number)
+                                    if row[2] is not None]
+            if byes:
+                c.execute(STORED_BYES_SQL, (sorted(byes),))
+                for tid, pid, count in c.fetchall():
+                    byes[tid][pid] = count
+
+        pairings, report = _runPairingJobs(
+            [(tid, standings[tid], history[tid], byes.get(tid), mode,
+              timeBudget) for tid in tids if tid not in started], processes)
+        for tid, pairs in started.items():
+            pairings[tid] = pairs
+            report[tid] = {'players': len(standings[tid]),
+                           'pairs': len(pairs), 'seconds': 0.0,
+                           'error': None}
+        return pairings, report
+
+    def _pairingInput(self, tid):
+        """Returns standings and opponents index of tournament tid."""
+        c = self._cursor
+        c.execute(STANDINGS_SQL, (tid,))
+        standing = c.fetchall()
+        c.execute(PAIRING_HISTORY_SQL, (tid,))
+
+        # get previously played matches for better pairing
+        return standing, opponentSets(c.fetchall())
+
+    def _roundState(self, tid):
+        """Returns (last round, whether it waits for results) of the stored
+        rounds of tournament tid, None if it has none."""
+        c = self._cursor
+        c.execute(ROUND_STATE_SQL, ([tid],))
+        row = c.fetchone()
+        return row[1:] if row is not None else None
+
+    def _storedByes(self, tid, state):
+        """Returns dict {id: byes} of tournament tid with round state state,
+        None if it has no stored rounds (byes are derived from matches)."""
+        if state is None:
+            return None
+        c = self._cursor
+        c.execute(STORED_BYES_SQL, ([tid],))
+        return dict((pid, count) for t, pid, count in c.fetchall())
+
+    def _pairNextRound(self, tid, mode, timeBudget, seeded, state):
+        """Pairs the next round of tournament tid with round state state.
+        Returns a tuple (pairings, standings they were made from)."""
+        standing, opponents = self._pairingInput(tid)
+        byes = self._storedByes(tid, state)
+        if seeded:
+            standing = seededStanding(standing, dict(
+                (row[0], row[2]) for row in self.playerRatings(tid)))
+        start = timer()
+        pairs = pairRound(standing, opponents, mode, timeBudget, byes)
+        if self._metrics is not None:
+            self._metrics.record(KIND_PAIRING, 'swissPairings',
+                                 timer() - start, len(pairs))
+        return pairs, standing
+
+
+@_dispatch
+def deleteMatches():
+    """Remove all the match records from the database."""
+    flushReports()
+    with Tournament() as session:
+        session.deleteMatches()
+
+
+@_dispatch
+def deletePlayers():
+    """Remove all the player records from the database."""
+    flushReports()
+    with Tournament() as session:
+        session.deletePlayers()
 
-    return count
+
+@_dispatch
+def countPlayers():
+    """Returns the number of players currently registered."""
+    with Tournament() as session:
+        return session.countPlayers()
 
 
+@_dispatch
 def registerPlayer(name, tid=0):
     """Adds a player to the tournament database.
 
@@ -60,49 +1759,95 @@ def registerPlayer(name, tid=0):
     Args:
       name: the player's full name (need not be unique).
       tid: tournament ID (0 is default tournament)
+
+    Returns:
+      The id assigned to the player.
     """
-    conn = connect()
-    c = conn.cursor()
+    return registerPlayers([name], tid)[0]
 
-    c.execute("INSERT INTO Players (name) VALUES (%s)", (name,))
-    conn.commit()
-   
-    c.execute('''SELECT max(pid)
-                FROM Players
-                WHERE name = (%s)
-        ''', (name,))
-    pid = c.fetchone()[0]
 
-    # registerPlayerForTournament is to support multiply tournaments. One
-    # player can participate in any number of tournaments. All players are
-    # registered for TID=0 by default to be compartible with default tests
-    registerPlayerForTournament(pid, tid)
+@_dispatch
+def registerPlayers(names, tid=0):
+    """Adds many players to the tournament database in one transaction.
 
-    conn.commit()
-    conn.close()
+    Either all players are registered or (in case of an error) none of them.
 
+    Args:
+      names: iterable of the players' full names
+      tid: tournament ID (0 is default tournament)
 
-def registerPlayerForTournament(pid, tid=0):
-    """TODO: description
+    Returns:
+      A list of ids assigned to the players, in the order of names.
     """
-    conn = connect()
-    c = conn.cursor()
+    with Tournament() as session:
+        return session.registerPlayers(names, tid)
 
-    c.execute("""INSERT INTO TournamentMembers (tid, pid)
-                VALUES (%s , %s)""", (tid, pid, ))
 
-    conn.commit()
-    conn.close()
+@_dispatch
+def registerPlayerForTournament(pid, tid=0):
+    """Adds an already registered player to one more tournament.
 
+    Args:
+      pid: the player's unique id
+      tid: tournament ID (0 is default tournament)
+    """
+    with Tournament() as session:
+        session.registerPlayerForTournament(pid, tid)
 
-def playerStandings(tid=0):
+
+def _addTournamentMembers(c, pids, tid):
+    """Adds players with ids pids to tournament tid using cursor c.
+
+    New members get a row with zero points and matches in Standings. The
+    caller invalidates the cache after the commit.
+    """
+    c.execute('''WITH new AS (
+                    SELECT unnest(%(pids)s::integer[]) AS pid
+                ),
+                members AS (
+                    INSERT INTO TournamentMembers (tid, pid)
+                    SELECT %(tid)s, pid FROM new
+                ),
+                standings AS (
+                    INSERT INTO Standings (tid, pid)
+                    SELECT %(tid)s, pid
+                    FROM new
+                    WHERE NOT EXISTS (SELECT 1
+                                      FROM Standings
+                                      WHERE Standings.tid = %(tid)s
+                                      AND Standings.pid = new.pid)
+                ),
+                versions AS (
+                    UPDATE TournamentVersions
+                    SET version = version + 1
+                    WHERE tid = %(tid)s
+                    RETURNING tid
+                )
+                SELECT EXISTS (SELECT 1 FROM versions)''',
+              {'pids': list(pids), 'tid': tid})
+    if not c.fetchone()[0]:
+        _createVersions(c, [tid])
+
+
+@_dispatch
+@_cached
+def playerStandings(tid=0, round=None):
     """Returns a list of the players and their point records, sorted by points
 
     The first entry in the list should be the player in first place, or a
     player tied for first place if there is currently a tie.
 
+    Standings after an earlier round are computed from the checkpoint of
+    standings, which startRound takes every SNAPSHOT_INTERVAL rounds, and
+    the results of the rounds after it. Results reported before the first
+    round started by startRound belong to round 0. Members appear with
+    zero results in the standings before the first checkpoint even if they
+    joined later.
+
     Args:
       tid: tournament ID (0 is default tournament)
+      round: number of the round to read the standings after (None for the
+        current standings)
 
     Returns:
       A list of tuples, each of which contains (id, name, points, matches):
@@ -111,75 +1856,68 @@ def playerStandings(tid=0):
         points: the number of points, which player earned.
         matches: the number of matches the player has played
     """
+    with Tournament() as session:
+        return session.playerStandings(tid, round)
 
-    conn = connect()
-    c = conn.cursor()
-
-    c.execute('''SELECT ps.player_id, Players.name, ps.points, ps.matches
-                FROM Players,
-                    (
-                        SELECT player_id,
-                                sum(points) as points,
-                                sum(matches) as matches
-                        FROM
-                            (
-                                SELECT player1 AS player_id,
-                                        sum(p1points) AS points,
-                                        count(player1) AS matches
-                                FROM Matches
-                                WHERE Matches.tournament = (%s)
-                                GROUP BY player_id
 
-                                UNION
+@_dispatch
+def iterStandings(tid=0, batchSize=STREAM_BATCH_SIZE):
+    """Yields the players and their point records in the order of
+    playerStandings, without loading all of them into memory at once.
 
-                                SELECT player2 AS player_id,
-                                        sum(p2points) AS points,
-                                        count(player2) AS matches
-                                FROM Matches
-                                WHERE Matches.tournament = (%s)
-                                GROUP BY player_id
-                            ) AS tmp
-                        GROUP BY player_id
-                    ) AS ps
-                WHERE ps.player_id = Players.pid
-                ORDER BY ps.points DESC;
-            ''', (tid, tid, ))
-    result_list = c.fetchall()  # standing without players with 0 games
-
-    c.execute('''SELECT TournamentMembers.pid, Players.name
-                FROM TournamentMembers, Players
-                WHERE TournamentMembers.tid = (%s)
-                AND TournamentMembers.pid = Players.pid
-        ''', (tid,))
-
-    members_list = c.fetchall()  # full list of players,
-                                 # registered in the tournament
-    conn.commit()
-    conn.close()
-
-    # Now we need to merge result_list and members_list to get full standings,
-    # including those players who has zero games
-
-    # if some members are not in current standing
-    # (so if we have any members with zero games)
-    if len(members_list) != len(result_list):
-        pid_list = []
-        for i in result_list:
-            pid_list.append(i[0])
-        for i in members_list:
-            if i[0] not in pid_list:
-                result_list.append((i[0], i[1], 0, 0))  # add players
-                                                        # with 0 games
-
-    return result_list
+    Rows are fetched through a server-side cursor, batchSize rows at a time.
+    The connection is held until the iteration ends (or the generator is
+    closed), all rows come from one snapshot of the standings.
+
+    Args:
+      tid: tournament ID (0 is default tournament)
+      batchSize: rows fetched from the server at a time
+
+    Returns:
+      An iterator of tuples (id, name, points, matches), see playerStandings.
+    """
+    with Tournament() as session:
+        for row in session.iterStandings(tid, batchSize):
+            yield row
+
+
+@_dispatch
+def standingsPage(tid=0, limit=STANDINGS_PAGE_SIZE, after=None, offset=0):
+    """Returns one page of the players and their point records in the order
+    of playerStandings.
+
+    Pages are continued from the last row of the previous page (keyset
+    pagination), so reading a page takes time and memory proportional to
+    the page size, however deep into the standings it is.
+
+    Args:
+      tid: tournament ID (0 is default tournament)
+      limit: maximum number of rows of the page (the top N for the first
+        page)
+      after: the last row (id, name, points, matches) of the previous page,
+        None for the first page
+      offset: rows to skip before the page. Skipped rows are still read, so
+        prefer after for deep pages
+
+    Returns:
+      A list of tuples (id, name, points, matches), see playerStandings.
+      A page shorter than limit is the last one.
+    """
+    with Tournament() as session:
+        return session.standingsPage(tid, limit, after, offset)
 
 
+@_dispatch
+@_cached
 def playerStandingsWithBye(tid=0):
     """Returns a list of the players and their point records, sorted by
         points, including points for "Bye" (skipped rounds)
 
     The first entry in the list should be the player in first place,
     or a player tied for first place if there is currently a tie.
+    In tournaments with rounds started by startRound the byes stored with
+    the rounds are counted, otherwise every match a player played less
+    than the maximum number of matches counts as a bye.
 
     Args:
       tid: tournament ID (0 is default tournament)
@@ -191,27 +1929,44 @@ def playerStandingsWithBye(tid=0):
         points: the number of points, which player earned.
         matches: the number of matches the player has played
     """
-    ps = playerStandings(tid)  # get standings without Byes
-    result = []
+    with Tournament() as session:
+        return session.playerStandingsWithBye(tid)
 
-    # find maximum number of matches (usually number of rounds)
-    maxMatches = 0
-    for i in ps:
-        if i[3] > maxMatches:
-            maxMatches = i[3]
 
-    # find maximum number of matches (usually number of rounds)
-    for i in ps:
-        if i[3] == maxMatches:  # if player played in all rounds
-            result.append(i)    # do not modify original standings
-        else:
-            # add points for every skipped round:
-            addBye = (maxMatches - i[3]) * POINTS_FOR_BYE
-            # add modified player information to standings:
-            result.append((i[0], i[1], i[2] + addBye, i[3]))
-    return result
+@_dispatch
+@_cached
+def playerStandingsWithTiebreaks(tid=0):
+    """Returns a list of the players and their point records, sorted by
+        points (including points for "Bye"), then by tiebreaks
+
+    Tiebreaks are computed from the matches of the tournament, a bye
+    (skipped round) adds to the points of the player as in
+    playerStandingsWithBye, but it is not a game, so it does not count in
+    tiebreaks of the player. Opponents' points include their byes.
+
+    Args:
+      tid: tournament ID (0 is default tournament)
+
+    Returns:
+      A list of tuples, each of which contains (id, name, points, matches,
+      buchholz, sonnebornBerger, omw):
+        id: the player's unique id (assigned by the database)
+        name: the player's full name (as registered)
+        points: the number of points including points for "Bye"
+        matches: the number of matches the player has played
+        buchholz: sum of points of all opponents
+        sonnebornBerger: sum of points of opponents, the player has won
+          against, and the part of points of opponents corresponding to
+          draws (points for the game divided by POINTS_FOR_WIN)
+        omw: average match-win percentage of opponents (points divided by
+          the points for winning every round), at least
+          MIN_MATCH_WIN_PERCENT for every opponent
+    """
+    with Tournament() as session:
+        return session.playerStandingsWithTiebreaks(tid)
 
 
+@_dispatch
 def reportMatch(winner, loser, isDraw=False, tid=0):
     """Records the outcome of a single match between two players.
 
@@ -221,28 +1976,487 @@ def reportMatch(winner, loser, isDraw=False, tid=0):
       isDraw: True in case of draw (tie) (False by default to be
         compatible with default tests)
       tid: tournament ID (0 is default tournament)
+
+    Returns:
+      The id of the recorded match. With buffered reporting (see
+      configureReportBuffer) it is returned when the result is committed
+      with its batch.
+
+    Raises:
+      psycopg2.IntegrityError: the players already have a result in the
+        last started round (e.g. reported by the other scorekeeper)
     """
+    buffer = _reportBuffer
+    if buffer is not None:
+        return buffer.submit(tid, winner, loser, isDraw).result()
+    return reportMatches([(winner, loser, isDraw)], tid)[0]
 
-    conn = connect()
-    c = conn.cursor()
 
+def queueMatch(winner, loser, isDraw=False, tid=0):
+    """Records the outcome of a single match without waiting for it.
+
+    With buffered reporting (see configureReportBuffer) the result is
+    queued, otherwise it is recorded by reportMatch at once.
+
+    Args:
+      winner, loser, isDraw, tid: see reportMatch
+
+    Returns:
+      A ReportTicket, whose result(timeout=None) waits until the result is
+      committed and returns the id of the match (or raises the error which
+      made it fail), and done() tells whether it has been written.
+    """
+    buffer = _reportBuffer
+    if buffer is not None and _backend is None:
+        return buffer.submit(tid, winner, loser, isDraw)
+    ticket = ReportTicket(tid)
+    try:
+        ticket._complete(reportMatch(winner, loser, isDraw, tid))
+    except Exception as e:
+        ticket._complete(e)
+    return ticket
+
+
+@_dispatch
+def reportMatches(results, tid=0):
+    """Records the outcomes of many matches in one transaction.
+
+    Either all results are recorded or (in case of an error) none of them.
+    A result of two players, who are paired in the last round started by
+    startRound and wait for their result, is linked to their pairing.
+
+    Args:
+      results: iterable of tuples (winner, loser) or (winner, loser, isDraw)
+        with the same meaning as arguments of reportMatch
+      tid: tournament ID (0 is default tournament)
+
+    Returns:
+      A list of ids of the recorded matches, in the order of results.
+    """
+    with Tournament() as session:
+        return session.reportMatches(results, tid)
+
+
+@_dispatch
+def correctMatch(mid, winner, loser, isDraw=False):
+    """Replaces the outcome of an already reported match.
+
+    The match stays in its tournament and round, standings and checkpoints
+    of standings of later rounds (see playerStandings) are corrected
+    accordingly.
+    Ratings keep the old result until recomputeRatings() is called.
+
+    Args:
+      mid: the id of the match (as returned by reportMatch)
+      winner:  the id number of the player who won/tied
+      loser:  the id number of the player who lost/tied
+      isDraw: True in case of draw (tie)
+    """
+    with Tournament() as session:
+        session.correctMatch(mid, winner, loser, isDraw)
+
+
+@_dispatch
+def deleteMatch(mid):
+    """Removes a single match record and takes it out of the standings
+    (and the checkpoints of standings of later rounds).
+
+    Ratings keep the result until recomputeRatings() is called. A pairing
+    of the last round, which the match was the result of, waits for a new
+    result.
+
+    Args:
+      mid: the id of the match (as returned by reportMatch)
+    """
+    with Tournament() as session:
+        session.deleteMatch(mid)
+
+
+@_dispatch
+def deleteTournament(tid):
+    """Removes all matches, members and standings of one tournament,
+    including its archive (see archiveTournament).
+
+    Players stay registered (they may play in other tournaments). If the
+    tables are partitioned by tournament (see tournament_partitions.sql),
+    the partitions of the tournament are truncated instead of deleting its
+    rows one by one.
+
+    Args:
+      tid: tournament ID
+    """
+    flushReports([tid])
+    with Tournament() as session:
+        session.deleteTournament(tid)
+
+
+@_dispatch
+def archiveTournament(tid):
+    """Moves all matches, members and standings of one tournament out of the
+    tables of live tournaments.
+
+    They are kept in tables archive.matches_t<tid>,
+    archive.tournamentmembers_t<tid> and archive.standings_t<tid> ("n"
+    stands for the minus sign of negative ids), without foreign keys, so
+    the players can still be deleted. If the tables are partitioned by
+    tournament, the partitions of the tournament are detached and become
+    these tables, so no row is copied or deleted. Then other processes,
+    which have written to the tournament before, can not write to it until
+    they are restarted (this process creates new partitions on the next
+    write).
+
+    Args:
+      tid: tournament ID
+
+    Raises:
+      ValueError: the tournament has no standings or is already archived
+    """
+    flushReports([tid])
+    with Tournament() as session:
+        session.archiveTournament(tid)
+
+
+@_dispatch
+def verifyStandings(tid=None):
+    """Compares Standings with the results recomputed from Matches.
+
+    Args:
+      tid: tournament ID to check (None checks all tournaments)
+
+    Returns:
+      A list of drifted rows, each of which is a tuple (tid, pid,
+      storedPoints, storedMatches, actualPoints, actualMatches). Stored
+      values are None if the row is missing in Standings, actual values are
+      None if the row should not exist. Empty list means no drift.
+    """
+    with Tournament() as session:
+        return session.verifyStandings(tid)
+
+
+@_dispatch
+def rebuildStandings(tid=None):
+    """Recomputes Standings from Matches and TournamentMembers.
+
+    Writers are blocked while the rebuild runs, so no result gets lost.
+
+    Args:
+      tid: tournament ID to rebuild (None rebuilds all tournaments)
+
+    Returns:
+      The drift which was found and fixed, in the format of verifyStandings.
+    """
+    with Tournament() as session:
+        return session.rebuildStandings(tid)
+
+
+def _isPartitioned(c):
+    """Returns whether the tables are partitioned by tournament, checked
+    with cursor c once per process."""
+    global _partitioned
+
+    if _partitioned is None:
+        c.execute(PARTITIONED_SQL)
+        _partitioned = c.fetchone()[0]
+    return _partitioned
+
+
+def _partitionNames(tid):
+    """Returns names of the partitions (and archived tables) of tournament
+    tid, in the order of PARTITIONED_TABLES."""
+    return ['{table}_t{tid}'.format(table=table,
+                                    tid=str(tid).replace('-', 'n'))
+            for table, column in PARTITIONED_TABLES]
+
+
+def _matchPoints(isDraw):
+    """Returns a tuple (winner's points, loser's points) for a result."""
     if isDraw:
-        p1points = POINTS_FOR_DRAW
-        p2points = POINTS_FOR_DRAW
-    else:
-        p1points = POINTS_FOR_WIN
-        p2points = 0
+        return POINTS_FOR_DRAW, POINTS_FOR_DRAW
+    return POINTS_FOR_WIN, 0
+
+
+def _resultRows(results, tid):
+    """Returns rows (player1, p1points, player2, p2points) of results
+    (winner, loser[, isDraw]) of tournament tid and dict deltas of the
+    standings they change, see _addStandingsDelta."""
+    rows = []
+    deltas = {}
+    for result in results:
+        if len(result) == 2:
+            winner, loser = result
+            isDraw = False
+        else:
+            winner, loser, isDraw = result
+        p1points, p2points = _matchPoints(isDraw)
+        rows.append((winner, p1points, loser, p2points))
+        _addStandingsDelta(deltas, tid, winner, p1points, 1)
+        _addStandingsDelta(deltas, tid, loser, p2points, 1)
+    return rows, deltas
+
 
-    c.execute('''INSERT INTO Matches (player1, p1points, player2,
-                                        p2points, tournament)
-             VALUES ((%s), (%s), (%s), (%s), (%s))''',
-             (winner, p1points, loser, p2points, tid,))
+def _addStandingsDelta(deltas, tid, pid, points, matches):
+    """Accumulates a change of player's standing in dict deltas."""
+    delta = deltas.setdefault((tid, pid), [0, 0])
+    delta[0] += points
+    delta[1] += matches
 
-    conn.commit()
-    conn.close()
 
+def _updateStandings(c, deltas):
+    """Applies accumulated standings changes using cursor c.
 
-def swissPairings(tid=0):
+    Args:
+      deltas: dict {(tid, pid): [points, matches]} of changes
+    """
+    # rows are updated in the same order by every writer, so concurrent
+    # reports can not deadlock on each other's Standings rows
+    rows = sorted((tid, pid, points, matches)
+                  for (tid, pid), (points, matches) in deltas.items()
+                  if points or matches)
+    if not rows:
+        return
+
+    updated = execute_values(c, '''UPDATE Standings
+                             SET points = Standings.points + d.points,
+                                 matches = Standings.matches + d.matches
+                             FROM (VALUES %s) AS d (tid, pid, points,
+                                                    matches)
+                             WHERE Standings.tid = d.tid
+                             AND Standings.pid = d.pid
+                             RETURNING Standings.tid, Standings.pid''',
+                             rows, page_size=BATCH_PAGE_SIZE, fetch=True)
+    if len(updated) < len(rows):
+        # players may play without being registered for the tournament
+        updated = set(updated)
+        _insertStandings(c, [row for row in rows
+                             if tuple(row[:2]) not in updated])
+
+
+def _insertStandings(c, rows):
+    """Inserts Standings rows of players, who do not have them yet, with
+    their first changes using cursor c.
+
+    Concurrent first writes of the standings of a player wait for each
+    other's advisory lock, so the later one updates the row of the earlier
+    one instead of failing on its primary key.
+
+    Args:
+      rows: list of (tid, pid, points, matches)
+    """
+    _lockKeys(c, _STANDINGS_LOCK, [row[1] for row in rows])
+    execute_values(c, INSERT_STANDINGS_SQL, sorted(rows),
+                   page_size=BATCH_PAGE_SIZE)
+
+
+def _rebuildStandings(c, tid=None):
+    """Replaces Standings of tournament tid (or all) by recomputed rows."""
+    c.execute('''DELETE FROM Standings
+                WHERE (%(tid)s IS NULL OR tid = %(tid)s)''', {'tid': tid})
+    c.execute('''INSERT INTO Standings (tid, pid, points, matches, byes)
+                ''' + _ACTUAL_STANDINGS_SQL, {'tid': tid})
+
+
+def _lastRound(c, tid):
+    """Returns the number of the last started round of tournament tid, 0 if
+    it has no stored rounds."""
+    c.execute("SELECT coalesce(max(round), 0) FROM Rounds WHERE tid = (%s)",
+              (tid,))
+    return c.fetchone()[0]
+
+
+def _updateSnapshots(c, tid, round, deltas):
+    """Applies accumulated standings changes of a result of round round of
+    tournament tid to the checkpoints of this and later rounds (earlier
+    checkpoints do not include the result).
+
+    Args:
+      deltas: dict {(tid, pid): [points, matches]} of changes
+    """
+    rows = sorted((tid, round, pid, points, matches)
+                  for (t, pid), (points, matches) in deltas.items()
+                  if points or matches)
+    if not rows:
+        return
+
+    c.execute('''INSERT INTO StandingsSnapshots (tid, round, pid)
+                SELECT Rounds.tid, Rounds.round, new.pid
+                FROM Rounds, unnest(%(pids)s::integer[]) AS new (pid)
+                WHERE Rounds.tid = %(tid)s
+                AND Rounds.round >= %(round)s
+                AND Rounds.snapshot
+                AND NOT EXISTS (SELECT 1
+                                FROM StandingsSnapshots
+                                WHERE StandingsSnapshots.tid = Rounds.tid
+                                AND StandingsSnapshots.round = Rounds.round
+                                AND StandingsSnapshots.pid = new.pid)''',
+              {'tid': tid, 'round': round, 'pids': [row[2] for row in rows]})
+    execute_values(c, '''UPDATE StandingsSnapshots
+                   SET points = StandingsSnapshots.points + d.points,
+                       matches = StandingsSnapshots.matches + d.matches
+                   FROM (VALUES %s) AS d (tid, round, pid, points, matches)
+                   WHERE StandingsSnapshots.tid = d.tid
+                   AND StandingsSnapshots.round >= d.round
+                   AND StandingsSnapshots.pid = d.pid''',
+                   rows, page_size=BATCH_PAGE_SIZE)
+
+
+def _deleteRounds(c, tid):
+    """Deletes stored rounds, pairings and checkpoints of tournament tid."""
+    c.execute("DELETE FROM StandingsSnapshots WHERE tid = (%s)", (tid,))
+    c.execute("DELETE FROM Pairings WHERE tid = (%s)", (tid,))
+    c.execute("DELETE FROM Rounds WHERE tid = (%s)", (tid,))
+
+
+def _insertPlayerResults(c, tid, mid, player1, p1points, player2, p2points):
+    """Adds the rows of both players of match mid to PlayerResults."""
+    c.execute('''INSERT INTO PlayerResults (pid, opponent, mid, tid, points,
+                                          opponentPoints)
+                VALUES (%(player1)s, %(player2)s, %(mid)s, %(tid)s,
+                        %(p1points)s, %(p2points)s),
+                       (%(player2)s, %(player1)s, %(mid)s, %(tid)s,
+                        %(p2points)s, %(p1points)s)''',
+              {'tid': tid, 'mid': mid, 'player1': player1,
+               'p1points': p1points, 'player2': player2,
+               'p2points': p2points})
+
+
+def _deletePlayerResults(c, mid, player1, player2):
+    """Removes the rows of both players of match mid from PlayerResults."""
+    c.execute('''DELETE FROM PlayerResults
+                WHERE (pid, opponent) IN ((%(player1)s, %(player2)s),
+                                          (%(player2)s, %(player1)s))
+                AND mid = %(mid)s''',
+              {'mid': mid, 'player1': player1, 'player2': player2})
+
+
+def _careerRecord(history):
+    """Returns (matches, wins, draws, losses, points, tournaments) summed up
+    from the rows of playerHistory."""
+    return tuple(sum(row[i] for row in history)
+                 for i in range(1, 6)) + (len(history),)
+
+
+def _updateRatings(c, matches, ratings):
+    """Applies results of matches to Ratings using cursor c.
+
+    Args:
+      matches: list of (player1, p1points, player2, p2points), in the order
+        they were reported
+      ratings: dict {pid: (rating, games)} of the players of matches, whose
+        rows are locked (FOR UPDATE) in the order of pids, like Standings
+        rows, so concurrent reports can not deadlock on each other's ratings
+    """
+    pids = sorted(set([row[0] for row in matches] +
+                      [row[2] for row in matches]))
+    missing = [pid for pid in pids if pid not in ratings]
+    if missing:
+        # first matches of players, a concurrent first match of the same
+        # player may have added the row since ratings were read
+        _lockKeys(c, _RATINGS_LOCK, missing)
+        c.execute(LOCK_RATINGS_SQL, (missing,))
+        ratings.update((pid, (rating, games))
+                       for pid, rating, games in c.fetchall())
+    updateRatings(ratings, matches)
+    execute_values(c, WRITE_RATINGS_SQL,
+                   [(pid,) + ratings[pid] for pid in pids],
+                   page_size=BATCH_PAGE_SIZE)
+
+
+@_dispatch
+def playerRatings(tid=0):
+    """Returns the members of a tournament sorted by their Elo rating.
+
+    Ratings belong to players, not tournaments: they are updated by every
+    reported match of any tournament (see tournament_ratings.py). Players
+    who have not played yet have the initial rating.
+
+    Args:
+      tid: tournament ID (0 is default tournament)
+
+    Returns:
+      A list of tuples (id, name, rating, games), the highest rating first.
+        rating: the player's rating (float)
+        games: the number of rated matches the player has played
+    """
+    with Tournament() as session:
+        return session.playerRatings(tid)
+
+
+@_dispatch
+def recomputeRatings():
+    """Recomputes ratings of all players from the whole match history.
+
+    Matches are replayed in the order they were reported with NumPy (see
+    tournament_ratings.replayRatings), which takes seconds for a million
+    matches. Use it after bulk imports, corrections and deletions of
+    matches. Archived tournaments are not replayed. Writers are blocked while
+    the ratings are recomputed.
+
+    Returns:
+      The number of rated players.
+    """
+    with Tournament() as session:
+        return session.recomputeRatings()
+
+
+@_dispatch
+def playerCareer(pid):
+    """Returns the record of a player over all tournaments.
+
+    Records are read from the results of the player in PlayerResults, so
+    they take milliseconds also for players with thousands of matches. A
+    match is won, drawn or lost by the player if they got more, as many or
+    fewer points than the opponent. Archived tournaments are not counted.
+
+    Args:
+      pid: the player's id
+
+    Returns:
+      A tuple (matches, wins, draws, losses, points, tournaments):
+        matches: the number of matches the player has played
+        wins, draws, losses: the numbers of matches won, drawn and lost
+        points: the number of points the player earned in them
+        tournaments: the number of tournaments the player has played in
+    """
+    with Tournament() as session:
+        return session.playerCareer(pid)
+
+
+@_dispatch
+def playerHistory(pid):
+    """Returns the record of a player in every tournament, see playerCareer.
+
+    Args:
+      pid: the player's id
+
+    Returns:
+      A list of tuples (tid, matches, wins, draws, losses, points), one for
+      every tournament the player has played in, by tid.
+    """
+    with Tournament() as session:
+        return session.playerHistory(pid)
+
+
+@_dispatch
+def headToHead(pid, opponent):
+    """Returns the record of a player against another one over all
+    tournaments, see playerCareer.
+
+    Args:
+      pid: the player's id
+      opponent: id of the other player
+
+    Returns:
+      A tuple (matches, wins, draws, losses, points, opponentPoints) from
+      the view of the player: the numbers of their matches, of the matches
+      pid won, drew and lost, and the points of both players in them.
+    """
+    with Tournament() as session:
+        return session.headToHead(pid, opponent)
+
+
+@_dispatch
+def swissPairings(tid=0, mode=PAIRING_GREEDY, timeBudget=PAIRING_TIME_BUDGET,
+                  seeded=False):
     """Returns a list of pairs of players for the next round of a match.
 
     Each player appears no more than once in the pairings. Each player is
@@ -250,8 +2464,21 @@ def swissPairings(tid=0):
     that is, a player adjacent to him or her in the standings. In case of
     odd number - one player will not be paired
 
+    Nothing is stored, see startRound. While the last round started by
+    startRound waits for results, its stored pairings are returned, so the
+    round is paired once. In tournaments with stored rounds
+    PAIRING_OPTIMAL gives the bye by the stored byes.
+
     Args:
       tid: tournament ID (0 is default tournament)
+      mode: PAIRING_GREEDY pairs players one by one with the nearest player
+        they have not played yet. PAIRING_OPTIMAL pairs whole score groups
+        to avoid rematches and repeated byes (see tournament_pairing.py)
+      timeBudget: seconds PAIRING_OPTIMAL may spend before it falls back to
+        greedy pairing (None for no limit)
+      seeded: True orders players of equal points by rating and pairs the
+        upper half of every score group against the lower half (see
+        tournament_pairing.seededStanding), e.g. the first round by rating
 
     Returns:
       A list of tuples, each of which contains (id1, name1, id2, name2)
@@ -260,98 +2487,163 @@ def swissPairings(tid=0):
         id2: the second player's unique id
         name2: the second player's name
     """
-    def findPair(standing, pairs, index):
-        """
-        Finds pair for person standing[index]. Returns index of his best pair
+    flushReports([tid])
+    if seeded:
+        # ratings change with matches of other tournaments, which do not
+        # invalidate cached results of this one, so these are not cached
+        with Tournament() as session:
+            return session.swissPairings(tid, mode, timeBudget, seeded)
+    return _cachedPairings(tid, mode, timeBudget)
+
+
+@_cached
+def _cachedPairings(tid, mode, timeBudget):
+    """Unseeded swissPairings, served from the cache if it is enabled."""
+    with Tournament() as session:
+        return session.swissPairings(tid, mode, timeBudget)
+
+
+@_dispatch
+def startRound(tid=0, mode=PAIRING_GREEDY, timeBudget=PAIRING_TIME_BUDGET,
+               seeded=False):
+    """Pairs the next round of a tournament and stores it.
+
+    Pairings and the bye of the round are stored in Rounds and Pairings and
+    the bye is counted in the standings of the player, all in one
+    transaction. Results reported by reportMatch are linked to the
+    pairings. Until all of them are reported, startRound and swissPairings
+    return the stored round instead of pairing a new one, so a repeated call
+    does not pair the round twice.
 
-        Args:
-          standing: tournament table, containing unpaired playerStandings
-          pairs: list of tuples with id's of players who previously played
-                against each other
-          index: position of player in standing for whom the pair is searching
+    Args:
+      tid: tournament ID (0 is default tournament)
+      mode, timeBudget, seeded: see swissPairings
 
-        Returns:
-          index of the player, who is the best pair
-        """
-        numOfPlayers = len(standing)
-        if numOfPlayers < 2:
-            return -1
-
-        for i in range(1, len(standing)):
-            curr = standing[index][0]
-            # check that we are still in the boundaries of our standing:
-            if index + i < numOfPlayers:
-                next = standing[index+i][0]
-                # check that this players didn't play against
-                # each other previously:
-                if (curr, next) not in pairs and (next, curr) not in pairs:
-                    return index + i
-            # check that we are still in the boundaries of our standing:
-            if index - i >= 0:
-                prev = standing[index-i][0]
-                # check that this players didn't play against
-                # each other previously:
-                if (curr, prev) not in pairs and (prev, curr) not in pairs:
-                    return index - i
-
-        # in case player previously played with all possible partners,
-        # we choose simply adjacent
-        if index + 1 == numOfPlayers:
-            return index - 1
-        else:
-            return index + 1
-
-    def checkLowNumOfMatches(standing, max):
-        '''
-        Checks, is there any player with number of matches lower then
-        maximum number of matches any of players has played. It is needed to
-        ensure, that those players, who skipped round, will be paired first.
-        So nobody will skip round twice, until all skip round at least once.
-
-        Args:
-          standing: tournament table, containing unpaired playerStandings
-          max: logically - current number of played rounds in the tournament.
-            In fact - the maximum number of matches, any of players has played
-
-        Returns:
-          index of the first player, who played less than maximum
-        '''
-        for i in range(len(standing)):
-            if standing[i][3] < max:
-                return i
-        return -1
-
-    standing = playerStandings(tid)
+    Returns:
+      A tuple (round, pairings, bye):
+        round: number of the round, from 1
+        pairings: list of (id1, name1, id2, name2), see swissPairings
+        bye: id of the player, who is not paired, or None
 
-    conn = connect()
-    c = conn.cursor()
+    Raises:
+      ValueError: the tournament has no players
+    """
+    flushReports([tid])
+    with Tournament() as session:
+        return session.startRound(tid, mode, timeBudget, seeded)
 
-    c.execute('''SELECT player1, player2
-                FROM Matches
-                WHERE tournament = (%s)''', (tid,))
 
-    pairs = c.fetchall()  # get previously played matches for better pairing
+@_dispatch
+def roundPairings(tid=0, round=None):
+    """Returns the stored pairings of a round started by startRound.
 
-    final_pairs = []
+    Args:
+      tid: tournament ID (0 is default tournament)
+      round: number of the round (None for the last one)
 
-    # Check, if any players with lower number of matches.
-    # If exists - find pair for him first
-    maxMatches = 0
-    for i in standing:
-        if i[3] > maxMatches:
-            maxMatches = i[3]
+    Returns:
+      A list of tuples (id1, name1, id2, name2, mid) by board, where mid is
+      the id of the reported match or None. The bye is the last tuple, with
+      id2, name2 and mid None. Empty list if there is no such round.
+    """
+    with Tournament() as session:
+        return session.roundPairings(tid, round)
 
-    while len(standing) > 1:
-        low = checkLowNumOfMatches(standing, maxMatches)
-        if low == -1:  # if there is no player with number matches lower
-            low = 0    # than other, than sstart with the first player
-        pair = findPair(standing, pairs, low)
-        final_pairs.append((standing[low][0], standing[low][1],
-                            standing[pair][0], standing[pair][1]))
-        standing.pop(max(low, pair))  # remove paired players from temporary
-        standing.pop(min(low, pair))  # standing to avoid double-pairing
 
-    conn.commit()
-    conn.close()
+@_dispatch
+def pairingQuality(pairings, tid=0):
+    """Measures the quality of pairings for the next round of a tournament.
 
-    return final_pairs
+    Args:
+      pairings: list of (id1, name1, id2, name2) as returned by swissPairings
+      tid: tournament ID (0 is default tournament)
+
+    Returns:
+      A dict with pairs, rematches (number of pairs who already played each
+      other), totalScoreGap and maxScoreGap (difference of points within
+      pairs), byes (ids of unpaired players) and repeatedByes (how many of
+      them already had a bye).
+    """
+    with Tournament() as session:
+        return session.pairingQuality(pairings, tid)
+
+
+@_dispatch
+def swissPairingsBatch(tids, mode=PAIRING_GREEDY,
+                       timeBudget=PAIRING_TIME_BUDGET,
+                       processes=PAIRING_PROCESSES):
+    """Pairs the next round of many tournaments at once.
+
+    Standings and match history of all tournaments are loaded by two queries
+    over one connection, then the tournaments are paired in parallel by a
+    pool of worker processes. A tournament which fails to be paired does not
+    fail the others, its error is reported instead.
+
+    Args:
+      tids: iterable of tournament IDs
+      mode: pairing mode, see swissPairings
+      timeBudget: seconds PAIRING_OPTIMAL may spend on every tournament
+      processes: number of worker processes (None means one per CPU, 1 pairs
+        all tournaments in this process)
+
+    Returns:
+      A tuple (pairings, report):
+        pairings: dict {tid: list of (id1, name1, id2, name2)} with pairings
+          of every tournament, which was paired successfully
+        report: dict {tid: dict} with players (number of players in the
+          standings), pairs, seconds (time spent pairing the tournament) and
+          error (None, or the error which made the pairing fail)
+    """
+    tids = list(tids)
+    flushReports(tids)
+    with Tournament() as session:
+        return session.swissPairingsBatch(tids, mode, timeBudget,
+                                          processes)
+
+
+def _runPairingJobs(jobs, processes):
+    """Runs _pairingJob for every job, in worker processes if there are more
+    jobs and processes. Returns (pairings, report) of swissPairingsBatch."""
+    if processes == 1 or len(jobs) < 2:
+        results = [_pairingJob(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_pairingJob, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    pairings = {}
+    report = {}
+    for tid, pairs, stats in results:
+        if pairs is not None:
+            pairings[tid] = pairs
+        report[tid] = stats
+    return pairings, report
+
+
+def _pairingJob(job):
+    """Pairs one tournament of swissPairingsBatch, runs in worker processes.
+
+    Args:
+      job: tuple (tid, standing, matches, byes, mode, timeBudget), where
+        matches is a list of (player1, player2) of the tournament and byes
+        the stored byes (None derives them from the standings)
+
+    Returns:
+      A tuple (tid, pairings or None if pairing failed, report of the tid).
+    """
+    tid, standing, matches, byes, mode, timeBudget = job
+    start = time.time()
+    try:
+        pairs = pairRound(standing, opponentSets(matches), mode, timeBudget,
+                          byes)
+        error = None
+    except Exception as e:
+        pairs = None
+        error = "{name}: {message}".format(name=type(e).__name__, message=e)
+    return tid, pairs, {'players': len(standing),
+                        'pairs': len(pairs) if pairs is not None else 0,
+                        'seconds': time.time() - start,
+                        'error': error}
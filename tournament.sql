@@ -1,6 +1,11 @@
 -- Table definitions for the tournament project.
+--
+-- This script creates a new, empty database. To upgrade an existing database
+-- in place use "python tournament_admin.py migrate" instead. To partition
+-- tables by tournament apply tournament_partitions.sql afterwards with
+-- "python tournament_admin.py partition" (PostgreSQL 11 or newer).
 
-DROP DATABASE tournament;
+DROP DATABASE IF EXISTS tournament;
 CREATE DATABASE tournament;
 
 \c tournament;
@@ -8,6 +13,9 @@ CREATE DATABASE tournament;
 DROP TABLE IF EXISTS Players CASCADE;
 DROP TABLE IF EXISTS Matches CASCADE;
 DROP TABLE IF EXISTS TournamentMembers CASCADE;
+DROP TABLE IF EXISTS SchemaMigrations CASCADE;
+
+-- Baseline schema (version 0)
 
 CREATE TABLE Players (
 	pid		serial PRIMARY KEY,
@@ -28,3 +36,59 @@ CREATE TABLE Matches (
 	p2points	integer,
 	tournament	integer
 );
+
+-- Migrations applied to this database (see tournament_migrate.py)
+CREATE TABLE SchemaMigrations (
+	version		integer PRIMARY KEY,
+	name		text NOT NULL,
+	applied		timestamp NOT NULL DEFAULT now()
+);
+
+-- Every migration from the migrations directory, in order
+
+\ir migrations/001_standings.sql
+INSERT INTO SchemaMigrations (version, name) VALUES (1, '001_standings.sql');
+
+\ir migrations/002_matches_tournament_index.sql
+INSERT INTO SchemaMigrations (version, name)
+	VALUES (2, '002_matches_tournament_index.sql');
+
+\ir migrations/003_standings_order_index.sql
+INSERT INTO SchemaMigrations (version, name)
+	VALUES (3, '003_standings_order_index.sql');
+
+\ir migrations/004_tournament_versions.sql
+INSERT INTO SchemaMigrations (version, name)
+	VALUES (4, '004_tournament_versions.sql');
+
+\ir migrations/005_standings_rank_index.sql
+INSERT INTO SchemaMigrations (version, name)
+	VALUES (5, '005_standings_rank_index.sql');
+
+\ir migrations/006_archive_schema.sql
+INSERT INTO SchemaMigrations (version, name)
+	VALUES (6, '006_archive_schema.sql');
+
+\ir migrations/007_ratings.sql
+INSERT INTO SchemaMigrations (version, name)
+	VALUES (7, '007_ratings.sql');
+
+\ir migrations/008_import_steps.sql
+INSERT INTO SchemaMigrations (version, name)
+	VALUES (8, '008_import_steps.sql');
+
+\ir migrations/009_rounds.sql
+INSERT INTO SchemaMigrations (version, name)
+	VALUES (9, '009_rounds.sql');
+
+\ir migrations/010_round_snapshots.sql
+INSERT INTO SchemaMigrations (version, name)
+	VALUES (10, '010_round_snapshots.sql');
+
+\ir migrations/011_round_results.sql
+INSERT INTO SchemaMigrations (version, name)
+	VALUES (11, '011_round_results.sql');
+
+\ir migrations/012_player_results.sql
+INSERT INTO SchemaMigrations (version, name)
+	VALUES (12, '012_player_results.sql');
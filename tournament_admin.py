@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+#
+# tournament_admin.py -- maintenance commands for the tournament database
+#
+# Usage:
+#   python tournament_admin.py verify-standings [--tid TID]
+#   python tournament_admin.py rebuild-standings [--tid TID]
+#   python tournament_admin.py migrate [--target VERSION]
+#   python tournament_admin.py schema-version
+#   python tournament_admin.py check-plans [--tournaments N] [--players N]
+#                                          [--rounds N]
+#   python tournament_admin.py partition
+#   python tournament_admin.py archive-tournament TID
+#   python tournament_admin.py delete-tournament TID
+#   python tournament_admin.py recompute-ratings
+#   python tournament_admin.py export-history DIR [--tid TID ...]
+#   python tournament_admin.py import-history DIR [--job NAME]
+#                                             [--map OLD:NEW ...]
+#   python tournament_admin.py export-standings [--tid TID] [--format FORMAT]
+#                                               [--output FILE]
+#
+
+import argparse
+import sys
+
+import tournament
+import tournament_migrate
+import tournament_transfer
+
+
+def printDrift(drift):
+    """Prints rows returned by verifyStandings, one line per row."""
+    for tid, pid, points, matches, actualPoints, actualMatches in drift:
+        print("tid=%s pid=%s stored=(%s points, %s matches) "
+              "actual=(%s points, %s matches)" %
+              (tid, pid, points, matches, actualPoints, actualMatches))
+
+
+def verifyStandings(args):
+    """Reports drift between Standings and Matches. Exit code 1 if any."""
+    drift = tournament.verifyStandings(args.tid)
+    printDrift(drift)
+    print("%d drifted standings rows" % len(drift))
+    return 1 if drift else 0
+
+
+def rebuildStandings(args):
+    """Recomputes Standings from Matches and reports what was fixed."""
+    drift = tournament.rebuildStandings(args.tid)
+    printDrift(drift)
+    print("%d standings rows fixed" % len(drift))
+    return 0
+
+
+def migrate(args):
+    """Applies pending schema migrations."""
+    for name in tournament_migrate.migrate(args.target):
+        print("applied %s" % name)
+    print("schema version %d" % tournament_migrate.schemaVersion())
+    return 0
+
+
+def schemaVersion(args):
+    """Prints applied and latest available schema versions."""
+    available = tournament_migrate.availableMigrations()
+    latest = available[-1][0] if available else 0
+    print("schema version %d (latest %d)" %
+          (tournament_migrate.schemaVersion(), latest))
+    return 0
+
+
+def checkPlans(args):
+    """Fails (exit code 1) if hot queries use sequential scans."""
+    problems = tournament_migrate.checkQueryPlans(args.tournaments,
+                                                  args.players, args.rounds)
+    for name, nodeType, table in problems:
+        print("%s: %s on %s" % (name, nodeType, table))
+    print("%d plan problems" % len(problems))
+    return 1 if problems else 0
+
+
+def partition(args):
+    """Partitions tables by tournament (PostgreSQL 11 or newer)."""
+    if tournament_migrate.partitionTables():
+        print("tables are partitioned by tournament")
+    else:
+        print("tables were already partitioned by tournament")
+    return 0
+
+
+def archiveTournament(args):
+    """Moves one tournament to the archive schema."""
+    tournament.archiveTournament(args.tid)
+    print("tournament %d archived" % args.tid)
+    return 0
+
+
+def deleteTournament(args):
+    """Removes matches, members and standings of one tournament."""
+    tournament.deleteTournament(args.tid)
+    print("tournament %d deleted" % args.tid)
+    return 0
+
+
+def recomputeRatings(args):
+    """Recomputes ratings of all players from the match history."""
+    count = tournament.recomputeRatings()
+    print("%d players rated" % count)
+    return 0
+
+
+def printTransfer(report):
+    """Prints stats of exportHistory / importHistory, one line per step."""
+    for name in (tournament_transfer.PLAYERS_FILE,
+                 tournament_transfer.MEMBERS_FILE,
+                 tournament_transfer.MATCHES_FILE):
+        stats = report[name]
+        print("%s: %d rows in %.3f s (%s rows/s)%s" %
+              (name, stats['rows'], stats['seconds'],
+               "%.0f" % stats['rowsPerSecond']
+               if stats['rowsPerSecond'] is not None else "-",
+               " (done before)" if stats.get('resumed') else ""))
+
+
+def exportHistory(args):
+    """Exports players, members and matches to CSV files."""
+    printTransfer(tournament_transfer.exportHistory(args.directory,
+                                                    args.tid))
+    return 0
+
+
+def importHistory(args):
+    """Imports files written by export-history, resumes a failed import."""
+    tids = dict(tuple(int(tid) for tid in pair.split(':'))
+                for pair in args.map)
+    printTransfer(tournament_transfer.importHistory(args.directory, args.job,
+                                                    tids))
+    return 0
+
+
+def exportStandings(args):
+    """Writes standings of one tournament as CSV or JSON lines."""
+    if args.output is None:
+        stats = tournament_transfer.exportStandings(sys.stdout, args.tid,
+                                                    args.format)
+    else:
+        with open(args.output, 'w') as f:
+            stats = tournament_transfer.exportStandings(f, args.tid,
+                                                        args.format)
+    sys.stderr.write("%d rows in %.3f s\n" % (stats['rows'],
+                                              stats['seconds']))
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Maintenance commands for the tournament database")
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser(
+        'verify-standings',
+        help="compare Standings with results recomputed from Matches")
+    command.add_argument('--tid', type=int, default=None,
+                         help="tournament ID (all tournaments by default)")
+    command.set_defaults(handler=verifyStandings)
+
+    command = commands.add_parser(
+        'rebuild-standings',
+        help="recompute Standings from Matches and report the drift")
+    command.add_argument('--tid', type=int, default=None,
+                         help="tournament ID (all tournaments by default)")
+    command.set_defaults(handler=rebuildStandings)
+
+    command = commands.add_parser(
+        'migrate', help="upgrade the database schema in place")
+    command.add_argument('--target', type=int, default=None,
+                         help="version to upgrade to (latest by default)")
+    command.set_defaults(handler=migrate)
+
+    command = commands.add_parser(
+        'schema-version', help="print the schema version of the database")
+    command.set_defaults(handler=schemaVersion)
+
+    command = commands.add_parser(
+        'check-plans',
+        help="fail if standings or pairing queries use sequential scans")
+    command.add_argument('--tournaments', type=int, default=1000,
+                         help="number of synthetic tournaments")
+    command.add_argument('--players', type=int, default=64,
+                         help="number of players in every tournament")
+    command.add_argument('--rounds', type=int, default=6,
+                         help="number of played rounds in every tournament")
+    command.set_defaults(handler=checkPlans)
+
+    command = commands.add_parser(
+        'partition',
+        help="partition Matches, TournamentMembers and Standings by "
+             "tournament")
+    command.set_defaults(handler=partition)
+
+    command = commands.add_parser(
+        'archive-tournament',
+        help="move a tournament out of the tables of live tournaments")
+    command.add_argument('tid', type=int, help="tournament ID")
+    command.set_defaults(handler=archiveTournament)
+
+    command = commands.add_parser(
+        'delete-tournament',
+        help="remove matches, members and standings of a tournament")
+    command.add_argument('tid', type=int, help="tournament ID")
+    command.set_defaults(handler=deleteTournament)
+
+    command = commands.add_parser(
+        'recompute-ratings',
+        help="recompute ratings of all players from all matches")
+    command.set_defaults(handler=recomputeRatings)
+
+    command = commands.add_parser(
+        'export-history',
+        help="export players, tournament members and matches to CSV files")
+    command.add_argument('directory', help="existing directory for the files")
+    command.add_argument('--tid', type=int, action='append', default=None,
+                         help="tournament ID to export (repeatable, all "
+                              "tournaments by default)")
+    command.set_defaults(handler=exportHistory)
+
+    command = commands.add_parser(
+        'import-history',
+        help="import files written by export-history with new ids")
+    command.add_argument('directory', help="directory with the files")
+    command.add_argument('--job', default=None,
+                         help="name of the import, to resume it after a "
+                              "failure (the directory by default)")
+    command.add_argument('--map', action='append', default=[],
+                         metavar='OLD:NEW',
+                         help="import tournament OLD as NEW (repeatable)")
+    command.set_defaults(handler=importHistory)
+
+    command = commands.add_parser(
+        'export-standings',
+        help="write standings with bye points as CSV or JSON lines")
+    command.add_argument('--tid', type=int, default=0,
+                         help="tournament ID (0 by default)")
+    command.add_argument('--format', default=tournament_transfer.FORMAT_CSV,
+                         choices=[tournament_transfer.FORMAT_CSV,
+                                  tournament_transfer.FORMAT_NDJSON])
+    command.add_argument('--output', default=None,
+                         help="file to write (standard output by default)")
+    command.set_defaults(handler=exportStandings)
+
+    args = parser.parse_args(argv)
+    return args.handler(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
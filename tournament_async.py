@@ -0,0 +1,828 @@
+#!/usr/bin/env python3
+#
+# tournament_async.py -- asyncio interface of tournament.py
+#
+# Coroutine functions with the names, arguments and results of the module
+# functions of tournament.py, for applications which run an asyncio event
+# loop (Python 3.7+):
+#
+#     standings = await tournament_async.playerStandings(tid)
+#
+# Waiting for the database does not block the loop: connections are opened
+# in the asynchronous mode of psycopg2 and the loop watches their sockets
+# (add_reader, add_writer) while PostgreSQL works. They are kept in a pool
+# of their own, see configurePool. Pairing is CPU-bound and runs in an
+# executor, see configurePairingExecutor. Functions which have no coroutine
+# of their own (maintenance and round management, e.g. startRound) run the
+# function of tournament.py in the default executor of the loop.
+#
+# The backend, cache and metrics of tournament.py are shared: with another
+# backend than PostgreSQL its methods are called directly, reads are served
+# from and writes invalidate the same cache, and calls are measured under
+# the names of the module functions.
+#
+
+import asyncio
+import collections
+import functools
+import time
+from contextlib import asynccontextmanager
+from timeit import default_timer as timer
+
+import psycopg2
+from psycopg2.extensions import POLL_OK, POLL_READ, POLL_WRITE, encodings
+
+import tournament
+from tournament_metrics import (KIND_CHECKOUT, KIND_CONNECT, KIND_FUNCTION,
+                                KIND_PAIRING)
+from tournament_pairing import (PAIRING_GREEDY, opponentSets, pairRound,
+                                seededStanding)
+from tournament_pool import PoolError
+from tournament_ratings import INITIAL_RATING, updateRatings
+
+# Default configuration of the pool of asynchronous connections, see
+# configurePool()
+POOL_MIN_SIZE = 1
+POOL_MAX_SIZE = 10
+POOL_IDLE_TIMEOUT = 300     # seconds
+POOL_CHECKOUT_TIMEOUT = 30  # seconds
+
+_pool = None  # created by the first call in an event loop
+_poolOptions = {'minSize': POOL_MIN_SIZE, 'maxSize': POOL_MAX_SIZE,
+                'idleTimeout': POOL_IDLE_TIMEOUT,
+                'checkoutTimeout': POOL_CHECKOUT_TIMEOUT}
+_pairingExecutor = None  # None: the default executor of the loop
+
+
+class AsyncConnection(object):
+    """A psycopg2 connection in asynchronous mode, whose statements are
+    awaited on the running event loop.
+
+    Every statement is committed on its own, unless it runs in a
+    transaction() block. A connection is used by one coroutine at a time.
+    If waiting for a statement is interrupted (e.g. its task is cancelled)
+    or the connection fails, it is marked broken and the pool closes it.
+    """
+
+    def __init__(self, conn):
+        self.raw = conn
+        self.broken = False
+        self.prepared = set()  # names of statements prepared on it
+
+    @classmethod
+    async def open(cls, dsn):
+        """Opens a connection to the database dsn."""
+        self = cls(psycopg2.connect(dsn, async_=True))
+        try:
+            await self._wait()
+        except BaseException:
+            self.close()
+            raise
+        return self
+
+    @property
+    def closed(self):
+        return bool(self.raw.closed)
+
+    def close(self):
+        self.raw.close()
+
+    async def execute(self, sql, params=None):
+        """Runs a statement and returns its cursor, whose rows are read with
+        fetchone() and fetchall()."""
+        c = self.raw.cursor()
+        try:
+            c.execute(sql, params)
+            await self._wait()
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            self.broken = True
+            raise
+        except psycopg2.Error:
+            # the statement failed, the connection can be used further
+            raise
+        except BaseException:
+            # the statement may still run
+            self.broken = True
+            raise
+        return c
+
+    async def fetchone(self, sql, params=None):
+        """Runs a statement and returns its first row."""
+        return (await self.execute(sql, params)).fetchone()
+
+    async def fetchall(self, sql, params=None):
+        """Runs a statement and returns all its rows."""
+        return (await self.execute(sql, params)).fetchall()
+
+    async def executePrepared(self, name, sql, params):
+        """Runs sql with named parameters (dict params) as the prepared
+        statement name, see tournament._executePrepared()."""
+        prepare, execute = tournament._preparedStatement(name, sql)
+        if name not in self.prepared:
+            await self.execute(prepare)
+            self.prepared.add(name)
+        return await self.execute(execute, params)
+
+    async def executeValues(self, sql, rows):
+        """Runs sql, whose VALUES %s is filled with rows (tuples of the same
+        length), like psycopg2.extras.execute_values in one page."""
+        c = self.raw.cursor()
+        template = '(' + ', '.join(['%s'] * len(rows[0])) + ')'
+        encoding = encodings[self.raw.encoding]
+        values = ', '.join(c.mogrify(template, row).decode(encoding)
+                           for row in rows)
+        # the statement has no parameters, so % in values is not special
+        return await self.execute(sql.replace('%s', values, 1))
+
+    @asynccontextmanager
+    async def transaction(self):
+        """Async context manager, which runs the statements of its block in
+        one transaction. It is committed when the block exits normally and
+        rolled back if it raises."""
+        await self.execute('BEGIN')
+        try:
+            yield self
+        except BaseException:
+            if not self.broken:
+                try:
+                    await self.execute('ROLLBACK')
+                except Exception:
+                    self.broken = True
+            raise
+        await self.execute('COMMIT')
+
+    async def _wait(self):
+        """Waits until the connection has finished its current work."""
+        loop = asyncio.get_running_loop()
+        while True:
+            state = self.raw.poll()
+            if state == POLL_OK:
+                return
+            if state == POLL_READ:
+                add, remove = loop.add_reader, loop.remove_reader
+            elif state == POLL_WRITE:
+                add, remove = loop.add_writer, loop.remove_writer
+            else:
+                raise psycopg2.OperationalError(
+                    "Unexpected poll state {state}".format(state=state))
+            ready = loop.create_future()
+            fd = self.raw.fileno()
+            add(fd, _setDone, ready)
+            try:
+                await ready
+            finally:
+                remove(fd)
+
+
+def _setDone(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AsyncConnectionPool(object):
+    """A bounded pool of AsyncConnection for the coroutines of the event
+    loop, which created it.
+
+    Like tournament_pool.ConnectionPool, connections are handed out
+    most-recently-used first and idle connections above minSize expire.
+    Broken connections are closed when they are given back.
+
+    Args:
+      connectFn: coroutine function without arguments, which returns a new
+        AsyncConnection
+      minSize: number of connections kept open even when they are idle
+      maxSize: maximum number of connections open at the same time
+      idleTimeout: seconds after which an idle connection above minSize is
+        closed (None keeps idle connections forever)
+      checkoutTimeout: seconds to wait for a free connection before
+        PoolError is raised (None waits forever)
+    """
+
+    def __init__(self, connectFn, minSize=1, maxSize=10, idleTimeout=300,
+                 checkoutTimeout=30):
+        if maxSize < 1 or minSize < 0 or minSize > maxSize:
+            raise ValueError("Pool size must satisfy 0 <= minSize <= "
+                             "maxSize and maxSize >= 1")
+        self.connectFn = connectFn
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.idleTimeout = idleTimeout
+        self.checkoutTimeout = checkoutTimeout
+        self.loop = asyncio.get_running_loop()
+
+        self._idle = []   # stack of (connection, time it was returned)
+        self._open = 0    # connections open (idle + checked out + opening)
+        self._waiters = collections.deque()  # futures of waiting checkouts
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,   # successful checkouts
+            'waits': 0,       # checkouts which had to wait for a connection
+            'waitTime': 0.0,  # total seconds spent waiting
+            'timeouts': 0,    # checkouts which gave up waiting
+            'created': 0,     # connections opened
+            'closed': 0,      # connections closed (expired, broken, ...)
+        }
+
+    async def getconn(self):
+        """Checks a connection out of the pool.
+
+        Waits up to checkoutTimeout seconds if maxSize connections are
+        already in use. The connection must be given back with putconn().
+        """
+        start = None
+        while True:
+            if self._closed:
+                raise PoolError("Connection pool is closed")
+            self._closeAll(self._takeExpired())
+            while self._idle:
+                conn = self._idle.pop()[0]
+                if not conn.closed:
+                    return self._checkedOut(conn, start)
+                self._discard(conn)
+            if self._open < self.maxSize:
+                self._open += 1
+                try:
+                    conn = await self.connectFn()
+                except BaseException:
+                    self._discard(None)
+                    raise
+                self._stats['created'] += 1
+                return self._checkedOut(conn, start)
+
+            now = time.time()
+            if start is None:
+                start = now
+                self._stats['waits'] += 1
+            remaining = None
+            if self.checkoutTimeout is not None:
+                remaining = start + self.checkoutTimeout - now
+            waiter = self.loop.create_future()
+            self._waiters.append(waiter)
+            try:
+                if remaining is not None and remaining <= 0:
+                    raise asyncio.TimeoutError()
+                await asyncio.wait_for(waiter, remaining)
+            except asyncio.TimeoutError:
+                self._stats['timeouts'] += 1
+                self._stats['waitTime'] += time.time() - start
+                raise PoolError("No connection available within %s seconds"
+                                % self.checkoutTimeout)
+            finally:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+
+    def putconn(self, conn, discard=False):
+        """Returns a connection to the pool.
+
+        Args:
+          conn: connection previously obtained with getconn()
+          discard: close the connection instead of keeping it for reuse
+        """
+        if discard or self._closed or conn.broken or conn.closed:
+            self._discard(conn)
+            return
+        self._idle.append((conn, time.time()))
+        self._closeAll(self._takeExpired())
+        self._wakeWaiter()
+
+    def closeall(self):
+        """Closes all idle connections and stops handing out new ones.
+
+        Connections which are still checked out are closed when returned.
+        """
+        self._closed = True
+        idle = [conn for conn, idleSince in self._idle]
+        self._idle = []
+        self._open -= len(idle)
+        self._closeAll(idle)
+        while self._waiters:
+            _setDone(self._waiters.popleft())
+
+    def stats(self):
+        """Returns a dict with usage counters and the current pool size."""
+        result = dict(self._stats)
+        result['size'] = self._open
+        result['idle'] = len(self._idle)
+        result['inUse'] = self._open - len(self._idle)
+        result['minSize'] = self.minSize
+        result['maxSize'] = self.maxSize
+        return result
+
+    def _checkedOut(self, conn, start):
+        self._stats['checkouts'] += 1
+        if start is not None:
+            self._stats['waitTime'] += time.time() - start
+        return conn
+
+    def _takeExpired(self):
+        """Removes idle connections over idleTimeout from the pool. The
+        oldest connections are at the bottom of the stack and minSize
+        connections are always kept."""
+        if self.idleTimeout is None:
+            return []
+        deadline = time.time() - self.idleTimeout
+        expired = []
+        while (self._open > self.minSize and self._idle and
+               self._idle[0][1] < deadline):
+            expired.append(self._idle.pop(0)[0])
+            self._open -= 1
+        return expired
+
+    def _wakeWaiter(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+
+    def _discard(self, conn):
+        """Closes conn (None if it could not be opened) and frees its
+        slot."""
+        self._open -= 1
+        if conn is not None:
+            self._closeAll([conn])
+        self._wakeWaiter()
+
+    def _closeAll(self, connections):
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._stats['closed'] += len(connections)
+
+
+def configurePool(minSize=POOL_MIN_SIZE, maxSize=POOL_MAX_SIZE,
+                  idleTimeout=POOL_IDLE_TIMEOUT,
+                  checkoutTimeout=POOL_CHECKOUT_TIMEOUT):
+    """Sizes or tunes the pool of asynchronous connections.
+
+    The current pool (if any) is closed and a new one is created on the next
+    call, so it is safe to call this at any time, also to close the
+    connections before the event loop is closed.
+
+    Args:
+      minSize, maxSize, idleTimeout, checkoutTimeout: see
+        AsyncConnectionPool
+    """
+    global _pool, _poolOptions
+
+    oldPool, _pool = _pool, None
+    _poolOptions = {'minSize': minSize, 'maxSize': maxSize,
+                    'idleTimeout': idleTimeout,
+                    'checkoutTimeout': checkoutTimeout}
+    if oldPool is not None:
+        oldPool.closeall()
+
+
+def poolStats():
+    """Returns statistics of the pool of asynchronous connections, see
+    tournament.poolStats(). An empty dict is returned if the pool was not
+    used yet."""
+    pool = _pool
+    if pool is None:
+        return {}
+    return pool.stats()
+
+
+def configurePairingExecutor(executor=None):
+    """Selects the executor in which swissPairings pairs players.
+
+    Args:
+      executor: a concurrent.futures executor, or None for the default
+        executor of the loop (threads). Pairing holds the GIL, so a
+        ProcessPoolExecutor keeps the loop responsive during long
+        PAIRING_OPTIMAL searches
+    """
+    global _pairingExecutor
+
+    _pairingExecutor = executor
+
+
+async def connect():
+    """Opens a new asynchronous connection to tournament.DSN."""
+    return await AsyncConnection.open(tournament.DSN)
+
+
+async def _openConnection():
+    """Opens a new connection with connect(), measured if metrics are
+    enabled."""
+    metrics = tournament._metrics
+    if metrics is None:
+        return await connect()
+    start = timer()
+    conn = await connect()
+    metrics.record(KIND_CONNECT, 'connect', timer() - start)
+    return conn
+
+
+def _getPool():
+    """Returns the pool of the running event loop, creating it if needed."""
+    global _pool
+
+    loop = asyncio.get_running_loop()
+    if _pool is not None and _pool.loop is not loop:
+        # futures of a pool belong to the loop, which created it
+        _pool.closeall()
+        _pool = None
+    if _pool is None:
+        # connect() is called through the module namespace, so it can be
+        # replaced (e.g. to count new connections)
+        _pool = AsyncConnectionPool(_openConnection, **_poolOptions)
+    return _pool
+
+
+@asynccontextmanager
+async def getConnection():
+    """Async context manager, which provides an AsyncConnection from the
+    pool. Its statements are committed one by one, see
+    AsyncConnection.transaction()."""
+    metrics = tournament._metrics
+    start = timer() if metrics is not None else None
+    pool = _getPool()
+    conn = await pool.getconn()
+    if metrics is not None:
+        metrics.record(KIND_CHECKOUT, 'getConnection', timer() - start)
+    try:
+        yield conn
+    finally:
+        pool.putconn(conn)
+
+
+def _dispatch(function):
+    """Decorator of coroutine functions, which calls the method of the same
+    name of the backend selected in tournament.py instead, unless it is
+    PostgreSQL. Calls are measured if metrics are enabled."""
+    name = function.__name__
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        backend = tournament._backend
+        metrics = tournament._metrics
+        start = timer()
+        if backend is None:
+            result = await function(*args, **kwargs)
+        else:
+            result = getattr(backend, name)(*args, **kwargs)
+        if metrics is not None:
+            metrics.record(KIND_FUNCTION, name, timer() - start,
+                           len(result) if isinstance(result, list) else None)
+        return result
+    return wrapper
+
+
+def _cached(function):
+    """Decorator of read coroutines of one tournament, which serves their
+    results from the cache of tournament.py, if it is enabled, under the
+    keys of the module functions of the same name."""
+    name = function.__name__
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        cache = tournament._cache
+        if cache is None:
+            return await function(*args, **kwargs)
+
+        tid = args[0] if args else kwargs.get('tid', 0)
+        key = (name, args[1:], tuple(sorted(kwargs.items())))
+        generation = cache.generation(tid)
+        if tournament._cacheMode == tournament.CACHE_SHARED:
+            generation += (await _tournamentVersion(tid),)
+        rows = cache.get(tid, key, generation)
+        if rows is None:
+            rows = await function(*args, **kwargs)
+            cache.put(tid, key, generation, rows)
+        return rows
+    return wrapper
+
+
+def _blocking(name):
+    """Returns a coroutine function, which runs the function name of
+    tournament.py in the default executor of the loop."""
+    function = getattr(tournament, name)
+
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(function, *args, **kwargs))
+    return wrapper
+
+
+deleteMatches = _blocking('deleteMatches')
+deletePlayers = _blocking('deletePlayers')
+registerPlayerForTournament = _blocking('registerPlayerForTournament')
+correctMatch = _blocking('correctMatch')
+deleteMatch = _blocking('deleteMatch')
+deleteTournament = _blocking('deleteTournament')
+archiveTournament = _blocking('archiveTournament')
+verifyStandings = _blocking('verifyStandings')
+rebuildStandings = _blocking('rebuildStandings')
+recomputeRatings = _blocking('recomputeRatings')
+startRound = _blocking('startRound')
+pairingQuality = _blocking('pairingQuality')
+swissPairingsBatch = _blocking('swissPairingsBatch')
+flushReports = _blocking('flushReports')
+
+
+@_dispatch
+async def countPlayers():
+    """See tournament.countPlayers()."""
+    async with getConnection() as conn:
+        return (await conn.fetchone("SELECT COUNT(pid) FROM Players;"))[0]
+
+
+@_dispatch
+async def registerPlayer(name, tid=0):
+    """See tournament.registerPlayer()."""
+    return (await registerPlayers([name], tid))[0]
+
+
+@_dispatch
+async def registerPlayers(names, tid=0):
+    """See tournament.registerPlayers()."""
+    names = list(names)
+    if not names:
+        return []
+
+    async with getConnection() as conn:
+        async with conn.transaction():
+            created = await _ensurePartitions(conn, [tid])
+            c = await conn.executePrepared(
+                'register_players', tournament.REGISTER_PLAYERS_SQL,
+                {'names': names, 'tid': tid})
+            pids, bumped = c.fetchone()
+            if not bumped:
+                await _createVersions(conn, [tid])
+    _committed([tid], created)
+    return pids
+
+
+@_dispatch
+async def reportMatch(winner, loser, isDraw=False, tid=0):
+    """See tournament.reportMatch()."""
+    return (await reportMatches([(winner, loser, isDraw)], tid))[0]
+
+
+@_dispatch
+async def reportMatches(results, tid=0):
+    """See tournament.reportMatches()."""
+    rows, deltas = tournament._resultRows(results, tid)
+    if not rows:
+        return []
+
+    async with getConnection() as conn:
+        async with conn.transaction():
+            created = await _ensurePartitions(conn, [tid])
+            c = await conn.executePrepared(
+                'report_matches', tournament.REPORT_MATCHES_SQL,
+                {'tid': tid, 'player1': [row[0] for row in rows],
+                 'p1points': [row[1] for row in rows],
+                 'player2': [row[2] for row in rows],
+                 'p2points': [row[3] for row in rows]})
+            mids, unlisted, pids, ratings, games = c.fetchone()
+            if unlisted:
+                await _insertStandings(conn, [
+                    (tid, pid) + tuple(deltas[(tid, pid)])
+                    for pid in unlisted])
+            await _updateRatings(conn, rows,
+                                 dict(zip(pids, zip(ratings, games))))
+            await _bumpVersions(conn, [tid])
+    _committed([tid], created)
+    return mids
+
+
+@_dispatch
+@_cached
+async def playerStandings(tid=0, round=None):
+    """See tournament.playerStandings()."""
+    async with getConnection() as conn:
+        if round is not None and round < await _lastRound(conn, tid):
+            return await conn.fetchall(tournament.ROUND_STANDINGS_SQL,
+                                       {'tid': tid, 'round': round})
+        return await conn.fetchall(tournament.STANDINGS_SQL, (tid,))
+
+
+@_dispatch
+async def standingsPage(tid=0, limit=tournament.STANDINGS_PAGE_SIZE,
+                        after=None, offset=0):
+    """See tournament.standingsPage()."""
+    params = {'tid': tid, 'limit': limit, 'offset': offset}
+    async with getConnection() as conn:
+        if after is None:
+            return await conn.fetchall(tournament.STANDINGS_FIRST_PAGE_SQL,
+                                       params)
+        params.update(pid=after[0], points=-after[2], matches=-after[3])
+        return await conn.fetchall(tournament.STANDINGS_NEXT_PAGE_SQL,
+                                   params)
+
+
+@_dispatch
+@_cached
+async def playerStandingsWithBye(tid=0):
+    """See tournament.playerStandingsWithBye()."""
+    async with getConnection() as conn:
+        return await conn.fetchall(tournament.STANDINGS_WITH_BYE_SQL,
+                                   {'bye': tournament.POINTS_FOR_BYE,
+                                    'tid': tid})
+
+
+@_dispatch
+@_cached
+async def playerStandingsWithTiebreaks(tid=0):
+    """See tournament.playerStandingsWithTiebreaks()."""
+    async with getConnection() as conn:
+        return await conn.fetchall(
+            tournament.TIEBREAK_STANDINGS_SQL,
+            {'tid': tid, 'bye': tournament.POINTS_FOR_BYE,
+             'win': tournament.POINTS_FOR_WIN,
+             'minWin': tournament.MIN_MATCH_WIN_PERCENT})
+
+
+@_dispatch
+async def playerRatings(tid=0):
+    """See tournament.playerRatings()."""
+    async with getConnection() as conn:
+        return await conn.fetchall(tournament.RATINGS_SQL,
+                                   {'tid': tid, 'initial': INITIAL_RATING})
+
+
+@_dispatch
+async def playerCareer(pid):
+    """See tournament.playerCareer()."""
+    return tournament._careerRecord(await playerHistory(pid))
+
+
+@_dispatch
+async def playerHistory(pid):
+    """See tournament.playerHistory()."""
+    async with getConnection() as conn:
+        return await conn.fetchall(tournament.PLAYER_HISTORY_SQL,
+                                   {'pid': pid})
+
+
+@_dispatch
+async def headToHead(pid, opponent):
+    """See tournament.headToHead()."""
+    async with getConnection() as conn:
+        return await conn.fetchone(tournament.HEAD_TO_HEAD_SQL,
+                                   {'pid': pid, 'opponent': opponent})
+
+
+@_dispatch
+async def roundPairings(tid=0, round=None):
+    """See tournament.roundPairings()."""
+    async with getConnection() as conn:
+        if round is None:
+            state = await _roundState(conn, tid)
+            if state is None:
+                return []
+            round = state[0]
+        return await conn.fetchall(tournament.ROUND_PAIRINGS_SQL,
+                                   (tid, round))
+
+
+@_dispatch
+async def swissPairings(tid=0, mode=PAIRING_GREEDY,
+                        timeBudget=tournament.PAIRING_TIME_BUDGET,
+                        seeded=False):
+    """See tournament.swissPairings(). Players are paired in the pairing
+    executor (see configurePairingExecutor), after the connection is given
+    back to the pool."""
+    if tournament._reportBuffer is not None:
+        await flushReports([tid])
+    if seeded:
+        return await _pairNextRound(tid, mode, timeBudget, seeded)
+    return await _cachedPairings(tid, mode, timeBudget)
+
+
+@_cached
+async def _cachedPairings(tid, mode, timeBudget):
+    """Unseeded swissPairings, served from the cache if it is enabled."""
+    return await _pairNextRound(tid, mode, timeBudget, False)
+
+
+async def _pairNextRound(tid, mode, timeBudget, seeded):
+    """Returns pairings of the next round of tournament tid, or the stored
+    pairings of its started round, which waits for results."""
+    async with getConnection() as conn:
+        state = await _roundState(conn, tid)
+        if state is not None and state[1]:
+            rows = await conn.fetchall(tournament.ROUND_PAIRINGS_SQL,
+                                       (tid, state[0]))
+            return [row[:4] for row in rows if row[2] is not None]
+
+        standing = await conn.fetchall(tournament.STANDINGS_SQL, (tid,))
+        history = await conn.fetchall(tournament.PAIRING_HISTORY_SQL, (tid,))
+        byes = None
+        if state is not None:
+            byes = dict((pid, count) for t, pid, count in await conn.fetchall(
+                tournament.STORED_BYES_SQL, ([tid],)))
+        ratings = None
+        if seeded:
+            ratings = dict((row[0], row[2]) for row in await conn.fetchall(
+                tournament.RATINGS_SQL, {'tid': tid,
+                                         'initial': INITIAL_RATING}))
+
+    start = timer()
+    pairs = await asyncio.get_running_loop().run_in_executor(
+        _pairingExecutor, _pairRound, standing, history, ratings, mode,
+        timeBudget, byes)
+    metrics = tournament._metrics
+    if metrics is not None:
+        metrics.record(KIND_PAIRING, 'swissPairings', timer() - start,
+                       len(pairs))
+    return pairs
+
+
+def _pairRound(standing, history, ratings, mode, timeBudget, byes):
+    """Pairs a round in the pairing executor (a module function, so it can
+    be sent to other processes). ratings is None for unseeded pairing."""
+    if ratings is not None:
+        standing = seededStanding(standing, ratings)
+    return pairRound(standing, opponentSets(history), mode, timeBudget, byes)
+
+
+async def _tournamentVersion(tid):
+    """Returns the version of tournament tid from TournamentVersions."""
+    async with getConnection() as conn:
+        row = await conn.fetchone(
+            "SELECT version FROM TournamentVersions WHERE tid = (%s)", (tid,))
+    return row[0] if row is not None else 0
+
+
+async def _lastRound(conn, tid):
+    """See tournament._lastRound()."""
+    row = await conn.fetchone(
+        "SELECT coalesce(max(round), 0) FROM Rounds WHERE tid = (%s)", (tid,))
+    return row[0]
+
+
+async def _roundState(conn, tid):
+    """See tournament.Tournament._roundState()."""
+    row = await conn.fetchone(tournament.ROUND_STATE_SQL, ([tid],))
+    return row[1:] if row is not None else None
+
+
+async def _ensurePartitions(conn, tids):
+    """Creates the partitions of tournaments tids, which do not exist yet,
+    if the tables are partitioned by tournament. Returns the tids of the
+    created partitions, see _committed."""
+    if tournament._partitioned is None:
+        tournament._partitioned = (await conn.fetchone(
+            tournament.PARTITIONED_SQL))[0]
+    if not tournament._partitioned:
+        return set()
+    missing = set(tids) - tournament._partitions
+    if missing:
+        await conn.execute(tournament.CREATE_PARTITIONS_SQL,
+                           (sorted(missing),))
+    return missing
+
+
+def _committed(tids, partitions):
+    """Invalidates cached results of tournaments tids and remembers the
+    created partitions after the transaction is committed."""
+    tournament._invalidateCache(tids)
+    tournament._partitions.update(partitions)
+
+
+async def _lockKeys(conn, key, ids):
+    """See tournament._lockKeys()."""
+    await conn.execute(tournament.LOCK_KEYS_SQL, (key, sorted(set(ids))))
+
+
+async def _bumpVersions(conn, tids):
+    """See tournament._bumpVersions()."""
+    tids = sorted(set(tids))
+    c = await conn.execute(tournament.BUMP_VERSIONS_SQL, (tids,))
+    missing = set(tids).difference(row[0] for row in c.fetchall())
+    if missing:
+        await _createVersions(conn, missing)
+
+
+async def _createVersions(conn, tids):
+    """See tournament._createVersions()."""
+    tids = sorted(tids)
+    await _lockKeys(conn, tournament._VERSIONS_LOCK, tids)
+    await conn.execute(tournament.CREATE_VERSIONS_SQL, {'tids': tids})
+
+
+async def _insertStandings(conn, rows):
+    """See tournament._insertStandings()."""
+    await _lockKeys(conn, tournament._STANDINGS_LOCK, [row[1] for row in rows])
+    await conn.executeValues(tournament.INSERT_STANDINGS_SQL, sorted(rows))
+
+
+async def _updateRatings(conn, matches, ratings):
+    """See tournament._updateRatings()."""
+    pids = sorted(set([row[0] for row in matches] +
+                      [row[2] for row in matches]))
+    missing = [pid for pid in pids if pid not in ratings]
+    if missing:
+        await _lockKeys(conn, tournament._RATINGS_LOCK, missing)
+        ratings.update((pid, (rating, games))
+                       for pid, rating, games in await conn.fetchall(
+                           tournament.LOCK_RATINGS_SQL, (missing,)))
+    updateRatings(ratings, matches)
+    await conn.executeValues(tournament.WRITE_RATINGS_SQL,
+                             [(pid,) + ratings[pid] for pid in pids])
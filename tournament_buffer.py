@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+#
+# tournament_buffer.py -- write-behind buffer of reported results for
+# tournament.py
+#
+# Results are queued by the threads which report them and written by one
+# writer thread in batches, one transaction per batch, so many results share
+# one commit. A batch is written when it reaches maxBatch results or when its
+# oldest result has waited maxDelay seconds, and while a batch is written the
+# next one collects results. Every result gets a ticket, which is completed
+# when its batch is committed.
+#
+
+import threading
+import time
+
+
+class ReportBufferError(Exception):
+    """Raised when a result is queued in a closed buffer or its ticket is not
+    completed in time."""
+
+
+class ReportTicket(object):
+    """Acknowledgement of a queued result.
+
+    The ticket is completed when the batch of the result is committed (or
+    fails), see result().
+    """
+
+    def __init__(self, tid):
+        self.tid = tid
+        self._event = threading.Event()
+        self._mid = None
+        self._error = None
+
+    def done(self):
+        """Returns True if the result was committed or failed."""
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """Waits until the result is committed and returns the id of the
+        recorded match.
+
+        Args:
+          timeout: seconds to wait (None waits forever)
+
+        Raises:
+          ReportBufferError: the result was not written within timeout
+          The error of the result, if it could not be recorded.
+        """
+        if not self._event.wait(timeout) and not self._event.is_set():
+            raise ReportBufferError("Result not written within %s seconds"
+                                    % timeout)
+        if self._error is not None:
+            raise self._error
+        return self._mid
+
+    def _complete(self, outcome):
+        if isinstance(outcome, Exception):
+            self._error = outcome
+        else:
+            self._mid = outcome
+        self._event.set()
+
+
+class ReportBuffer(object):
+    """A thread-safe queue of results written in batches by a writer thread.
+
+    Args:
+      writeFn: callable, which records a list of results (tid, winner,
+        loser, isDraw) in one transaction and returns a list with the id of
+        the match or the error of every result, in the same order. If it
+        raises, the error is given to every result of the batch
+      maxBatch: most results written in one transaction
+      maxDelay: seconds the oldest queued result may wait for more results
+        before its batch is written (0 writes whatever is queued as soon as
+        the previous batch is committed)
+    """
+
+    def __init__(self, writeFn, maxBatch=500, maxDelay=0.01):
+        if maxBatch < 1 or maxDelay < 0:
+            raise ValueError("maxBatch must be at least 1 and maxDelay must "
+                             "not be negative")
+        self.writeFn = writeFn
+        self.maxBatch = maxBatch
+        self.maxDelay = maxDelay
+
+        self._cond = threading.Condition(threading.Lock())
+        self._queue = []    # (result, ticket, time it was queued)
+        self._writing = []  # the batch being written
+        self._urgent = False  # a flush waits, write without delay
+        self._closed = False
+        self._stats = {
+            'queued': 0,     # results queued
+            'written': 0,    # results committed
+            'failed': 0,     # results which could not be recorded
+            'batches': 0,    # transactions
+            'largestBatch': 0,
+            'flushes': 0,    # flush() calls which had to wait
+        }
+        self._writer = threading.Thread(target=self._run,
+                                        name='tournament-report-buffer')
+        self._writer.daemon = True
+        self._writer.start()
+
+    def submit(self, tid, winner, loser, isDraw=False):
+        """Queues a result and returns its ReportTicket."""
+        ticket = ReportTicket(tid)
+        with self._cond:
+            if self._closed:
+                raise ReportBufferError("Report buffer is closed")
+            self._queue.append(((tid, winner, loser, isDraw), ticket,
+                                time.time()))
+            self._stats['queued'] += 1
+            if len(self._queue) == 1 or len(self._queue) >= self.maxBatch:
+                self._cond.notify_all()
+        return ticket
+
+    def flush(self, tids=None):
+        """Writes results queued so far without delay and waits until they
+        are committed or failed.
+
+        Args:
+          tids: tournaments whose results are waited for (None means all)
+        """
+        with self._cond:
+            pending = self._writing + self._queue
+            tickets = [ticket for result, ticket, queued in pending
+                       if tids is None or result[0] in tids]
+            if not tickets:
+                return
+            self._urgent = True
+            self._stats['flushes'] += 1
+            self._cond.notify_all()
+        for ticket in tickets:
+            ticket._event.wait()
+
+    def close(self):
+        """Writes all queued results, stops the writer thread and refuses
+        new results."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._writer is not threading.current_thread():
+            self._writer.join()
+
+    def stats(self):
+        """Returns a dict with counters and the number of pending results."""
+        with self._cond:
+            result = dict(self._stats)
+            result['pending'] = len(self._queue) + len(self._writing)
+            result['maxBatch'] = self.maxBatch
+            result['maxDelay'] = self.maxDelay
+        return result
+
+    def _run(self):
+        while True:
+            batch = self._nextBatch()
+            if batch is None:
+                return
+            self._write(batch)
+
+    def _nextBatch(self):
+        """Waits until a batch is due and takes it from the queue. Returns
+        None when the buffer is closed and empty."""
+        with self._cond:
+            while True:
+                if not self._queue:
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+                if (len(self._queue) >= self.maxBatch or self._urgent or
+                        self._closed):
+                    break
+                remaining = self._queue[0][2] + self.maxDelay - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._queue[:self.maxBatch]
+            del self._queue[:self.maxBatch]
+            if not self._queue:
+                self._urgent = False
+            self._writing = batch
+        return batch
+
+    def _write(self, batch):
+        """Writes a batch and completes the tickets of its results."""
+        try:
+            outcomes = self.writeFn([result for result, ticket, queued
+                                     in batch])
+        except Exception as e:
+            outcomes = [e] * len(batch)
+        failed = 0
+        for (result, ticket, queued), outcome in zip(batch, outcomes):
+            failed += isinstance(outcome, Exception)
+            ticket._complete(outcome)
+        with self._cond:
+            self._writing = []
+            self._stats['batches'] += 1
+            self._stats['written'] += len(batch) - failed
+            self._stats['failed'] += failed
+            self._stats['largestBatch'] = max(self._stats['largestBatch'],
+                                              len(batch))
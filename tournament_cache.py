@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# tournament_cache.py -- cache of standings and pairings for tournament.py
+#
+# Results of read functions are kept per tournament together with the
+# generation of the tournament they were computed for. Every write to a
+# tournament starts a new generation, so cached results of older generations
+# are never returned.
+#
+
+import threading
+from collections import OrderedDict
+
+
+class TournamentCache(object):
+    """Thread-safe LRU cache of read results, keyed by tournament ID.
+
+    Every cached value is stored with a generation token, which the caller
+    has got for the tournament before reading the data. get() returns the
+    value only for the same token. Tokens start with generation(), whose
+    counter is bumped by invalidate() after a write is committed, so a value
+    read before the commit can not be stored under the new generation. In
+    shared mode the version of the tournament in the database is appended to
+    the token (see tournament.configureCache).
+
+    Args:
+      maxTournaments: number of tournaments whose results are kept, the
+        least recently used tournament is evicted first
+    """
+
+    def __init__(self, maxTournaments=128):
+        if maxTournaments < 1:
+            raise ValueError("maxTournaments must be at least 1")
+        self.maxTournaments = maxTournaments
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # tid -> [generation, {key: value}]
+        self._generations = {}         # tid -> number of invalidations
+        self._epoch = 0                # number of invalidateAll() calls
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def generation(self, tid):
+        """Returns the current local generation token of tournament tid."""
+        with self._lock:
+            return (self._epoch, self._generations.get(tid, 0))
+
+    def get(self, tid, key, generation):
+        """Returns a copy of the value stored for (tid, key) in generation,
+        or None if there is no such value."""
+        with self._lock:
+            entry = self._entries.get(tid)
+            if entry is None or entry[0] != generation or key not in entry[1]:
+                self._misses += 1
+                return None
+            # most recently used tournaments are at the end
+            self._entries[tid] = self._entries.pop(tid)
+            self._hits += 1
+            return list(entry[1][key])
+
+    def put(self, tid, key, generation, rows):
+        """Stores a copy of rows (a list of tuples) for (tid, key).
+
+        Values of other generations of the tournament are dropped. Nothing is
+        stored if the tournament was invalidated after generation was taken.
+        """
+        rows = tuple(rows)
+        with self._lock:
+            if generation[:2] != (self._epoch, self._generations.get(tid, 0)):
+                return
+            entry = self._entries.pop(tid, None)
+            if entry is None or entry[0] != generation:
+                entry = [generation, {}]
+            entry[1][key] = rows
+            self._entries[tid] = entry
+            while len(self._entries) > self.maxTournaments:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, tids):
+        """Starts a new generation of every tournament of tids."""
+        with self._lock:
+            for tid in tids:
+                self._generations[tid] = self._generations.get(tid, 0) + 1
+                self._entries.pop(tid, None)
+                self._invalidations += 1
+
+    def invalidateAll(self):
+        """Starts a new generation of all tournaments."""
+        with self._lock:
+            self._epoch += 1
+            self._generations.clear()
+            self._entries.clear()
+            self._invalidations += 1
+
+    def stats(self):
+        """Returns a dict with counters: hits, misses, evictions,
+        invalidations and the current number of cached tournaments."""
+        with self._lock:
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+                'tournaments': len(self._entries),
+                'maxTournaments': self.maxTournaments,
+            }
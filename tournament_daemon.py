@@ -0,0 +1,635 @@
+#!/usr/bin/env python3
+#
+# tournament_daemon.py -- tournament daemon with hot state in memory
+#
+# A long-running local process, which keeps tournaments in memory (a
+# MemoryBackend, see tournament_memory.py) and serves standings and pairings
+# from there, without a database round trip. Every write goes to PostgreSQL
+# first, through the functions of tournament.py, and is applied to memory
+# with the ids the database assigned once it is committed, so the database
+# stays the durable copy. After a crash or restart the daemon loads the
+# tournaments from the database again.
+#
+#     python tournament_daemon.py [--socket PATH] [--dsn DSN] [--tids 1,2]
+#
+# Clients connect to a Unix domain socket and send one JSON object per line,
+# {"call": name, "args": [...], "kwargs": {...}}, with the name and
+# arguments of a module function of tournament.py. Every request is
+# answered by one line, {"result": ...} or {"error": type, "message": ...}.
+# DaemonBackend is a client with the methods of the module functions:
+#
+#     tournament.setBackend(tournament_daemon.DaemonBackend())
+#
+# Tournaments are loaded when they are first used (or at start, --tids).
+# Writes made to the database by other processes are not seen until the
+# tournaments are reloaded (DaemonBackend.reload). Python 3 only.
+#
+
+import argparse
+import inspect
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+import psycopg2
+
+import tournament
+from tournament_memory import MemoryBackend
+
+DAEMON_SOCKET = '/tmp/tournament.sock'
+DAEMON_TIMEOUT = 30  # seconds a client waits for an answer
+RESPONSE_CACHE_SIZE = 1000  # encoded answers kept per tournament
+
+# functions served from memory; answers are cached until the tournament
+# changes
+_READS = frozenset(['playerStandings', 'standingsPage',
+                    'playerStandingsWithBye', 'playerStandingsWithTiebreaks',
+                    'swissPairings', 'roundPairings', 'pairingQuality'])
+# functions answered by the database: players, their records and ratings
+# over all tournaments, checks of the database itself and seeded pairing
+_FORWARDED = frozenset(['countPlayers', 'playerRatings', 'playerCareer',
+                        'playerHistory', 'headToHead', 'verifyStandings',
+                        'flushReports'])
+# writes, which are applied to memory with the ids of the database
+_APPLIED = frozenset(['registerPlayer', 'registerPlayers', 'reportMatch',
+                      'reportMatches', 'startRound'])
+# writes, after which the tournaments they change are loaded again
+_RELOADED = frozenset(['registerPlayerForTournament', 'correctMatch',
+                       'deleteMatch', 'deleteTournament',
+                       'archiveTournament', 'rebuildStandings',
+                       'recomputeRatings', 'deleteMatches', 'deletePlayers'])
+
+# calls, which a client sends again if the connection broke after it sent
+# them (a write may have been committed before)
+_RETRIED = _READS | frozenset(['countPlayers', 'playerRatings',
+                               'playerCareer', 'playerHistory', 'headToHead',
+                               'verifyStandings', 'swissPairingsBatch',
+                               'stats'])
+
+LOAD_PLAYERS_SQL = '''SELECT pid, name
+    FROM Players
+    WHERE pid IN (SELECT pid FROM TournamentMembers WHERE tid = %(tid)s
+                  UNION SELECT player1 FROM Matches
+                  WHERE tournament = %(tid)s
+                  UNION SELECT player2 FROM Matches
+                  WHERE tournament = %(tid)s
+                  UNION SELECT player1 FROM Pairings WHERE tid = %(tid)s
+                  UNION SELECT player2 FROM Pairings WHERE tid = %(tid)s)'''
+
+LOAD_MEMBERS_SQL = '''SELECT pid FROM TournamentMembers
+    WHERE tid = %(tid)s'''
+
+LOAD_MATCHES_SQL = '''SELECT mid, player1, p1points, player2, p2points, round
+    FROM Matches
+    WHERE tournament = %(tid)s
+    ORDER BY mid'''
+
+LOAD_PAIRINGS_SQL = '''SELECT round, board, player1, player2, mid
+    FROM Pairings
+    WHERE tid = %(tid)s'''
+
+LOAD_SNAPSHOTS_SQL = '''SELECT round, pid, points, matches
+    FROM StandingsSnapshots
+    WHERE tid = %(tid)s'''
+
+MATCH_TOURNAMENT_SQL = "SELECT tournament FROM Matches WHERE mid = %s"
+
+log = logging.getLogger('tournament.daemon')
+_signatures = {}  # name -> signature of the function of tournament.py
+
+
+class DaemonError(Exception):
+    """The daemon cannot be reached or failed to answer a call."""
+
+
+class TournamentDaemon(object):
+    """Serves the functions of tournament.py from tournaments held in
+    memory, writing through to PostgreSQL.
+
+    Args:
+      path: path of the Unix domain socket to listen on
+      tids: tournaments to load at start, others are loaded on first use
+
+    Reads of a loaded tournament do not touch the database, their encoded
+    answers are cached until the tournament changes. Writes are made one at
+    a time: the function of tournament.py commits them to the database,
+    then they are applied to memory. If memory and database disagree (a
+    write fails in memory after it was committed), the tournament is loaded
+    again, the database wins.
+    """
+
+    def __init__(self, path=DAEMON_SOCKET, tids=()):
+        self.path = path
+        self.memory = MemoryBackend()
+        self._loaded = set()           # tids held in memory
+        self._writeLock = threading.Lock()   # writes and loads
+        self._stateLock = threading.RLock()  # memory and cached answers
+        self._answers = {}             # request line -> (tid, answer)
+        self._tidAnswers = {}          # tid -> request lines cached
+        self._stats = {'requests': 0, 'cacheHits': 0, 'loads': 0,
+                       'reloads': 0}
+        self._started = time.time()
+        self._server = None
+        self._thread = None
+        self._connections = set()      # sockets of connected clients
+        for tid in tids:
+            self.load(tid)
+
+    def serve(self):
+        """Listens on the socket and serves clients until shutdown() is
+        called (e.g. by SIGTERM, see main)."""
+        self._listen()
+        self._server.serve_forever()
+
+    def start(self):
+        """Serves clients in a background thread. Returns the daemon."""
+        self._listen()
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='tournament-daemon')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def shutdown(self):
+        """Stops serving, closes connections of clients and removes the
+        socket. Memory is not written anywhere, the database has it all."""
+        server, self._server = self._server, None
+        if server is None:
+            return
+        server.shutdown()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        server.server_close()
+        with self._stateLock:
+            connections = list(self._connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+    def load(self, tid):
+        """Loads tournament tid from the database, replacing the copy in
+        memory."""
+        with self._writeLock:
+            self._load([tid])
+
+    def reload(self, tids=None):
+        """Loads tournaments tids (all loaded ones if None) again, e.g.
+        after other processes wrote to the database. Returns the tids."""
+        with self._writeLock:
+            with self._stateLock:
+                tids = sorted(self._loaded if tids is None else tids)
+            self._load(tids)
+            self._stats['reloads'] += 1
+        return tids
+
+    def stats(self):
+        """Returns a dict with loaded tournaments, numbers of requests,
+        answers from the cache, loads and reloads, and uptime in seconds."""
+        with self._stateLock:
+            stats = dict(self._stats, tournaments=sorted(self._loaded),
+                         uptime=time.time() - self._started)
+        return stats
+
+    def respond(self, line):
+        """Answers a request line of the protocol with an encoded line."""
+        self._stats['requests'] += 1
+        cached = self._answers.get(line)
+        if cached is not None:
+            self._stats['cacheHits'] += 1
+            return cached[1]
+        try:
+            request = json.loads(line.decode('utf-8'))
+            name = request['call']
+            args = request.get('args') or []
+            kwargs = request.get('kwargs') or {}
+            if name in _READS:
+                return self._read(line, name, args, kwargs)
+            return self._encode({'result': self.call(name, args, kwargs)})
+        except Exception as e:
+            return self._encode(self._error(e))
+
+    def call(self, name, args, kwargs):
+        """Runs function name of tournament.py with args and kwargs and
+        returns its result."""
+        if name == 'reload':
+            return self.reload(*args, **kwargs)
+        if name == 'stats':
+            return self.stats()
+        if name in _READS or name == 'swissPairingsBatch':
+            arguments = _arguments(name, args, kwargs)
+            if arguments.get('seeded'):
+                # ratings are kept by the database
+                return getattr(tournament, name)(*args, **kwargs)
+            self._ensureLoaded(arguments.get('tids', [arguments.get('tid')]))
+            with self._stateLock:
+                return getattr(self.memory, name)(*args, **kwargs)
+        if name in _FORWARDED:
+            return getattr(tournament, name)(*args, **kwargs)
+        if name in _APPLIED or name in _RELOADED:
+            return self._write(name, args, kwargs)
+        raise DaemonError("Unknown call {name}".format(name=name))
+
+    def _listen(self):
+        if self._server is not None:
+            raise DaemonError("The daemon is already serving")
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                # left behind by a daemon which did not stop cleanly
+                os.unlink(self.path)
+            else:
+                raise DaemonError("A daemon is already listening on "
+                                  "{path}".format(path=self.path))
+            finally:
+                probe.close()
+        self._server = _Server(self.path, _Handler)
+        self._server.daemon = self
+
+    def _read(self, line, name, args, kwargs):
+        """Answers a read from memory, caching the encoded answer."""
+        arguments = _arguments(name, args, kwargs)
+        if arguments.get('seeded'):
+            # ratings are kept by the database and change with results of
+            # other tournaments
+            return self._encode({'result': getattr(tournament, name)(
+                *args, **kwargs)})
+        tid = arguments['tid']
+        self._ensureLoaded([tid])
+        with self._stateLock:
+            answer = self._encode({'result': getattr(self.memory, name)(
+                *args, **kwargs)})
+            lines = self._tidAnswers.setdefault(tid, set())
+            if len(lines) >= RESPONSE_CACHE_SIZE:
+                self._forget([tid])
+                lines = self._tidAnswers[tid] = set()
+            lines.add(line)
+            self._answers[line] = (tid, answer)
+        return answer
+
+    def _ensureLoaded(self, tids):
+        missing = [tid for tid in tids if tid not in self._loaded]
+        if missing:
+            with self._writeLock:
+                self._load([tid for tid in missing
+                            if tid not in self._loaded])
+
+    def _write(self, name, args, kwargs):
+        """Commits a write to the database, then applies it to memory."""
+        arguments = _arguments(name, args, kwargs)
+        tid = arguments.get('tid')
+        with self._writeLock:
+            if name in _APPLIED and tid not in self._loaded:
+                self._load([tid])
+            elif name in ('correctMatch', 'deleteMatch'):
+                tid = self._matchTournament(arguments['mid'])
+
+            result = getattr(tournament, name)(*args, **kwargs)
+
+            if name in _APPLIED:
+                try:
+                    self._apply(name, arguments, result)
+                except Exception:
+                    log.exception("%s was committed, but could not be "
+                                  "applied to memory; reloading", name)
+                    self._load([tid])
+            elif name in ('deleteTournament', 'archiveTournament'):
+                self._unload(tid)
+            elif name == 'recomputeRatings':
+                pass  # ratings are kept by the database
+            elif name in ('deleteMatches', 'deletePlayers') or tid is None:
+                self._reset()
+            elif tid in self._loaded:
+                self._load([tid])
+        return result
+
+    def _apply(self, name, arguments, result):
+        """Applies a write committed to the database to memory."""
+        tid = arguments['tid']
+        with self._stateLock:
+            self._forget([tid])
+            if name == 'registerPlayer':
+                self.memory.addPlayers([arguments['name']], tid, [result])
+            elif name == 'registerPlayers':
+                self.memory.addPlayers(arguments['names'], tid, result)
+            elif name == 'reportMatch':
+                self.memory.addMatches([(arguments['winner'],
+                                         arguments['loser'],
+                                         arguments['isDraw'])], tid,
+                                       [result])
+            elif name == 'reportMatches':
+                self.memory.addMatches(arguments['results'], tid, result)
+            elif name == 'startRound':
+                number, pairs, bye = result
+                # a started round waiting for results is returned again
+                if not self.memory.roundPairings(tid, number):
+                    if self.memory.addRound(pairs, bye, tid) != number:
+                        raise DaemonError("Round {number} is not the next "
+                                          "round in memory".format(
+                                              number=number))
+
+    def _matchTournament(self, mid):
+        with tournament.getConnection() as conn:
+            c = conn.cursor()
+            c.execute(MATCH_TOURNAMENT_SQL, (mid,))
+            row = c.fetchone()
+        return row[0] if row is not None else None
+
+    def _load(self, tids):
+        """Reads tournaments tids from the database into memory. The caller
+        holds the write lock."""
+        for tid in tids:
+            with tournament.getConnection() as conn:
+                c = conn.cursor()
+                # all rows of one consistent snapshot of the database
+                c.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                rows = []
+                for sql in (LOAD_PLAYERS_SQL, LOAD_MEMBERS_SQL,
+                            LOAD_MATCHES_SQL, LOAD_PAIRINGS_SQL,
+                            LOAD_SNAPSHOTS_SQL):
+                    c.execute(sql, {'tid': tid})
+                    rows.append(c.fetchall())
+            players, members, matches, pairings, snapshots = rows
+            with self._stateLock:
+                self._forget([tid])
+                self.memory.loadTournament(
+                    tid, players, [row[0] for row in members], matches,
+                    pairings, snapshots)
+                self._loaded.add(tid)
+                self._stats['loads'] += 1
+
+    def _unload(self, tid):
+        with self._stateLock:
+            self._forget([tid])
+            self._loaded.discard(tid)
+            self.memory.deleteTournament(tid)
+
+    def _reset(self):
+        """Replaces memory by a fresh copy of all loaded tournaments, after
+        writes which change players or matches of all of them."""
+        with self._stateLock:
+            tids = sorted(self._loaded)
+            self._forget(tids)
+            self.memory = MemoryBackend()
+            self._loaded.clear()
+        self._load(tids)
+
+    def _forget(self, tids):
+        """Drops cached answers of tournaments tids."""
+        with self._stateLock:
+            for tid in tids:
+                for line in self._tidAnswers.pop(tid, ()):
+                    self._answers.pop(line, None)
+
+    def _encode(self, answer):
+        return (json.dumps(answer, separators=(',', ':')) + '\n').encode(
+            'utf-8')
+
+    def _error(self, e):
+        if isinstance(e, psycopg2.IntegrityError):
+            kind = 'IntegrityError'
+        elif isinstance(e, psycopg2.Error):
+            kind = 'DatabaseError'
+        elif isinstance(e, (ValueError, TypeError, KeyError)):
+            kind = type(e).__name__
+        else:
+            kind = 'DaemonError'
+            log.exception("Request failed")
+        return {'error': kind, 'message': str(e)}
+
+
+def _arguments(name, args, kwargs):
+    """Returns a dict of all arguments of function name of tournament.py,
+    including defaults."""
+    signature = _signatures.get(name)
+    if signature is None:
+        signature = _signatures[name] = inspect.signature(
+            getattr(tournament, name))
+    bound = signature.bind(*args, **kwargs)
+    bound.apply_defaults()
+    return bound.arguments
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Answers the requests of one client connection, one line each."""
+
+    def handle(self):
+        daemon = self.server.daemon
+        with daemon._stateLock:
+            daemon._connections.add(self.connection)
+        try:
+            for line in self.rfile:
+                if not line.endswith(b'\n'):
+                    break  # cut off by a client which went away
+                self.wfile.write(daemon.respond(line))
+        except OSError:
+            pass  # the client went away
+        finally:
+            with daemon._stateLock:
+                daemon._connections.discard(self.connection)
+
+
+def _tuples(result):
+    """Returns a list of rows decoded from JSON as a list of tuples."""
+    if isinstance(result, list):
+        return [tuple(row) if isinstance(row, list) else row
+                for row in result]
+    return result
+
+
+def _round(result):
+    number, pairs, bye = result
+    return number, _tuples(pairs), bye
+
+
+def _batch(result):
+    pairings, report = result
+    return (dict((int(tid), _tuples(pairs)) for tid, pairs
+                 in pairings.items()),
+            dict((int(tid), row) for tid, row in report.items()))
+
+
+_ERRORS = {'IntegrityError': psycopg2.IntegrityError,
+           'DatabaseError': psycopg2.DatabaseError,
+           'ValueError': ValueError, 'TypeError': TypeError,
+           'KeyError': KeyError}
+
+
+def _remote(name, convert=_tuples):
+    """Returns a DaemonBackend method, which calls function name."""
+    def method(self, *args, **kwargs):
+        return convert(self.call(name, *args, **kwargs))
+    method.__name__ = name
+    method.__doc__ = "Calls tournament.{name}() in the daemon.".format(
+        name=name)
+    return method
+
+
+class DaemonBackend(object):
+    """Client of a TournamentDaemon with the methods of the module functions
+    of tournament.py, so it can be selected by tournament.setBackend.
+
+    Args:
+      path: path of the socket of the daemon
+      timeout: seconds to wait for an answer
+
+    Every thread has a connection of its own. If the connection breaks
+    (e.g. the daemon was restarted), a request is sent again over a new
+    connection, unless it is a write, which was sent already and may have
+    been committed: it raises DaemonError. Errors of the functions are
+    raised as in the daemon (IntegrityError, ValueError), others as
+    DaemonError. Sessions (tournament.Tournament) are not supported.
+    """
+
+    def __init__(self, path=DAEMON_SOCKET, timeout=DAEMON_TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def call(self, name, *args, **kwargs):
+        """Calls function name in the daemon and returns its result as
+        decoded from JSON (lists instead of tuples)."""
+        line = (json.dumps({'call': name, 'args': args, 'kwargs': kwargs},
+                           separators=(',', ':')) + '\n').encode('utf-8')
+        for attempt in (1, 2):
+            sent = False
+            try:
+                stream = self._stream()
+                stream.write(line)
+                stream.flush()
+                sent = True
+                answer = stream.readline()
+                if not answer:
+                    raise ConnectionError("The daemon closed the "
+                                          "connection")
+                break
+            except OSError as e:
+                self.close()
+                # a request which was not sent, or a read, is sent again
+                if attempt == 2 or (sent and name not in _RETRIED):
+                    raise DaemonError("Call {name} failed: {error}".format(
+                        name=name, error=e))
+        answer = json.loads(answer.decode('utf-8'))
+        if 'error' in answer:
+            raise _ERRORS.get(answer['error'], DaemonError)(
+                answer['message'])
+        return answer['result']
+
+    def close(self):
+        """Closes the connection of this thread."""
+        stream = getattr(self._local, 'stream', None)
+        if stream is not None:
+            self._local.stream = None
+            try:
+                stream.close()
+                self._local.socket.close()
+            except OSError:
+                pass
+
+    def reload(self, tids=None):
+        """Makes the daemon load tournaments tids (all loaded ones if None)
+        from the database again. Returns their ids."""
+        return self.call('reload', tids)
+
+    def stats(self):
+        """Returns statistics of the daemon, see TournamentDaemon.stats."""
+        return self.call('stats')
+
+    def begin(self):
+        raise DaemonError("Sessions are not supported by the daemon")
+
+    def iterStandings(self, tid=0, batchSize=tournament.STREAM_BATCH_SIZE):
+        """Yields standings rows, see tournament.iterStandings."""
+        for row in self.playerStandings(tid):
+            yield row
+
+    deleteMatches = _remote('deleteMatches')
+    deletePlayers = _remote('deletePlayers')
+    countPlayers = _remote('countPlayers')
+    registerPlayer = _remote('registerPlayer')
+    registerPlayers = _remote('registerPlayers')
+    registerPlayerForTournament = _remote('registerPlayerForTournament')
+    playerStandings = _remote('playerStandings')
+    standingsPage = _remote('standingsPage')
+    playerStandingsWithBye = _remote('playerStandingsWithBye')
+    playerStandingsWithTiebreaks = _remote('playerStandingsWithTiebreaks')
+    reportMatch = _remote('reportMatch')
+    reportMatches = _remote('reportMatches')
+    correctMatch = _remote('correctMatch')
+    deleteMatch = _remote('deleteMatch')
+    deleteTournament = _remote('deleteTournament')
+    archiveTournament = _remote('archiveTournament')
+    verifyStandings = _remote('verifyStandings')
+    rebuildStandings = _remote('rebuildStandings')
+    playerRatings = _remote('playerRatings')
+    recomputeRatings = _remote('recomputeRatings')
+    playerCareer = _remote('playerCareer', tuple)
+    playerHistory = _remote('playerHistory')
+    headToHead = _remote('headToHead', tuple)
+    swissPairings = _remote('swissPairings')
+    startRound = _remote('startRound', _round)
+    roundPairings = _remote('roundPairings')
+    pairingQuality = _remote('pairingQuality')
+    swissPairingsBatch = _remote('swissPairingsBatch', _batch)
+
+    def _stream(self):
+        stream = getattr(self._local, 'stream', None)
+        if stream is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except OSError:
+                sock.close()
+                raise
+            self._local.socket = sock
+            stream = self._local.stream = sock.makefile('rwb')
+        return stream
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Tournament daemon serving standings and pairings from "
+                    "memory")
+    parser.add_argument('--socket', default=DAEMON_SOCKET,
+                        help="path of the Unix domain socket")
+    parser.add_argument('--dsn', default=tournament.DSN)
+    parser.add_argument('--tids', default='',
+                        help="comma separated tournaments to load at start")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    tournament.DSN = args.dsn
+    daemon = TournamentDaemon(args.socket, [int(tid) for tid
+                                            in args.tids.split(',') if tid])
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever, which runs in this thread
+        threading.Thread(target=daemon.shutdown).start()
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    log.info("Serving on %s", args.socket)
+    daemon.serve()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,770 @@
+#!/usr/bin/env python
+#
+# tournament_memory.py -- in-memory backend for tournament.py
+#
+# Keeps players, results and standings in process memory, so the functions
+# of tournament.py can be run without PostgreSQL (simulations, load tests,
+# what-if pairing). Select it with tournament.setBackend('memory').
+#
+
+import bisect
+import copy
+import threading
+from array import array
+
+import tournament
+from tournament_pairing import PAIRING_GREEDY, pairRound, seededStanding
+from tournament_pairing import pairingQuality as measurePairing
+from tournament_ratings import INITIAL_RATING, replayRatings, updateRatings
+
+
+class _Player(object):
+    __slots__ = ('pid', 'name')
+
+    def __init__(self, pid, name):
+        self.pid = pid
+        self.name = name
+
+
+class _Match(object):
+    __slots__ = ('mid', 'tid', 'player1', 'p1points', 'player2', 'p2points',
+                 'round')
+
+    def __init__(self, mid, tid, player1, p1points, player2, p2points,
+                 round=0):
+        self.mid = mid
+        self.tid = tid
+        self.player1 = player1
+        self.p1points = p1points
+        self.player2 = player2
+        self.p2points = p2points
+        self.round = round
+
+
+class _Tournament(object):
+    """Standings, match history and stored rounds of one tournament.
+
+    Points, numbers of matches and stored byes are arrays indexed by the
+    position of the player in ranked, so they grow with the number of
+    players in the tournament, not with their ids. Players appear in the
+    standings once they are registered or have played a match. Every stored
+    round is a list of pairings [player1, player2 or None for the bye, mid
+    or None until the result is reported]. Every pair of players has at most
+    one result in a stored round.
+    """
+    __slots__ = ('members', 'index', 'ranked', 'points', 'matches', 'byes',
+                 'opponents', 'mids', 'rounds', 'waiting', 'paired',
+                 'snapshots', 'results')
+
+    def __init__(self):
+        self.members = set()       # registered pids
+        self.index = {}            # pid -> position in ranked and arrays
+        self.ranked = []           # pids in standings, in order of addition
+        self.points = array('l')
+        self.matches = array('l')
+        self.byes = array('l')
+        self.opponents = {}        # pid -> set of pids of opponents
+        self.mids = set()          # ids of matches of this tournament
+        self.rounds = []           # stored rounds, see startRound
+        self.waiting = {}          # players -> pairing waiting for result
+        self.paired = {}           # mid -> pairing it is the result of
+        self.snapshots = {}        # round -> {pid: [points, matches]}
+        self.results = {}          # (round, players) -> mid, rounds from 1
+
+    def list(self, pid):
+        """Makes sure that pid has a (possibly zero) row in standings.
+        Returns the position of the row in the arrays."""
+        i = self.index.get(pid)
+        if i is None:
+            i = self.index[pid] = len(self.ranked)
+            self.ranked.append(pid)
+            self.points.append(0)
+            self.matches.append(0)
+            self.byes.append(0)
+        return i
+
+
+class MemoryBackend(object):
+    """Implements the data functions of tournament.py in process memory.
+
+    Methods have the same signatures and semantics as the module functions
+    of tournament.py. Ids are assigned from 1 and never reused, like serial
+    columns of the database. Errors, which the database reports with
+    integrity errors, are raised as ValueError.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._players = {}      # pid -> _Player
+        self._matches = {}      # mid -> _Match
+        self._tournaments = {}  # tid -> _Tournament
+        self._archived = {}     # tid -> (_Tournament, list of its _Match)
+        self._ratings = {}      # pid -> (rating, games)
+        self._nextPid = 1
+        self._nextMid = 1
+
+    def begin(self):
+        """Starts a session (see tournament.Tournament): other threads are
+        blocked until end() is called. Returns a snapshot of the data."""
+        self._lock.acquire()
+        return self.snapshot()
+
+    def end(self):
+        """Ends a session started by begin()."""
+        self._lock.release()
+
+    def snapshot(self):
+        """Returns a copy of all players, matches and standings, which can
+        be given to restore() once. Takes time proportional to the data."""
+        with self._lock:
+            return copy.deepcopy((self._players, self._matches,
+                                  self._tournaments, self._archived,
+                                  self._ratings))
+
+    def restore(self, snapshot):
+        """Replaces all data by a snapshot taken before. Ids assigned since
+        the snapshot are not given out again, like sequences of the
+        database."""
+        with self._lock:
+            (self._players, self._matches, self._tournaments,
+             self._archived, self._ratings) = snapshot
+
+    def deleteMatches(self):
+        """Remove all the match records."""
+        with self._lock:
+            self._matches.clear()
+            self._ratings.clear()
+            for tid, old in list(self._tournaments.items()):
+                t = self._tournaments[tid] = _Tournament()
+                t.members = old.members
+                for pid in sorted(old.members):
+                    t.list(pid)
+
+    def deletePlayers(self):
+        """Remove all the player records."""
+        with self._lock:
+            if self._matches:
+                raise ValueError("Players can not be deleted while they "
+                                 "have matches")
+            self._players.clear()
+            self._tournaments.clear()
+            self._ratings.clear()
+
+    def countPlayers(self):
+        """Returns the number of players currently registered."""
+        return len(self._players)
+
+    def registerPlayer(self, name, tid=0):
+        """Adds a player, returns his id."""
+        return self.registerPlayers([name], tid)[0]
+
+    def registerPlayers(self, names, tid=0):
+        """Adds many players, returns their ids in the order of names."""
+        return self.addPlayers(names, tid)
+
+    def addPlayers(self, names, tid=0, pids=None):
+        """Adds many players like registerPlayers, with ids pids assigned by
+        the caller (e.g. by the database, see tournament_daemon.py) or new
+        ids if pids is None. Returns their ids in the order of names."""
+        names = list(names)
+        with self._lock:
+            if pids is None:
+                pids = list(range(self._nextPid, self._nextPid + len(names)))
+            self._nextPid = max([self._nextPid] + [pid + 1 for pid in pids])
+            for pid, name in zip(pids, names):
+                self._players[pid] = _Player(pid, name)
+            self._addTournamentMembers(pids, tid)
+        return pids
+
+    def registerPlayerForTournament(self, pid, tid=0):
+        """Adds an already registered player to one more tournament."""
+        with self._lock:
+            self._checkPlayers([pid])
+            self._addTournamentMembers([pid], tid)
+
+    def playerStandings(self, tid=0, round=None):
+        """Returns a list of (id, name, points, matches) sorted by points,
+        after round round if it is given, see tournament.playerStandings."""
+        with self._lock:
+            t = self._tournaments.get(tid)
+            if t is None:
+                return []
+            if round is not None and round < len(t.rounds):
+                results = self._roundStandings(t, round)
+                rows = [(pid, self._players[pid].name) + tuple(results[pid])
+                        for pid in results]
+            else:
+                rows = [(pid, self._players[pid].name, points, matches)
+                        for pid, points, matches
+                        in zip(t.ranked, t.points, t.matches)]
+        rows.sort(key=lambda row: (-row[2], -row[3], row[0]))
+        return rows
+
+    def iterStandings(self, tid=0,
+                      batchSize=tournament.STREAM_BATCH_SIZE):
+        """Yields standings rows, see tournament.iterStandings."""
+        for row in self.playerStandings(tid):
+            yield row
+
+    def standingsPage(self, tid=0, limit=tournament.STANDINGS_PAGE_SIZE,
+                      after=None, offset=0):
+        """Returns one page of standings, see tournament.standingsPage."""
+        rows = self.playerStandings(tid)
+        start = offset
+        if after is not None:
+            keys = [(-row[2], -row[3], row[0]) for row in rows]
+            start += bisect.bisect_right(keys,
+                                         (-after[2], -after[3], after[0]))
+        return rows[start:start + limit]
+
+    def playerStandingsWithBye(self, tid=0):
+        """Returns standings including points for "Bye" (skipped rounds)."""
+        with self._lock:
+            rows = self.playerStandings(tid)
+            byes = self._storedByes(tid)
+        if byes is None:
+            maxMatches = max([row[3] for row in rows] or [0])
+            byes = dict((row[0], maxMatches - row[3]) for row in rows)
+        return [(pid, name,
+                 points + byes.get(pid, 0) * tournament.POINTS_FOR_BYE,
+                 matches)
+                for pid, name, points, matches in rows]
+
+    def playerStandingsWithTiebreaks(self, tid=0):
+        """Returns standings with points for "Bye" and tiebreaks, see
+        tournament.playerStandingsWithTiebreaks."""
+        with self._lock:
+            rows = self.playerStandingsWithBye(tid)
+            t = self._tournaments.get(tid)
+            games = ([self._matches[mid] for mid in t.mids]
+                     if t is not None else [])
+        rounds = max([row[3] for row in rows] or [0])
+        points = dict((row[0], row[2]) for row in rows)
+        win = tournament.POINTS_FOR_WIN
+
+        # pid -> [buchholz, sonneborn-berger sum, omw sum, games]
+        tiebreaks = dict((pid, [0, 0, 0.0, 0]) for pid in points)
+        for match in games:
+            for pid, gamePoints, opponent in (
+                    (match.player1, match.p1points, match.player2),
+                    (match.player2, match.p2points, match.player1)):
+                row = tiebreaks[pid]
+                row[0] += points[opponent]
+                row[1] += points[opponent] * gamePoints
+                row[2] += max(tournament.MIN_MATCH_WIN_PERCENT,
+                              float(points[opponent]) / (win * rounds))
+                row[3] += 1
+
+        rows = [(pid, name, score, matches, tiebreaks[pid][0],
+                 float(tiebreaks[pid][1]) / win,
+                 tiebreaks[pid][2] / tiebreaks[pid][3]
+                 if tiebreaks[pid][3] else 0.0)
+                for pid, name, score, matches in rows]
+        rows.sort(key=lambda row: (-row[2], -row[4], -row[5], -row[6],
+                                   row[0]))
+        return rows
+
+    def reportMatch(self, winner, loser, isDraw=False, tid=0):
+        """Records the outcome of a single match, returns its id."""
+        return self.reportMatches([(winner, loser, isDraw)], tid)[0]
+
+    def reportMatches(self, results, tid=0):
+        """Records the outcomes of many matches, returns their ids."""
+        return self.addMatches(results, tid)
+
+    def addMatches(self, results, tid=0, mids=None):
+        """Records the outcomes of many matches like reportMatches, with ids
+        mids assigned by the caller (e.g. by the database, see
+        tournament_daemon.py) or new ids if mids is None. Returns their ids.
+        """
+        rows = []
+        for result in results:
+            if len(result) == 2:
+                winner, loser = result
+                isDraw = False
+            else:
+                winner, loser, isDraw = result
+            rows.append((winner, loser) + self._matchPoints(isDraw))
+
+        with self._lock:
+            self._checkPlayers([row[0] for row in rows] +
+                               [row[1] for row in rows])
+            t = self._tournament(tid)
+            self._checkResults(t, len(t.rounds),
+                               [(row[0], row[1]) for row in rows])
+            if mids is None:
+                mids = list(range(self._nextMid, self._nextMid + len(rows)))
+            self._nextMid = max([self._nextMid] + [mid + 1 for mid in mids])
+            for mid, (winner, loser, p1points, p2points) in zip(mids, rows):
+                # results belong to the last started round (0 before)
+                match = _Match(mid, tid, winner, p1points, loser, p2points,
+                               len(t.rounds))
+                self._matches[match.mid] = match
+                t.mids.add(match.mid)
+                self._apply(t, match, 1)
+                if match.round:
+                    t.results[(match.round,
+                               frozenset((winner, loser)))] = match.mid
+                pairing = t.waiting.pop(frozenset((winner, loser)), None)
+                if pairing is not None:
+                    pairing[2] = match.mid
+                    t.paired[match.mid] = pairing
+            updateRatings(self._ratings, [(winner, p1points, loser, p2points)
+                                          for winner, loser, p1points,
+                                          p2points in rows])
+        return mids
+
+    def correctMatch(self, mid, winner, loser, isDraw=False):
+        """Replaces the outcome of an already reported match."""
+        p1points, p2points = self._matchPoints(isDraw)
+        with self._lock:
+            match = self._match(mid)
+            self._checkPlayers([winner, loser])
+            t = self._tournaments[match.tid]
+            old = (match.round, frozenset((match.player1, match.player2)))
+            if match.round and old[1] != frozenset((winner, loser)):
+                self._checkResults(t, match.round, [(winner, loser)])
+                del t.results[old]
+                t.results[(match.round, frozenset((winner, loser)))] = mid
+            t.mids.discard(mid)
+            self._apply(t, match, -1)
+            self._applySnapshots(t, match, -1)
+            match.player1, match.p1points = winner, p1points
+            match.player2, match.p2points = loser, p2points
+            t.mids.add(mid)
+            self._apply(t, match, 1)
+            self._applySnapshots(t, match, 1)
+
+    def deleteMatch(self, mid):
+        """Removes a single match record and takes it out of the standings.
+        """
+        with self._lock:
+            match = self._match(mid)
+            t = self._tournaments[match.tid]
+            del self._matches[mid]
+            t.mids.discard(mid)
+            t.results.pop((match.round,
+                           frozenset((match.player1, match.player2))), None)
+            self._apply(t, match, -1)
+            self._applySnapshots(t, match, -1)
+            pairing = t.paired.pop(mid, None)
+            if pairing is not None:
+                pairing[2] = None
+                if any(p is pairing for p in t.rounds[-1]):
+                    t.waiting[frozenset(pairing[:2])] = pairing
+
+    def deleteTournament(self, tid):
+        """Removes all matches, members and standings of one tournament,
+        including its archive."""
+        with self._lock:
+            self._archived.pop(tid, None)
+            t = self._tournaments.pop(tid, None)
+            if t is not None:
+                for mid in t.mids:
+                    del self._matches[mid]
+
+    def archiveTournament(self, tid):
+        """Moves a tournament out of the live tournaments, see
+        tournament.archiveTournament."""
+        with self._lock:
+            if tid in self._archived:
+                raise ValueError("Tournament {tid} is already archived".format(
+                    tid=tid))
+            t = self._tournaments.get(tid)
+            if t is None or not t.ranked:
+                raise ValueError("There is no tournament with id {tid}".format(
+                    tid=tid))
+            del self._tournaments[tid]
+            self._archived[tid] = (t, [self._matches.pop(mid)
+                                       for mid in sorted(t.mids)])
+
+    def verifyStandings(self, tid=None):
+        """Compares maintained standings with standings recomputed from the
+        matches, see tournament.verifyStandings."""
+        with self._lock:
+            drift = []
+            for t_id in sorted(self._tournaments):
+                if tid is not None and t_id != tid:
+                    continue
+                t = self._tournaments[t_id]
+                actual = dict((pid, [0, 0]) for pid in t.members)
+                for mid in t.mids:
+                    match = self._matches[mid]
+                    for pid, points in ((match.player1, match.p1points),
+                                        (match.player2, match.p2points)):
+                        row = actual.setdefault(pid, [0, 0])
+                        row[0] += points
+                        row[1] += 1
+                for pid in sorted(set(actual) | set(t.ranked)):
+                    i = t.index.get(pid)
+                    stored = ((t.points[i], t.matches[i])
+                              if i is not None else (None, None))
+                    computed = tuple(actual.get(pid, (None, None)))
+                    if stored != computed:
+                        drift.append((t_id, pid) + stored + computed)
+            return drift
+
+    def rebuildStandings(self, tid=None):
+        """In memory standings can not drift, so this only verifies them."""
+        return self.verifyStandings(tid)
+
+    def playerRatings(self, tid=0):
+        """Returns members of a tournament as (id, name, rating, games),
+        the highest rating first."""
+        with self._lock:
+            rows = [(pid, name) + self._ratings.get(pid, (INITIAL_RATING, 0))
+                    for pid, name, points, matches
+                    in self.playerStandings(tid)]
+        rows.sort(key=lambda row: (-row[2], row[0]))
+        return rows
+
+    def recomputeRatings(self):
+        """Recomputes ratings from all matches, returns the number of rated
+        players."""
+        with self._lock:
+            self._ratings = replayRatings(
+                [(match.player1, match.p1points, match.player2,
+                  match.p2points)
+                 for mid, match in sorted(self._matches.items())])
+            return len(self._ratings)
+
+    def playerCareer(self, pid):
+        """Returns (matches, wins, draws, losses, points, tournaments) of a
+        player, see tournament.playerCareer."""
+        return tournament._careerRecord(self.playerHistory(pid))
+
+    def playerHistory(self, pid):
+        """Returns (tid, matches, wins, draws, losses, points) of a player
+        in every tournament by tid. Scans all matches."""
+        records = {}
+        for tid, opponent, points, opponentPoints in self._results(pid):
+            record = records.setdefault(tid, [0, 0, 0, 0, 0])
+            self._count(record, points, opponentPoints)
+        return [(tid,) + tuple(record)
+                for tid, record in sorted(records.items())]
+
+    def headToHead(self, pid, opponent):
+        """Returns (matches, wins, draws, losses, points, opponentPoints) of
+        a player against another one, see tournament.headToHead."""
+        record = [0, 0, 0, 0, 0, 0]
+        for tid, other, points, opponentPoints in self._results(pid):
+            if other == opponent:
+                self._count(record, points, opponentPoints)
+                record[5] += opponentPoints
+        return tuple(record)
+
+    def swissPairings(self, tid=0, mode=PAIRING_GREEDY,
+                      timeBudget=tournament.PAIRING_TIME_BUDGET,
+                      seeded=False):
+        """Returns a list of (id1, name1, id2, name2) for the next round,
+        the stored pairings of a started round which waits for results."""
+        with self._lock:
+            t = self._tournaments.get(tid)
+            if t is not None and t.waiting:
+                return [row[:4] for row in self.roundPairings(tid)
+                        if row[2] is not None]
+            return self._pairNextRound(tid, mode, timeBudget, seeded)[0]
+
+    def startRound(self, tid=0, mode=PAIRING_GREEDY,
+                   timeBudget=tournament.PAIRING_TIME_BUDGET, seeded=False):
+        """Pairs the next round and stores it, see tournament.startRound.
+        Returns (round, pairings, bye)."""
+        with self._lock:
+            t = self._tournaments.get(tid)
+            if t is not None and t.waiting:
+                pairings = self.roundPairings(tid)
+                byes = [row[0] for row in pairings if row[2] is None]
+                return (len(t.rounds), [row[:4] for row in pairings
+                                        if row[2] is not None],
+                        byes[0] if byes else None)
+
+            pairs, standing = self._pairNextRound(tid, mode, timeBudget,
+                                                  seeded)
+            if not standing:
+                raise ValueError("There is no tournament with id {tid}".format(
+                    tid=tid))
+            paired = set([pair[0] for pair in pairs] +
+                         [pair[2] for pair in pairs])
+            byes = [row[0] for row in standing if row[0] not in paired]
+            bye = byes[0] if byes else None
+            return self.addRound(pairs, bye, tid), pairs, bye
+
+    def addRound(self, pairs, bye, tid=0):
+        """Stores the next round of tournament tid with pairings pairs (list
+        of (id1, name1, id2, name2)) and the bye (None if there is none),
+        like startRound (e.g. a round started in the database, see
+        tournament_daemon.py). Returns the number of the round."""
+        with self._lock:
+            t = self._tournament(tid)
+            if t.rounds and len(t.rounds) % tournament.SNAPSHOT_INTERVAL == 0:
+                # all results so far belong to the finished round or before
+                t.snapshots[len(t.rounds)] = dict(
+                    (pid, [points, matches]) for pid, points, matches
+                    in zip(t.ranked, t.points, t.matches))
+            stored = [[pair[0], pair[2], None] for pair in pairs]
+            t.waiting = dict((frozenset(pairing[:2]), pairing)
+                             for pairing in stored)
+            if bye is not None:
+                stored.append([bye, None, None])
+                t.byes[t.list(bye)] += 1
+            t.rounds.append(stored)
+            return len(t.rounds)
+
+    def loadTournament(self, tid, players, members, matches, pairings,
+                       snapshots):
+        """Replaces tournament tid by rows read from the database (see
+        tournament_daemon.py), keeping their ids.
+
+        Args:
+          players: list of (pid, name) of the members and of the players of
+            matches and pairings
+          members: list of pids of the members
+          matches: list of (mid, player1, p1points, player2, p2points,
+            round), in the order they were reported
+          pairings: list of (round, board, player1, player2, mid) of the
+            stored rounds (player2 and mid None for the bye)
+          snapshots: list of (round, pid, points, matches), checkpoints of
+            standings (see tournament.playerStandings)
+        """
+        with self._lock:
+            old = self._tournaments.pop(tid, None)
+            if old is not None:
+                for mid in old.mids:
+                    del self._matches[mid]
+            for pid, name in players:
+                self._players[pid] = _Player(pid, name)
+
+            t = self._tournaments[tid] = _Tournament()
+            for pid in sorted(members):
+                t.members.add(pid)
+                t.list(pid)
+            for round, board, player1, player2, mid in sorted(pairings):
+                while len(t.rounds) < round:
+                    t.rounds.append([])
+                pairing = [player1, player2, mid]
+                t.rounds[round - 1].append(pairing)
+                if player2 is None:
+                    t.byes[t.list(player1)] += 1
+                elif mid is not None:
+                    t.paired[mid] = pairing
+            if t.rounds:
+                t.waiting = dict((frozenset(pairing[:2]), pairing)
+                                 for pairing in t.rounds[-1]
+                                 if pairing[1] is not None and
+                                 pairing[2] is None)
+            for mid, player1, p1points, player2, p2points, round in matches:
+                match = _Match(mid, tid, player1, p1points, player2,
+                               p2points, round)
+                self._matches[mid] = match
+                t.mids.add(mid)
+                self._apply(t, match, 1)
+                if round:
+                    t.results[(round, frozenset((player1, player2)))] = mid
+            for round, pid, points, matches in snapshots:
+                t.snapshots.setdefault(round, {})[pid] = [points, matches]
+            self._nextPid = max([self._nextPid] +
+                                [pid + 1 for pid, name in players])
+            self._nextMid = max([self._nextMid] +
+                                [row[0] + 1 for row in matches])
+
+    def roundPairings(self, tid=0, round=None):
+        """Returns stored pairings of a round (the last one by default) as
+        (id1, name1, id2, name2, mid), see tournament.roundPairings."""
+        with self._lock:
+            t = self._tournaments.get(tid)
+            if t is None or not t.rounds:
+                return []
+            if round is None:
+                round = len(t.rounds)
+            if not 1 <= round <= len(t.rounds):
+                return []
+            return [(player1, self._players[player1].name, player2,
+                     self._players[player2].name
+                     if player2 is not None else None, mid)
+                    for player1, player2, mid in t.rounds[round - 1]]
+
+    def swissPairingsBatch(self, tids, mode=PAIRING_GREEDY,
+                           timeBudget=tournament.PAIRING_TIME_BUDGET,
+                           processes=tournament.PAIRING_PROCESSES):
+        """Pairs the next round of many tournaments at once, see
+        tournament.swissPairingsBatch."""
+        jobs = []
+        started = {}  # tid -> pairings of rounds waiting for results
+        with self._lock:
+            for tid in sorted(set(tids)):
+                t = self._tournaments.get(tid)
+                if t is not None and t.waiting:
+                    started[tid] = self.swissPairings(tid)
+                    continue
+                matches = ([(self._matches[mid].player1,
+                             self._matches[mid].player2) for mid in t.mids]
+                           if t is not None else [])
+                jobs.append((tid, self.playerStandings(tid), matches,
+                             self._storedByes(tid), mode, timeBudget))
+            players = dict((tid, len(self.playerStandings(tid)))
+                           for tid in started)
+        pairings, report = tournament._runPairingJobs(jobs, processes)
+        for tid, pairs in started.items():
+            pairings[tid] = pairs
+            report[tid] = {'players': players[tid], 'pairs': len(pairs),
+                           'seconds': 0.0, 'error': None}
+        return pairings, report
+
+    def pairingQuality(self, pairings, tid=0):
+        """Measures the quality of pairings, see tournament.pairingQuality.
+        """
+        with self._lock:
+            standing = self.playerStandings(tid)
+            t = self._tournaments.get(tid)
+            opponents = t.opponents if t is not None else {}
+            return measurePairing(pairings, standing, opponents,
+                                  self._storedByes(tid))
+
+    def _roundStandings(self, t, round):
+        """Returns {pid: [points, matches]} of tournament t after round
+        round: the nearest checkpoint and the results of later rounds."""
+        checkpoints = [number for number in t.snapshots if number <= round]
+        if checkpoints:
+            checkpoint = max(checkpoints)
+            results = dict((pid, list(row)) for pid, row
+                           in t.snapshots[checkpoint].items())
+        else:
+            checkpoint = -1
+            results = dict((pid, [0, 0]) for pid in t.members)
+        for mid in t.mids:
+            match = self._matches[mid]
+            if checkpoint < match.round <= round:
+                for pid, points in ((match.player1, match.p1points),
+                                    (match.player2, match.p2points)):
+                    row = results.setdefault(pid, [0, 0])
+                    row[0] += points
+                    row[1] += 1
+        return results
+
+    def _applySnapshots(self, t, match, sign):
+        """Adds (sign=1) or removes (sign=-1) a match to/from checkpoints of
+        its round and later rounds."""
+        for number, results in t.snapshots.items():
+            if number >= match.round:
+                for pid, points in ((match.player1, match.p1points),
+                                    (match.player2, match.p2points)):
+                    row = results.setdefault(pid, [0, 0])
+                    row[0] += sign * points
+                    row[1] += sign
+
+    def _pairNextRound(self, tid, mode, timeBudget, seeded):
+        """Returns (pairings of the next round, standings they were made
+        from) of tournament tid."""
+        standing = self.playerStandings(tid)
+        if seeded:
+            standing = seededStanding(standing, dict(
+                (row[0], row[2]) for row in self.playerRatings(tid)))
+        t = self._tournaments.get(tid)
+        opponents = t.opponents if t is not None else {}
+        return (pairRound(standing, opponents, mode, timeBudget,
+                          self._storedByes(tid)), standing)
+
+    def _storedByes(self, tid):
+        """Returns dict {pid: byes} of a tournament with stored rounds, None
+        for other tournaments (byes are derived from matches)."""
+        t = self._tournaments.get(tid)
+        if t is None or not t.rounds:
+            return None
+        return dict((pid, byes) for pid, byes in zip(t.ranked, t.byes)
+                    if byes)
+
+    def _results(self, pid):
+        """Returns (tid, opponent, points, opponentPoints) of every match
+        of player pid."""
+        with self._lock:
+            return [(match.tid, match.player2, match.p1points,
+                     match.p2points) if match.player1 == pid
+                    else (match.tid, match.player1, match.p2points,
+                          match.p1points)
+                    for match in self._matches.values()
+                    if pid in (match.player1, match.player2)]
+
+    def _count(self, record, points, opponentPoints):
+        """Adds a match to record [matches, wins, draws, losses, points]."""
+        record[0] += 1
+        if points > opponentPoints:
+            record[1] += 1
+        elif points == opponentPoints:
+            record[2] += 1
+        else:
+            record[3] += 1
+        record[4] += points
+
+    def _tournament(self, tid):
+        t = self._tournaments.get(tid)
+        if t is None:
+            t = self._tournaments[tid] = _Tournament()
+        return t
+
+    def _addTournamentMembers(self, pids, tid):
+        t = self._tournament(tid)
+        for pid in pids:
+            if pid in t.members:
+                raise ValueError("Player {pid} is already registered for "
+                                 "tournament {tid}".format(pid=pid, tid=tid))
+        for pid in pids:
+            t.members.add(pid)
+            t.list(pid)
+
+    def _checkResults(self, t, round, pairs):
+        """Raises ValueError if a pair of players (winner, loser) already
+        has a result in stored round round (or twice in pairs)."""
+        if not round:
+            return
+        seen = set()
+        for pair in pairs:
+            players = frozenset(pair)
+            if (round, players) in t.results or players in seen:
+                raise ValueError("Players {a} and {b} already have a result "
+                                 "in round {round}".format(
+                                     a=pair[0], b=pair[1], round=round))
+            seen.add(players)
+
+    def _checkPlayers(self, pids):
+        for pid in pids:
+            if pid not in self._players:
+                raise ValueError("There is no player with id {pid}".format(
+                    pid=pid))
+
+    def _match(self, mid):
+        match = self._matches.get(mid)
+        if match is None:
+            raise ValueError("There is no match with id {mid}".format(
+                mid=mid))
+        return match
+
+    def _matchPoints(self, isDraw):
+        if isDraw:
+            return tournament.POINTS_FOR_DRAW, tournament.POINTS_FOR_DRAW
+        return tournament.POINTS_FOR_WIN, 0
+
+    def _apply(self, t, match, sign):
+        """Adds (sign=1) or removes (sign=-1) a match to/from standings.
+
+        A removed match must not be in t.mids any more.
+        """
+        i1 = t.list(match.player1)
+        i2 = t.list(match.player2)
+        t.points[i1] += sign * match.p1points
+        t.points[i2] += sign * match.p2points
+        t.matches[i1] += sign
+        t.matches[i2] += sign
+
+        if sign > 0:
+            t.opponents.setdefault(match.player1, set()).add(match.player2)
+            t.opponents.setdefault(match.player2, set()).add(match.player1)
+        else:
+            # players may have played each other more than once
+            for pid in (match.player1, match.player2):
+                t.opponents[pid] = set()
+            for mid in t.mids:
+                other = self._matches[mid]
+                for pid, opponent in ((other.player1, other.player2),
+                                      (other.player2, other.player1)):
+                    if pid in (match.player1, match.player2):
+                        t.opponents[pid].add(opponent)
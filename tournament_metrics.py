@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+#
+# tournament_metrics.py -- instrumentation of tournament.py
+#
+# When metrics are enabled (tournament.configureMetrics), tournament.py
+# records every call of a public function, every SQL statement, every new
+# connection and pool checkout and the time spent pairing players. Each
+# record is (kind, name, seconds, rows) and is passed to all sinks: a log, an
+# in-memory histogram or statsd lines sent to a socket or written to a file.
+# Statements slower than a threshold are logged with their SQL.
+#
+
+import logging
+import re
+import socket
+import threading
+from timeit import default_timer as timer
+
+# Kinds of records
+KIND_FUNCTION = 'function'  # call of a public function, name of the function
+KIND_QUERY = 'query'        # SQL statement, "function#n" for its n-th one
+KIND_CONNECT = 'connect'    # new database connection
+KIND_CHECKOUT = 'checkout'  # connection taken from the pool (or opened)
+KIND_PAIRING = 'pairing'    # pairing players in Python, name of the function
+
+# Upper bounds of HistogramSink buckets, in milliseconds
+HISTOGRAM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500,
+                     1000, 2500, 5000, 10000)
+
+slowQueryLog = logging.getLogger('tournament.slowquery')
+
+
+class Metrics(object):
+    """Passes records to sinks and logs slow statements.
+
+    Args:
+      sinks: list of objects with a method record(kind, name, seconds, rows)
+      slowQueryThreshold: statements running at least this number of seconds
+        are logged to the 'tournament.slowquery' logger with their SQL and
+        parameters (None logs nothing)
+    """
+
+    def __init__(self, sinks, slowQueryThreshold=None):
+        self.sinks = list(sinks)
+        self.slowQueryThreshold = slowQueryThreshold
+
+    def record(self, kind, name, seconds, rows=None):
+        """Passes one record to every sink.
+
+        Args:
+          kind: one of the KIND_* constants
+          name: name of the function or statement
+          seconds: wall time
+          rows: number of rows returned, if known
+        """
+        for sink in self.sinks:
+            sink.record(kind, name, seconds, rows)
+
+    def recordQuery(self, name, seconds, rows, query, params):
+        """Records an SQL statement, logs it if it was slow."""
+        self.record(KIND_QUERY, name, seconds, rows)
+        if (self.slowQueryThreshold is not None and
+                seconds >= self.slowQueryThreshold):
+            if isinstance(query, bytes):
+                query = query.decode('utf-8', 'replace')
+            slowQueryLog.warning("%s took %.1f ms: %s %r", name,
+                                 seconds * 1000, ' '.join(query.split()),
+                                 params)
+
+
+class MeasuredCursor(object):
+    """Wraps a DB-API cursor and records every statement it executes.
+
+    Statements are named by the function which runs them and their number
+    within the call, e.g. "swissPairings#2". Everything else is delegated to
+    the wrapped cursor.
+    """
+
+    def __init__(self, cursor, metrics):
+        self.cursor = cursor
+        self.metrics = metrics
+        self.operation = 'sql'
+        self.statements = 0
+
+    def start(self, operation):
+        """Names the statements executed from now on after operation."""
+        self.operation = operation
+        self.statements = 0
+
+    def execute(self, query, vars=None):
+        start = timer()
+        try:
+            return self.cursor.execute(query, vars)
+        finally:
+            self._record(query, vars, timer() - start)
+
+    def executemany(self, query, vars_list):
+        vars_list = list(vars_list)
+        start = timer()
+        try:
+            return self.cursor.executemany(query, vars_list)
+        finally:
+            self._record(query, vars_list, timer() - start)
+
+    def _record(self, query, params, seconds):
+        self.statements += 1
+        name = '{operation}#{n}'.format(operation=self.operation,
+                                        n=self.statements)
+        rowcount = self.cursor.rowcount
+        self.metrics.recordQuery(name, seconds,
+                                 rowcount if rowcount >= 0 else None,
+                                 query, params)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class LoggingSink(object):
+    """Logs every record.
+
+    Args:
+      logger: logger to use ('tournament.metrics' by default)
+      level: level of the messages
+    """
+
+    def __init__(self, logger=None, level=logging.DEBUG):
+        self.logger = logger or logging.getLogger('tournament.metrics')
+        self.level = level
+
+    def record(self, kind, name, seconds, rows):
+        self.logger.log(self.level, "%s %s %.3f ms rows=%s", kind, name,
+                        seconds * 1000, rows)
+
+
+class HistogramSink(object):
+    """Aggregates records in memory.
+
+    Args:
+      buckets: upper bounds of the latency buckets, in milliseconds
+    """
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def record(self, kind, name, seconds, rows):
+        ms = seconds * 1000
+        key = kind + ':' + name
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {
+                    'calls': 0, 'seconds': 0.0, 'maxSeconds': 0.0,
+                    'rows': 0, 'buckets': [0] * (len(self.buckets) + 1)}
+            series['calls'] += 1
+            series['seconds'] += seconds
+            series['maxSeconds'] = max(series['maxSeconds'], seconds)
+            series['rows'] += rows or 0
+            index = 0
+            while index < len(self.buckets) and ms > self.buckets[index]:
+                index += 1
+            series['buckets'][index] += 1
+
+    def stats(self):
+        """Returns a dict {"kind:name": series}, where every series is a dict
+        with calls, seconds (total), maxSeconds, rows (total), buckets
+        (number of records in every bucket of self.buckets, the last one
+        counts records slower than all of them) and p50Ms, p99Ms (upper
+        bounds of the buckets of these percentiles, None if it is the
+        last one)."""
+        with self._lock:
+            stats = {}
+            for key, series in self._series.items():
+                series = dict(series, buckets=list(series['buckets']))
+                series['p50Ms'] = self._percentile(series, 0.5)
+                series['p99Ms'] = self._percentile(series, 0.99)
+                stats[key] = series
+            return stats
+
+    def reset(self):
+        """Forgets all records."""
+        with self._lock:
+            self._series.clear()
+
+    def _percentile(self, series, p):
+        counted = 0
+        for index, count in enumerate(series['buckets']):
+            counted += count
+            if counted >= p * series['calls']:
+                return (self.buckets[index] if index < len(self.buckets)
+                        else None)
+
+
+class StatsdSink(object):
+    """Writes records as statsd lines: "<prefix>.<kind>.<name>:<ms>|ms" and,
+    if rows are known, "<prefix>.<kind>.<name>.rows:<rows>|c".
+
+    Args:
+      address: (host, port) to send UDP datagrams to (e.g. a local statsd
+        agent), or a path of a file the lines are appended to
+      prefix: first part of every metric name
+    """
+
+    def __init__(self, address=('127.0.0.1', 8125), prefix='tournament'):
+        self.address = address
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        if isinstance(address, tuple):
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self._file = None
+        else:
+            self._socket = None
+            self._file = open(address, 'a')
+
+    def record(self, kind, name, seconds, rows):
+        metric = '{prefix}.{kind}.{name}'.format(
+            prefix=self.prefix, kind=kind, name=re.sub(r'\W', '_', name))
+        lines = '{metric}:{ms:.3f}|ms\n'.format(metric=metric,
+                                                ms=seconds * 1000)
+        if rows is not None:
+            lines += '{metric}.rows:{rows}|c\n'.format(metric=metric,
+                                                       rows=rows)
+        with self._lock:
+            if self._socket is not None:
+                try:
+                    self._socket.sendto(lines.encode('ascii'), self.address)
+                except socket.error:
+                    pass  # metrics must never fail the measured call
+            else:
+                self._file.write(lines)
+                self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._socket is not None:
+                self._socket.close()
+            else:
+                self._file.close()
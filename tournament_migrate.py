@@ -0,0 +1,331 @@
+#!/usr/bin/env python
+#
+# tournament_migrate.py -- versioned schema migrations and query plan checks
+#
+# Migrations are SQL files in the migrations directory, named
+# NNN_description.sql, where NNN is the version they upgrade the schema to.
+# Applied versions are recorded in the SchemaMigrations table. New databases
+# created with tournament.sql include all migrations.
+#
+# Partitioning tables by tournament (tournament_partitions.sql) is optional,
+# it needs PostgreSQL 11 or newer and is applied with partitionTables().
+#
+
+import os
+import re
+
+import tournament
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'migrations')
+
+PARTITIONS_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              'tournament_partitions.sql')
+
+_MIGRATION_FILE = re.compile(r'^(\d+)_\w+\.sql$')
+
+# Partitions of one tournament, e.g. matches_t12 (tournament 12)
+_PARTITION_NAME = re.compile(r'^(\w+)_t(n?\d+)$')
+
+# Any key, which does not collide with other advisory locks of the database
+_MIGRATION_LOCK = 0x70757273
+
+# Queries run on every standings / pairing call: (name, SQL, parameters)
+# Parameters get the tournament ID, which the plan is checked for
+HOT_QUERIES = [
+    ('playerStandings', tournament.STANDINGS_SQL,
+     lambda tid: (tid,)),
+    ('playerStandings', tournament.ROUND_STANDINGS_SQL,
+     lambda tid: {'tid': tid, 'round': 2}),
+    ('playerStandingsWithBye', tournament.STANDINGS_WITH_BYE_SQL,
+     lambda tid: {'bye': tournament.POINTS_FOR_BYE, 'tid': tid}),
+    ('swissPairings', tournament.PAIRING_HISTORY_SQL,
+     lambda tid: (tid,)),
+    ('swissPairings', tournament.ROUND_STATE_SQL,
+     lambda tid: ([tid],)),
+    ('reportMatches', tournament.REPORT_MATCHES_SQL,
+     lambda tid: {'tid': tid, 'player1': [1, 3], 'p1points': [1, 0],
+                  'player2': [2, 4], 'p2points': [0, 0]}),
+    ('standingsPage', tournament.STANDINGS_FIRST_PAGE_SQL,
+     lambda tid: {'tid': tid, 'limit': 50, 'offset': 0}),
+    ('standingsPage', tournament.STANDINGS_NEXT_PAGE_SQL,
+     lambda tid: {'tid': tid, 'limit': 50, 'offset': 0,
+                  'points': -3, 'matches': -6, 'pid': 0}),
+    ('swissPairingsBatch', tournament.BATCH_STANDINGS_SQL,
+     lambda tid: ([tid, tid + 1],)),
+    ('swissPairingsBatch', tournament.BATCH_PAIRING_HISTORY_SQL,
+     lambda tid: ([tid, tid + 1],)),
+    ('playerStandingsWithTiebreaks', tournament.TIEBREAK_STANDINGS_SQL,
+     lambda tid: {'tid': tid, 'bye': tournament.POINTS_FOR_BYE,
+                  'win': tournament.POINTS_FOR_WIN,
+                  'minWin': tournament.MIN_MATCH_WIN_PERCENT}),
+    # records of a player, whose id does not matter for the plan
+    ('playerHistory', tournament.PLAYER_HISTORY_SQL,
+     lambda tid: {'pid': tid}),
+    ('headToHead', tournament.HEAD_TO_HEAD_SQL,
+     lambda tid: {'pid': tid, 'opponent': tid + 1}),
+]
+
+# Tables, which must never be scanned sequentially by HOT_QUERIES
+PLAN_CHECKED_TABLES = ('players', 'tournamentmembers', 'matches', 'standings',
+                       'playerresults')
+
+# Checked tables with fewer rows (after ANALYZE) may be scanned sequentially,
+# the planner rightly prefers it for small tables (e.g. few synthetic
+# tournaments in an empty database)
+PLAN_CHECK_MIN_ROWS = 50000
+
+
+def availableMigrations(directory=MIGRATIONS_DIR):
+    """Returns a sorted list of (version, name, path) of migration files."""
+    migrations = []
+    for name in os.listdir(directory):
+        match = _MIGRATION_FILE.match(name)
+        if match:
+            migrations.append((int(match.group(1)), name,
+                               os.path.join(directory, name)))
+    migrations.sort()
+
+    for i in range(1, len(migrations)):
+        if migrations[i][0] == migrations[i - 1][0]:
+            raise ValueError("Migrations {a} and {b} have the same "
+                             "version".format(a=migrations[i - 1][1],
+                                              b=migrations[i][1]))
+    return migrations
+
+
+def schemaVersion():
+    """Returns the latest migration version applied to the database.
+
+    0 means the baseline schema, without any migration.
+    """
+    with tournament.getConnection() as conn:
+        c = conn.cursor()
+        _createMigrationsTable(c)
+        return _schemaVersion(c)
+
+
+def migrate(target=None, directory=MIGRATIONS_DIR):
+    """Upgrades the database in place by applying pending migrations.
+
+    Every migration runs in its own transaction together with recording its
+    version, so a failed migration leaves the database at the previous
+    version. Concurrent migrate() calls wait for each other.
+
+    Args:
+      target: version to upgrade to (None upgrades to the latest one)
+      directory: directory with migration files
+
+    Returns:
+      A list of names of the applied migrations.
+    """
+    applied = []
+    for version, name, path in availableMigrations(directory):
+        if target is not None and version > target:
+            break
+        with open(path) as f:
+            sql = f.read()
+
+        with tournament.getConnection() as conn:
+            c = conn.cursor()
+            c.execute("SELECT pg_advisory_xact_lock(%s)", (_MIGRATION_LOCK,))
+            _createMigrationsTable(c)
+            if version <= _schemaVersion(c):
+                continue
+            # the file is executed as it is, without parameters, so there is
+            # no need to escape "%" signs in migrations
+            c.execute(sql)
+            c.execute("""INSERT INTO SchemaMigrations (version, name)
+                        VALUES (%s, %s)""", (version, name))
+        applied.append(name)
+    return applied
+
+
+def isPartitioned():
+    """Returns whether the tables are partitioned by tournament."""
+    with tournament.getConnection() as conn:
+        c = conn.cursor()
+        return _isPartitioned(c)
+
+
+def partitionTables(path=PARTITIONS_SQL):
+    """Converts Matches, TournamentMembers and Standings to tables
+    partitioned by tournament, one partition per tournament.
+
+    Existing rows are copied to the partitions in one transaction, which
+    locks the tables until it is committed. Processes, which used the
+    database before, have to be restarted afterwards.
+
+    Args:
+      path: the SQL script to apply
+
+    Returns:
+      True if the tables were partitioned, False if they already were.
+
+    Raises:
+      ValueError: the database is not migrated to the latest version
+    """
+    with open(path) as f:
+        sql = f.read()
+
+    with tournament.getConnection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT pg_advisory_xact_lock(%s)", (_MIGRATION_LOCK,))
+        if _isPartitioned(c):
+            return False
+        _createMigrationsTable(c)
+        latest = availableMigrations()[-1][0]
+        if _schemaVersion(c) != latest:
+            raise ValueError("Migrate the database to version {v} "
+                             "first".format(v=latest))
+        c.execute(sql)
+    # this process has the answer of the old schema cached
+    tournament._partitioned = None
+    return True
+
+
+def checkQueryPlans(tournaments=1000, players=64, rounds=6):
+    """Checks that hot queries do not fall back to sequential scans.
+
+    Synthetic tournaments are added to the database, tables are analyzed and
+    every query of HOT_QUERIES is explained for one of the new tournaments.
+    Everything runs in one transaction, which is rolled back at the end, so
+    the database is not changed. Sequential scans of tables with fewer than
+    PLAN_CHECK_MIN_ROWS rows are fine. If the tables are partitioned by
+    tournament, sequential scans of the partitions of the checked
+    tournament are fine, but partitions of other tournaments must not be
+    read at all.
+
+    Args:
+      tournaments: number of synthetic tournaments
+      players: number of players in every synthetic tournament
+      rounds: number of rounds played in every synthetic tournament
+
+    Returns:
+      A list of problems, each of which is a tuple (query name, node type,
+      table name). Empty list means that all plans are fine.
+    """
+    problems = []
+    conn = tournament.connect()
+    try:
+        c = conn.cursor()
+        firstTid = _addSyntheticTournaments(c, tournaments, players, rounds)
+        for table in PLAN_CHECKED_TABLES:
+            c.execute("ANALYZE " + table)
+        c.execute("""SELECT lower(relname)
+                    FROM pg_class
+                    WHERE lower(relname) = ANY (%s)
+                    AND pg_table_is_visible(oid)
+                    AND reltuples < %s""",
+                  (list(PLAN_CHECKED_TABLES), PLAN_CHECK_MIN_ROWS))
+        small = set(row[0] for row in c.fetchall())
+
+        checkedTid = firstTid + tournaments // 2
+        # batch queries read the next tournament as well
+        allowed = set(tournament._partitionNames(checkedTid) +
+                      tournament._partitionNames(checkedTid + 1))
+        for name, sql, params in HOT_QUERIES:
+            c.execute("EXPLAIN (FORMAT JSON) " + sql, params(checkedTid))
+            plan = c.fetchone()[0][0]['Plan']
+            for node in _planNodes(plan):
+                table = node.get('Relation Name', '').lower()
+                if (node['Node Type'] == 'Seq Scan' and
+                        table in PLAN_CHECKED_TABLES and table not in small):
+                    problems.append((name, node['Node Type'], table))
+                elif _PARTITION_NAME.match(table) and table not in allowed:
+                    problems.append((name, node['Node Type'], table))
+    finally:
+        conn.rollback()
+        conn.close()
+    return problems
+
+
+def _createMigrationsTable(c):
+    c.execute("""CREATE TABLE IF NOT EXISTS SchemaMigrations (
+                    version integer PRIMARY KEY,
+                    name text NOT NULL,
+                    applied timestamp NOT NULL DEFAULT now()
+                )""")
+
+
+def _schemaVersion(c):
+    c.execute("SELECT coalesce(max(version), 0) FROM SchemaMigrations")
+    return c.fetchone()[0]
+
+
+def _isPartitioned(c):
+    """Returns whether the tables are partitioned by tournament, checked
+    now (tournament._isPartitioned caches the answer of the process)."""
+    c.execute(tournament.PARTITIONED_SQL)
+    return c.fetchone()[0]
+
+
+def _addSyntheticTournaments(c, tournaments, players, rounds):
+    """Adds tournaments with players and played rounds using cursor c.
+
+    Returns:
+      ID of the first added tournament, the others follow it.
+    """
+    c.execute("SELECT coalesce(max(tid), 0) + 1 FROM TournamentMembers")
+    firstTid = c.fetchone()[0]
+    c.execute("""SELECT coalesce(max(tournament) + 1, 0)
+                FROM Matches""")
+    firstTid = max(firstTid, c.fetchone()[0])
+    if _isPartitioned(c):
+        c.execute("""SELECT tournament_partitions(tid::integer)
+                    FROM generate_series(%s, %s) AS tid""",
+                  (firstTid, firstTid + tournaments))
+
+    c.execute("""WITH new AS (
+                    INSERT INTO Players (name)
+                    SELECT 'plan check player'
+                    FROM generate_series(1, %(count)s)
+                    RETURNING pid
+                )
+                INSERT INTO TournamentMembers (tid, pid)
+                SELECT %(first)s
+                       + (row_number() OVER (ORDER BY pid) - 1) / %(players)s,
+                       pid
+                FROM new""", {'count': tournaments * players,
+                              'first': firstTid, 'players': players})
+
+    # every round the first player of each couple wins against the second one
+    c.execute("""WITH members AS (
+                    SELECT tid, pid,
+                           row_number() OVER (PARTITION BY tid
+                                              ORDER BY pid) AS pos,
+                           lead(pid) OVER (PARTITION BY tid
+                                           ORDER BY pid) AS next
+                    FROM TournamentMembers
+                    WHERE tid >= %(first)s
+                )
+                INSERT INTO Matches (player1, p1points, player2, p2points,
+                                     tournament)
+                SELECT pid, 1, next, 0, tid
+                FROM members, generate_series(1, %(rounds)s)
+                WHERE pos %% 2 = 1
+                AND next IS NOT NULL""", {'first': firstTid,
+                                          'rounds': rounds})
+    c.execute("""INSERT INTO PlayerResults (pid, opponent, mid, tid, points,
+                                           opponentPoints)
+                SELECT player1, player2, mid, tournament, p1points, p2points
+                FROM Matches
+                WHERE tournament >= %(first)s
+                UNION ALL
+                SELECT player2, player1, mid, tournament, p2points, p1points
+                FROM Matches
+                WHERE tournament >= %(first)s""", {'first': firstTid})
+    c.execute("""INSERT INTO Standings (tid, pid, points, matches)
+                SELECT tid, pid, (pid %% 2) * %(rounds)s, %(rounds)s
+                FROM TournamentMembers
+                WHERE tid >= %(first)s""", {'first': firstTid,
+                                            'rounds': rounds})
+    return firstTid
+
+
+def _planNodes(plan):
+    """Yields all nodes of a JSON query plan."""
+    yield plan
+    for child in plan.get('Plans', []):
+        for node in _planNodes(child):
+            yield node
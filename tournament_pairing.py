@@ -0,0 +1,454 @@
+#!/usr/bin/env python
+#
+# tournament_pairing.py -- Swiss-system pairing engine used by tournament.py
+#
+# The engine works on plain data (standings and previously played matches),
+# so it does not need a database and can be used by any storage backend.
+#
+
+import time
+from collections import deque
+
+PAIRING_GREEDY = 'greedy'    # swissPairs
+PAIRING_OPTIMAL = 'optimal'  # optimalSwissPairs
+
+
+def opponentSets(matches):
+    """Builds an index of previously played matches.
+
+    Args:
+      matches: iterable of tuples (id1, id2) of players who played each other
+
+    Returns:
+      A dict {id: set of ids of the players he played against}. Checking,
+      whether two players already played, takes constant time.
+    """
+    opponents = {}
+    for player1, player2 in matches:
+        opponents.setdefault(player1, set()).add(player2)
+        opponents.setdefault(player2, set()).add(player1)
+    return opponents
+
+
+def seededStanding(standing, ratings):
+    """Orders every score group by rating, so that adjacent players are the
+    upper half of the group against the lower half.
+
+    Players of equal points are sorted by rating (highest first) and the
+    halves are interleaved: 1st, (n/2+1)th, 2nd, (n/2+2)th, ... Pairing
+    adjacent players (both engines start with the next lower player) then
+    pairs the strongest player of the upper half with the strongest of the
+    lower half, as the Dutch system does. In case of odd number of players
+    the lowest rated one is last.
+
+    Args:
+      standing: list of tuples (id, name, points, matches) sorted by points,
+        as returned by playerStandings
+      ratings: dict {id: rating} of all players in standing
+
+    Returns:
+      A new list of the same tuples.
+    """
+    result = []
+    start = 0
+    while start < len(standing):
+        end = start + 1
+        while end < len(standing) and standing[end][2] == standing[start][2]:
+            end += 1
+        group = sorted(standing[start:end],
+                       key=lambda row: (-ratings[row[0]], row[0]))
+        half = len(group) // 2
+        for upper, lower in zip(group[:half], group[half:]):
+            result.extend((upper, lower))
+        result.extend(group[2 * half:])
+        start = end
+    return result
+
+
+def swissPairs(standing, opponents):
+    """Returns a list of pairs of players for the next round.
+
+    Players, who played less matches than others (skipped a round), are
+    paired first, so nobody skips a round twice until everybody skipped it
+    once. Every player is paired with the nearest player in the standings,
+    whom he has not played yet (looking one place down, then one place up,
+    then two places down, ...). If he has already played everybody, he is
+    paired with the adjacent player. In case of odd number of players the
+    last one is not paired.
+
+    Paired players are unlinked from a doubly linked list over the
+    standings, so they are removed in constant time and the search for the
+    nearest partner skips them without shifting the rest of the standings.
+
+    Args:
+      standing: list of tuples (id, name, points, matches) sorted by points,
+        as returned by playerStandings
+      opponents: dict {id: set of ids of previous opponents}, see
+        opponentSets
+
+    Returns:
+      A list of tuples, each of which contains (id1, name1, id2, name2)
+    """
+    count = len(standing)
+    nxt = list(range(1, count + 1))   # index of the next unpaired player
+    prv = list(range(-1, count - 1))  # index of the previous unpaired player
+    if count:
+        nxt[-1] = -1
+    head = 0 if count else -1
+
+    # players, who skipped a round (played less than the maximum number of
+    # matches), in the order of standings. They are paired first
+    maxMatches = max([row[3] for row in standing] or [0])
+    lowMatches = [i for i in range(count) if standing[i][3] < maxMatches]
+    lowPos = 0
+
+    paired = [False] * count
+    noOpponents = frozenset()
+    result = []
+
+    while count > 1:
+        while lowPos < len(lowMatches) and paired[lowMatches[lowPos]]:
+            lowPos += 1
+        if lowPos < len(lowMatches):
+            low = lowMatches[lowPos]
+        else:
+            low = head  # nobody skipped a round, start with the first player
+
+        played = opponents.get(standing[low][0], noOpponents)
+        pair = -1
+        down, up = nxt[low], prv[low]
+        while down != -1 or up != -1:
+            if down != -1:
+                if standing[down][0] not in played:
+                    pair = down
+                    break
+                down = nxt[down]
+            if up != -1:
+                if standing[up][0] not in played:
+                    pair = up
+                    break
+                up = prv[up]
+        if pair == -1:
+            # player previously played with all possible partners,
+            # we choose simply adjacent
+            pair = nxt[low] if nxt[low] != -1 else prv[low]
+
+        result.append((standing[low][0], standing[low][1],
+                       standing[pair][0], standing[pair][1]))
+
+        # unlink both players from the list of unpaired players
+        for i in (low, pair):
+            paired[i] = True
+            if prv[i] != -1:
+                nxt[prv[i]] = nxt[i]
+            else:
+                head = nxt[i]
+            if nxt[i] != -1:
+                prv[nxt[i]] = prv[i]
+        count -= 2
+
+    return result
+
+
+def optimalSwissPairs(standing, opponents, byes=None, timeBudget=None):
+    """Returns a list of pairs of players for the next round.
+
+    Unlike swissPairs, which takes the nearest possible partner for one
+    player after another, this looks for the best pairing of the whole round:
+
+      1. In case of odd number of players the bye goes to the lowest placed
+         player among those with the fewest byes, so nobody gets a second
+         bye while somebody else has none.
+      2. Players are split into score groups (equal points). Every group,
+         together with players floated down from the group above, is paired
+         with a maximum number of pairs without rematches (greedy pairing
+         completed with augmenting paths of Edmonds' blossom algorithm).
+      3. Players left unpaired float down to the next score group, so the
+         score difference of their pair is as small as possible. Rematches
+         are only made in the last group. Before that, score groups above
+         are merged with the last one, if it avoids the rematches.
+
+    Args:
+      standing: list of tuples (id, name, points, matches) sorted by points,
+        as returned by playerStandings
+      opponents: dict {id: set of ids of previous opponents}, see
+        opponentSets
+      byes: dict {id: number of byes the player already had}. By default
+        every match a player played less than the maximum is counted as bye
+        (as in playerStandingsWithBye)
+      timeBudget: seconds to spend on the search. When it runs out, the
+        remaining players are paired by swissPairs (None for no limit)
+
+    Returns:
+      A list of tuples, each of which contains (id1, name1, id2, name2)
+    """
+    deadline = None if timeBudget is None else time.time() + timeBudget
+    players = list(standing)
+    if byes is None:
+        byes = _derivedByes(players)
+
+    if len(players) % 2:
+        fewest = min(byes.get(row[0], 0) for row in players)
+        for i in range(len(players) - 1, -1, -1):
+            if byes.get(players[i][0], 0) == fewest:
+                del players[i]  # this player gets the bye
+                break
+
+    groups = []  # index of the first player of every score group
+    for i in range(len(players)):
+        if i == 0 or players[i][2] != players[i - 1][2]:
+            groups.append(i)
+    if not groups:
+        return []
+
+    # states[g] is (pairs, floaters) before score group g is paired
+    states = [([], [])]
+    for g in range(len(groups) - 1):
+        pairs, floaters = states[g]
+        if deadline is not None and time.time() > deadline:
+            # out of time: greedy pairing of everybody who is left
+            return pairs + swissPairs(floaters + players[groups[g]:],
+                                      opponents)
+        groupPairs, left = _pairScoreGroup(
+            floaters + players[groups[g]:groups[g + 1]], opponents, deadline)
+        states.append((pairs + groupPairs, left))
+
+    # Players left in the last group have to play rematches. If there are
+    # any, groups above are merged with the last one, one by one, as long as
+    # it reduces the number of rematches
+    best = None
+    for g in range(len(groups) - 1, -1, -1):
+        pairs, floaters = states[g]
+        groupPairs, left = _pairScoreGroup(floaters + players[groups[g]:],
+                                           opponents, deadline)
+        rematches = [(left[i][0], left[i][1], left[i + 1][0], left[i + 1][1])
+                     for i in range(0, len(left) - 1, 2)]
+        if best is None or len(rematches) < len(best[1]):
+            best = (pairs + groupPairs, rematches)
+        if not rematches or (deadline is not None and
+                             time.time() > deadline):
+            break
+    return best[0] + best[1]
+
+
+def pairingQuality(pairs, standing, opponents, byes=None):
+    """Measures the quality of pairings of one round.
+
+    Args:
+      pairs: list of (id1, name1, id2, name2) as returned by swissPairs
+      standing: standings the pairing was made for
+      opponents: dict {id: set of ids of previous opponents}
+      byes: dict {id: number of byes}, derived from standing by default
+
+    Returns:
+      A dict with pairs (number of pairs), rematches (number of pairs who
+      already played each other), totalScoreGap and maxScoreGap (difference
+      of points within pairs), byes (list of ids of unpaired players) and
+      repeatedByes (how many of them already had a bye).
+    """
+    if byes is None:
+        byes = _derivedByes(standing)
+    points = dict((row[0], row[2]) for row in standing)
+
+    rematches = 0
+    gaps = []
+    paired = set()
+    for id1, name1, id2, name2 in pairs:
+        if id2 in opponents.get(id1, ()):
+            rematches += 1
+        gaps.append(abs(points[id1] - points[id2]))
+        paired.add(id1)
+        paired.add(id2)
+    unpaired = [row[0] for row in standing if row[0] not in paired]
+
+    return {'pairs': len(pairs),
+            'rematches': rematches,
+            'totalScoreGap': sum(gaps),
+            'maxScoreGap': max(gaps or [0]),
+            'byes': unpaired,
+            'repeatedByes': len([pid for pid in unpaired if byes.get(pid)])}
+
+
+def pairRound(standing, opponents, mode=PAIRING_GREEDY, timeBudget=None,
+              byes=None):
+    """Pairs one round with the pairing engine selected by mode.
+
+    Args:
+      mode: PAIRING_GREEDY (swissPairs) or PAIRING_OPTIMAL
+        (optimalSwissPairs)
+      timeBudget, byes: see optimalSwissPairs, not used by greedy pairing
+    """
+    if mode == PAIRING_GREEDY:
+        return swissPairs(standing, opponents)
+    if mode == PAIRING_OPTIMAL:
+        return optimalSwissPairs(standing, opponents, byes, timeBudget)
+    raise ValueError("Unknown pairing mode {mode}".format(mode=mode))
+
+
+def _derivedByes(standing):
+    """Counts every match a player played less than the maximum as bye."""
+    maxMatches = max([row[3] for row in standing] or [0])
+    return dict((row[0], maxMatches - row[3]) for row in standing)
+
+
+def _pairScoreGroup(pool, opponents, deadline):
+    """Pairs one score group (with floaters from above placed first).
+
+    Returns:
+      A tuple (pairs, left): the maximum number of pairs without rematches
+      and players left unpaired (in their order), who float down to the next
+      group.
+    """
+    count = len(pool)
+    ids = [row[0] for row in pool]
+    played = [opponents.get(pid, frozenset()) for pid in ids]
+
+    # greedy start: everybody takes the nearest lower placed free player
+    mate = [-1] * count
+    nxt = list(range(1, count + 1))
+    prv = list(range(-1, count - 1))
+    if count:
+        nxt[-1] = -1
+    for u in range(count):
+        if mate[u] != -1:
+            continue
+        v = nxt[u]
+        while v != -1 and ids[v] in played[u]:
+            v = nxt[v]
+        if v == -1:
+            continue
+        mate[u], mate[v] = v, u
+        for i in (u, v):
+            if prv[i] != -1:
+                nxt[prv[i]] = nxt[i]
+            if nxt[i] != -1:
+                prv[nxt[i]] = prv[i]
+
+    # Score groups are nearly complete graphs, so two free players can almost
+    # always be paired by swapping partners with one pair (augmenting path of
+    # length 3). This is tried first, because the blossom search contracts
+    # many blossoms in dense graphs
+    free = [u for u in range(count) if mate[u] == -1]
+    for u in free:
+        for w in free:
+            if (w != u and mate[u] == -1 and mate[w] == -1 and
+                    _swapAugment(u, w, mate, ids, played)):
+                break
+
+    # an augmenting path connects two free players, so there is nothing to
+    # search for (and a failed search is expensive) with less than two
+    free = [u for u in free if mate[u] == -1]
+    freeCount = len(free)
+    for root in free:
+        if freeCount < 2:
+            break
+        if mate[root] == -1 and _augment(root, mate, ids, played, deadline):
+            freeCount -= 2
+
+    pairs = []
+    left = []
+    for u in range(count):
+        if mate[u] == -1:
+            left.append(pool[u])
+        elif mate[u] > u:
+            v = mate[u]
+            pairs.append((ids[u], pool[u][1], ids[v], pool[v][1]))
+    return pairs, left
+
+
+def _swapAugment(u, w, mate, ids, played):
+    """Pairs free players u and w directly, or u with x and w with y instead
+    of a pair (x, y).
+
+    Returns:
+      True if the matching was extended.
+    """
+    if ids[w] not in played[u]:
+        mate[u], mate[w] = w, u
+        return True
+    for x in range(len(mate)):
+        y = mate[x]
+        if (y != -1 and ids[x] not in played[u] and
+                ids[y] not in played[w]):
+            mate[u], mate[x] = x, u
+            mate[w], mate[y] = y, w
+            return True
+    return False
+
+
+def _augment(root, mate, ids, played, deadline):
+    """Searches an augmenting path from free vertex root and applies it.
+
+    Edmonds' blossom algorithm for maximum matching in a general graph.
+    Vertices are positions in the score group, two vertices are adjacent if
+    the players have not played each other. Adjacency is not materialized:
+    score groups are nearly complete graphs, so edges are checked on the fly.
+
+    Returns:
+      True if the matching was extended, False if there is no augmenting
+      path or the deadline passed.
+    """
+    count = len(mate)
+    used = [False] * count
+    parent = [-1] * count
+    base = list(range(count))
+
+    def lca(a, b):
+        seen = [False] * count
+        while True:
+            a = base[a]
+            seen[a] = True
+            if mate[a] == -1:
+                break
+            a = parent[mate[a]]
+        while True:
+            b = base[b]
+            if seen[b]:
+                return b
+            b = parent[mate[b]]
+
+    def markPath(v, b, child, blossom):
+        while base[v] != b:
+            blossom[base[v]] = blossom[base[mate[v]]] = True
+            parent[v] = child
+            child = mate[v]
+            v = parent[mate[v]]
+
+    used[root] = True
+    queue = deque([root])
+    visited = 0
+    while queue:
+        v = queue.popleft()
+        visited += 1
+        if (deadline is not None and visited % 64 == 0 and
+                time.time() > deadline):
+            return False
+        for to in range(count):
+            if (to == v or base[v] == base[to] or mate[v] == to or
+                    ids[to] in played[v]):
+                continue
+            if to == root or (mate[to] != -1 and parent[mate[to]] != -1):
+                # odd cycle: contract the blossom into its base
+                curBase = lca(v, to)
+                blossom = [False] * count
+                markPath(v, curBase, to, blossom)
+                markPath(to, curBase, v, blossom)
+                for i in range(count):
+                    if blossom[base[i]]:
+                        base[i] = curBase
+                        if not used[i]:
+                            used[i] = True
+                            queue.append(i)
+            elif parent[to] == -1:
+                parent[to] = v
+                if mate[to] == -1:
+                    # augmenting path found, flip it
+                    while to != -1:
+                        prev = parent[to]
+                        after = mate[prev]
+                        mate[to], mate[prev] = prev, to
+                        to = after
+                    return True
+                used[mate[to]] = True
+                queue.append(mate[to])
+    return False
@@ -0,0 +1,118 @@
+-- Converts Matches, TournamentMembers and Standings to tables partitioned by
+-- tournament id, one partition per tournament (PostgreSQL 11 or newer).
+--
+-- Apply it with "python tournament_admin.py partition" to a database with
+-- all migrations applied. Existing rows are copied to the new partitions in
+-- one transaction, which locks the tables until it is committed. Afterwards
+-- tournament.py creates partitions of new tournaments on their first write
+-- and deleteTournament / archiveTournament truncate or detach partitions
+-- instead of deleting rows.
+
+LOCK TABLE Matches, TournamentMembers, Standings IN ACCESS EXCLUSIVE MODE;
+
+ALTER TABLE Matches RENAME TO Matches_unpartitioned;
+ALTER INDEX matches_pkey RENAME TO matches_unpartitioned_pkey;
+ALTER INDEX matches_tournament_players_idx
+	RENAME TO matches_unpartitioned_tournament_players_idx;
+ALTER INDEX matches_tournament_round_idx
+	RENAME TO matches_unpartitioned_tournament_round_idx;
+ALTER INDEX matches_round_result_idx
+	RENAME TO matches_unpartitioned_round_result_idx;
+ALTER TABLE TournamentMembers RENAME TO TournamentMembers_unpartitioned;
+ALTER INDEX tournamentmembers_pkey
+	RENAME TO tournamentmembers_unpartitioned_pkey;
+ALTER TABLE Standings RENAME TO Standings_unpartitioned;
+ALTER INDEX standings_pkey RENAME TO standings_unpartitioned_pkey;
+ALTER INDEX standings_tid_rank_idx
+	RENAME TO standings_unpartitioned_tid_rank_idx;
+
+-- The same columns, keys and indexes as before, except that primary keys
+-- include the tournament id (mid stays unique, it comes from one sequence)
+
+CREATE TABLE TournamentMembers (
+	tid		integer NOT NULL,
+	pid		integer REFERENCES Players (pid),
+	PRIMARY KEY (tid, pid)
+) PARTITION BY LIST (tid);
+
+CREATE TABLE Matches (
+	mid			integer NOT NULL DEFAULT nextval('matches_mid_seq'),
+	player1		integer REFERENCES Players (pid), -- id of the player
+	p1points	integer,
+	player2		integer REFERENCES Players (pid), -- id of the player
+	p2points	integer,
+	tournament	integer NOT NULL,
+	round		integer NOT NULL DEFAULT 0,
+	PRIMARY KEY (tournament, mid)
+) PARTITION BY LIST (tournament);
+
+ALTER SEQUENCE matches_mid_seq OWNED BY Matches.mid;
+
+-- correctMatch and deleteMatch find matches by mid only
+CREATE INDEX matches_mid_idx ON Matches (mid);
+CREATE INDEX matches_tournament_players_idx
+	ON Matches (tournament, player1, player2);
+CREATE INDEX matches_tournament_round_idx ON Matches (tournament, round);
+CREATE UNIQUE INDEX matches_round_result_idx
+	ON Matches (tournament, round, least(player1, player2),
+				greatest(player1, player2))
+	WHERE round > 0;
+
+CREATE TABLE Standings (
+	tid			integer NOT NULL,
+	pid			integer REFERENCES Players (pid),
+	points		integer NOT NULL DEFAULT 0,
+	matches		integer NOT NULL DEFAULT 0,
+	byes		integer NOT NULL DEFAULT 0,
+	PRIMARY KEY (tid, pid)
+) PARTITION BY LIST (tid);
+
+CREATE INDEX standings_tid_rank_idx
+	ON Standings (tid, (-points), (-matches), pid);
+
+-- Creates the missing partitions of tournament t: matches_t<t>,
+-- tournamentmembers_t<t> and standings_t<t> ("n" stands for the minus sign
+-- of negative ids). Partitions are created as tables and then attached,
+-- which does not block readers of other tournaments.
+CREATE OR REPLACE FUNCTION tournament_partitions(t integer) RETURNS void AS $$
+DECLARE
+	parent	text;
+	name	text;
+BEGIN
+	-- concurrent first writes to the same tournament
+	PERFORM pg_advisory_xact_lock(1885434484, t);
+	FOREACH parent IN ARRAY ARRAY['matches', 'tournamentmembers',
+								  'standings'] LOOP
+		name := parent || '_t' || replace(t::text, '-', 'n');
+		IF to_regclass(name) IS NULL THEN
+			EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS)',
+						   name, parent);
+			EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I '
+						   'FOR VALUES IN (%s)', parent, name, t);
+		END IF;
+	END LOOP;
+END
+$$ LANGUAGE plpgsql;
+
+SELECT tournament_partitions(tid)
+FROM (SELECT tournament FROM Matches_unpartitioned
+	  UNION
+	  SELECT tid FROM TournamentMembers_unpartitioned
+	  UNION
+	  SELECT tid FROM Standings_unpartitioned) AS tournaments (tid);
+
+INSERT INTO Matches (mid, player1, p1points, player2, p2points, tournament,
+					 round)
+	SELECT mid, player1, p1points, player2, p2points, tournament, round
+	FROM Matches_unpartitioned;
+INSERT INTO TournamentMembers (tid, pid)
+	SELECT tid, pid FROM TournamentMembers_unpartitioned;
+INSERT INTO Standings (tid, pid, points, matches, byes)
+	SELECT tid, pid, points, matches, byes FROM Standings_unpartitioned;
+
+DROP TABLE Matches_unpartitioned, TournamentMembers_unpartitioned,
+	Standings_unpartitioned;
+
+ANALYZE Matches;
+ANALYZE TournamentMembers;
+ANALYZE Standings;
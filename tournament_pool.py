@@ -0,0 +1,231 @@
+#!/usr/bin/env python
+#
+# tournament_pool.py -- thread-safe connection pool used by tournament.py
+#
+
+import threading
+import time
+
+
+class PoolError(Exception):
+    """Raised when a connection cannot be checked out of the pool in time."""
+
+
+class ConnectionPool(object):
+    """A bounded, thread-safe pool of DB-API connections.
+
+    Connections are handed out most-recently-used first, so a lightly loaded
+    pool keeps reusing a few warm connections and lets the rest expire.
+
+    Args:
+      connectFn: callable without arguments, returning a new connection
+      minSize: number of connections kept open even when they are idle
+      maxSize: maximum number of connections open at the same time
+      idleTimeout: seconds after which an idle connection above minSize is
+        closed (None keeps idle connections forever)
+      checkoutTimeout: seconds to wait for a free connection before
+        PoolError is raised (None waits forever)
+      healthCheckAfter: a connection which was idle for longer than this
+        number of seconds is pinged with "SELECT 1" before it is handed out
+        (0 pings on every checkout, None never pings)
+    """
+
+    def __init__(self, connectFn, minSize=1, maxSize=10, idleTimeout=300,
+                 checkoutTimeout=30, healthCheckAfter=30):
+        if maxSize < 1 or minSize < 0 or minSize > maxSize:
+            raise ValueError("Pool size must satisfy 0 <= minSize <= "
+                             "maxSize and maxSize >= 1")
+        self.connectFn = connectFn
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.idleTimeout = idleTimeout
+        self.checkoutTimeout = checkoutTimeout
+        self.healthCheckAfter = healthCheckAfter
+
+        self._cond = threading.Condition(threading.Lock())
+        self._idle = []   # stack of (connection, time it was returned)
+        self._open = 0    # connections open (idle + checked out + opening)
+        self._closed = False
+        self._stats = {
+            'checkouts': 0,       # successful checkouts
+            'waits': 0,           # checkouts which had to wait for a conn.
+            'waitTime': 0.0,      # total seconds spent waiting
+            'timeouts': 0,        # checkouts which gave up waiting
+            'created': 0,         # connections opened
+            'closed': 0,          # connections closed (expired, broken, ...)
+            'healthCheckFailures': 0,
+        }
+
+        for i in range(minSize):
+            conn = self._newConnection()
+            with self._cond:
+                self._open += 1
+                self._idle.append((conn, time.time()))
+
+    def getconn(self):
+        """Checks a connection out of the pool.
+
+        Waits up to checkoutTimeout seconds if maxSize connections are
+        already in use. The connection must be given back with putconn().
+        """
+        while True:
+            conn, idleSince = self._checkout()
+            if conn is None:
+                # a slot was reserved for us, open a fresh connection
+                try:
+                    return self._newConnection()
+                except Exception:
+                    self._releaseSlot()
+                    raise
+            if self._isHealthy(conn, idleSince):
+                return conn
+            with self._cond:
+                self._stats['healthCheckFailures'] += 1
+            self._discard(conn)
+
+    def putconn(self, conn, discard=False):
+        """Returns a connection to the pool.
+
+        Args:
+          conn: connection previously obtained with getconn()
+          discard: close the connection instead of keeping it for reuse
+            (for example after a failure which left it in unknown state)
+        """
+        if discard or self._closed or getattr(conn, 'closed', False):
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.time()))
+            expired = self._takeExpired()
+            self._cond.notify()
+        self._closeAll(expired)
+
+    def closeall(self):
+        """Closes all idle connections and stops handing out new ones.
+
+        Connections which are still checked out are closed when returned.
+        """
+        with self._cond:
+            self._closed = True
+            idle = [conn for conn, idleSince in self._idle]
+            self._idle = []
+            self._open -= len(idle)
+            self._cond.notify_all()
+        self._closeAll(idle)
+
+    def stats(self):
+        """Returns a dict with usage counters and the current pool size."""
+        with self._cond:
+            result = dict(self._stats)
+            result['size'] = self._open
+            result['idle'] = len(self._idle)
+            result['inUse'] = self._open - len(self._idle)
+            result['minSize'] = self.minSize
+            result['maxSize'] = self.maxSize
+        return result
+
+    def _checkout(self):
+        """Takes an idle connection or reserves a slot for a new one.
+
+        Returns a tuple (connection, idleSince). The connection is None if
+        the caller has to open a new connection for the reserved slot.
+        """
+        start = None
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise PoolError("Connection pool is closed")
+                expired = self._takeExpired()
+                if expired:
+                    # closing may take a while, do not hold the lock
+                    self._cond.release()
+                    try:
+                        self._closeAll(expired)
+                    finally:
+                        self._cond.acquire()
+                    continue
+                if self._idle:
+                    conn, idleSince = self._idle.pop()
+                    break
+                if self._open < self.maxSize:
+                    self._open += 1
+                    conn, idleSince = None, None
+                    break
+
+                now = time.time()
+                if start is None:
+                    start = now
+                    self._stats['waits'] += 1
+                if self.checkoutTimeout is None:
+                    self._cond.wait()
+                else:
+                    remaining = start + self.checkoutTimeout - now
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        self._stats['waitTime'] += now - start
+                        raise PoolError("No connection available within %s "
+                                        "seconds" % self.checkoutTimeout)
+                    self._cond.wait(remaining)
+
+            self._stats['checkouts'] += 1
+            if start is not None:
+                self._stats['waitTime'] += time.time() - start
+        return conn, idleSince
+
+    def _takeExpired(self):
+        """Removes idle connections over idleTimeout from the pool.
+
+        Must be called with the lock held. The oldest connections are at the
+        bottom of the stack and minSize connections are always kept.
+        """
+        if self.idleTimeout is None:
+            return []
+        deadline = time.time() - self.idleTimeout
+        expired = []
+        while (self._open > self.minSize and self._idle and
+               self._idle[0][1] < deadline):
+            expired.append(self._idle.pop(0)[0])
+            self._open -= 1
+        return expired
+
+    def _isHealthy(self, conn, idleSince):
+        """Checks that an idle connection is still usable."""
+        if getattr(conn, 'closed', False):
+            return False
+        if self.healthCheckAfter is None:
+            return True
+        if time.time() - idleSince < self.healthCheckAfter:
+            return True
+        try:
+            c = conn.cursor()
+            c.execute("SELECT 1")
+            c.fetchone()
+            conn.rollback()
+        except Exception:
+            return False
+        return True
+
+    def _newConnection(self):
+        conn = self.connectFn()
+        with self._cond:
+            self._stats['created'] += 1
+        return conn
+
+    def _releaseSlot(self):
+        with self._cond:
+            self._open -= 1
+            self._cond.notify()
+
+    def _discard(self, conn):
+        self._releaseSlot()
+        self._closeAll([conn])
+
+    def _closeAll(self, connections):
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        if connections:
+            with self._cond:
+                self._stats['closed'] += len(connections)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+#
+# tournament_ratings.py -- Elo ratings of players for tournament.py
+#
+# Every reported match moves the ratings of both players by the difference
+# between the actual and the expected score (1 for a win, 0.5 for a draw),
+# see updateRatings. replayRatings recomputes ratings of all players from the
+# whole match history with NumPy, e.g. after a bulk import. Ratings are used
+# to seed pairings (see tournament.swissPairings).
+#
+
+INITIAL_RATING = 1500.0  # rating of players who have not played yet
+K_FACTOR = 32.0          # maximum change of a rating by one match
+RATING_SCALE = 400.0     # rating difference of 10:1 odds
+
+
+def expectedScore(rating, opponentRating):
+    """Returns the expected score (0..1) of a player against an opponent."""
+    return 1.0 / (1.0 + 10.0 ** ((opponentRating - rating) / RATING_SCALE))
+
+
+def matchScore(p1points, p2points):
+    """Returns the score of the first player of a match: 1 for a win, 0.5
+    for a draw (equal points) and 0 for a loss."""
+    if p1points > p2points:
+        return 1.0
+    if p1points == p2points:
+        return 0.5
+    return 0.0
+
+
+def updateRatings(ratings, matches, k=K_FACTOR):
+    """Applies results of matches to ratings, one match after another.
+
+    Args:
+      ratings: dict {id: (rating, games)}, updated in place. Players who are
+        missing start with INITIAL_RATING and no games
+      matches: iterable of (player1, p1points, player2, p2points), oldest
+        first
+      k: K factor
+
+    Returns:
+      The ratings dict.
+    """
+    for player1, p1points, player2, p2points in matches:
+        rating1, games1 = ratings.get(player1, (INITIAL_RATING, 0))
+        rating2, games2 = ratings.get(player2, (INITIAL_RATING, 0))
+        # scores of both players add up to 1, so do their expected scores
+        delta = k * (matchScore(p1points, p2points) -
+                     expectedScore(rating1, rating2))
+        ratings[player1] = (rating1 + delta, games1 + 1)
+        ratings[player2] = (rating2 - delta, games2 + 1)
+    return ratings
+
+
+def replayRatings(matches, k=K_FACTOR):
+    """Computes ratings of all players from a whole match history.
+
+    Gives the same ratings as updateRatings({}, matches), up to rounding of
+    the last digits. Matches are split into waves: every match belongs to the
+    wave after the last waves of both its players, so nobody plays twice in
+    one wave and the matches of every player keep their order. Each wave is
+    then applied to all its players at once with NumPy array operations, so
+    the time grows with the number of waves (the most matches a player has
+    played), not the number of matches.
+
+    Args:
+      matches: sequence of (player1, p1points, player2, p2points), oldest
+        first
+      k: K factor
+
+    Returns:
+      A dict {id: (rating, games)} of every player who has played.
+    """
+    import numpy  # only the batch recomputation needs NumPy
+
+    data = numpy.array(matches, dtype=numpy.int64).reshape(-1, 4)
+    if not len(data):
+        return {}
+    pids, index = numpy.unique(data[:, [0, 2]], return_inverse=True)
+    index = index.reshape(-1, 2)
+    first, second = index[:, 0], index[:, 1]
+    score = numpy.where(data[:, 1] > data[:, 3], 1.0,
+                        numpy.where(data[:, 1] == data[:, 3], 0.5, 0.0))
+
+    waves = _waves(first.tolist(), second.tolist(), len(pids))
+    order = numpy.argsort(waves, kind='mergesort')
+    bounds = numpy.searchsorted(waves[order],
+                                numpy.arange(1, waves.max() + 2)).tolist()
+
+    ratings = numpy.empty(len(pids))
+    ratings.fill(INITIAL_RATING)
+    for start, end in zip(bounds, bounds[1:]):
+        wave = order[start:end]
+        players1, players2 = first[wave], second[wave]
+        rating1, rating2 = ratings[players1], ratings[players2]
+        delta = k * (score[wave] - 1.0 / (
+            1.0 + 10.0 ** ((rating2 - rating1) / RATING_SCALE)))
+        ratings[players1] = rating1 + delta
+        ratings[players2] = rating2 - delta
+
+    games = numpy.bincount(index.ravel(), minlength=len(pids))
+    return dict(zip(pids.tolist(), zip(ratings.tolist(), games.tolist())))
+
+
+def _waves(first, second, count):
+    """Returns a NumPy array with the wave (from 1) of every match, given the
+    indexes of its players in lists first and second."""
+    import numpy
+
+    last = [0] * count  # last wave of every player
+    waves = [0] * len(first)
+    for i in range(len(first)):
+        a, b = first[i], second[i]
+        wave = (last[a] if last[a] > last[b] else last[b]) + 1
+        last[a] = last[b] = waves[i] = wave
+    return numpy.array(waves)
@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+#
+# tournament_sim.py -- Monte Carlo simulation of Swiss-system tournaments
+#
+# Runs many independent tournaments at once with NumPy: scores, numbers of
+# matches, byes and played-against matrices of all tournaments of a batch are
+# arrays, and every round is paired and played for the whole batch with array
+# operations. Results follow player strengths (Elo ratings) and are scored
+# with POINTS_FOR_WIN / POINTS_FOR_DRAW / POINTS_FOR_BYE of tournament.py.
+#
+# Usage:
+#   python tournament_sim.py [--players N] [--rounds N[,N...]]
+#                            [--tournaments N] [--spread ELO] [--draw P]
+#                            [--processes N] [--seed N]
+#
+
+from __future__ import division, print_function
+
+import argparse
+import multiprocessing
+import time
+
+import numpy
+
+import tournament
+
+# Played-against matrices of one batch take tournaments * players^2 bytes,
+# batches are sized to stay below this
+MAX_BATCH_CELLS = 1 << 25
+
+# Passes of pair swaps, which remove rematches from a round
+SWAP_PASSES = 3
+
+
+def simulate(strengths, rounds, tournaments=1000, drawProbability=0.0,
+             processes=None, seed=None):
+    """Simulates independent Swiss-system tournaments of the same players.
+
+    Every round players are ordered by score (ties in random order), the bye
+    (in case of odd number of players) goes to the lowest placed player among
+    those with the fewest byes, and the others are paired with the adjacent
+    player. Rematches are then removed where possible by swapping partners
+    of neighbouring pairs. Bye points count to the score, as in
+    playerStandingsWithBye.
+
+    Args:
+      strengths: sequence of Elo ratings of the players. A player beats a
+        player 400 points weaker 10 times out of 11 (not counting draws)
+      rounds: number of rounds of every tournament
+      tournaments: number of tournaments to simulate
+      drawProbability: probability, that a match ends in a draw
+      processes: number of worker processes to spread batches across (None
+        or 1 runs everything in this process)
+      seed: seed for reproducible results
+
+    Returns:
+      A dict with:
+        tournaments, players, rounds: simulated configuration
+        rankDistribution: array [player, rank] of probabilities, that the
+          player finishes at the rank (0 is the winner)
+        winProbability: array of probabilities of winning, per player
+        strongestWins: probability, that the strongest player wins
+        rematchRate: share of pairs, which were rematches
+        meanByes: array of the average number of byes, per player
+        repeatedByeRate: share of tournaments where a player had 2+ byes
+        seconds, tournamentsPerSecond: time and throughput
+    """
+    strengths = numpy.asarray(strengths, dtype=float)
+    players = len(strengths)
+    if players < 2:
+        raise ValueError("At least two players are needed")
+
+    points = (tournament.POINTS_FOR_WIN, tournament.POINTS_FOR_DRAW,
+              tournament.POINTS_FOR_BYE)
+    batchSize = max(1, min(tournaments, MAX_BATCH_CELLS // players ** 2))
+    counts = [batchSize] * (tournaments // batchSize)
+    if tournaments % batchSize:
+        counts.append(tournaments % batchSize)
+    seeds = numpy.random.RandomState(seed).randint(0, 2 ** 31 - 1,
+                                                   size=len(counts))
+    batches = [(strengths, rounds, count, drawProbability, points,
+                int(batchSeed)) for count, batchSeed in zip(counts, seeds)]
+
+    start = time.time()
+    if processes is not None and processes > 1 and len(batches) > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(_simulateBatch, batches)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_simulateBatch(batch) for batch in batches]
+    seconds = time.time() - start
+
+    rankCounts = sum(result['rankCounts'] for result in results)
+    rankDistribution = rankCounts / tournaments
+    return {
+        'tournaments': tournaments,
+        'players': players,
+        'rounds': rounds,
+        'rankDistribution': rankDistribution,
+        'winProbability': rankDistribution[:, 0],
+        'strongestWins': rankDistribution[numpy.argmax(strengths), 0],
+        'rematchRate': (sum(result['rematches'] for result in results) /
+                        max(1, sum(result['pairs'] for result in results))),
+        'meanByes': sum(result['byes'] for result in results) / tournaments,
+        'repeatedByeRate': (sum(result['repeatedByes'] for result in results)
+                            / tournaments),
+        'seconds': seconds,
+        'tournamentsPerSecond': tournaments / max(seconds, 1e-9),
+    }
+
+
+def _simulateBatch(args):
+    """Plays one batch of tournaments. Runs in worker processes as well.
+
+    Returns:
+      A dict of aggregates: rankCounts [player, rank], rematches, pairs,
+      byes (sum per player) and repeatedByes.
+    """
+    strengths, rounds, count, drawProbability, points, seed = args
+    pointsForWin, pointsForDraw, pointsForBye = points
+    rnd = numpy.random.RandomState(seed)
+    players = len(strengths)
+    rows = numpy.arange(count)[:, None]
+
+    scores = numpy.zeros((count, players), dtype=numpy.int64)
+    byes = numpy.zeros((count, players), dtype=numpy.int64)
+    played = numpy.zeros((count, players, players), dtype=bool)
+    rematches = 0
+    pairs = 0
+
+    for r in range(rounds):
+        order = _ranking(scores, rnd)
+
+        if players % 2:
+            # lowest placed player among those with the fewest byes
+            ordered = byes[rows, order]
+            candidates = ordered == ordered.min(axis=1)[:, None]
+            last = players - 1 - numpy.argmax(candidates[:, ::-1], axis=1)
+            byePlayer = order[numpy.arange(count), last]
+            scores[numpy.arange(count), byePlayer] += pointsForBye
+            byes[numpy.arange(count), byePlayer] += 1
+            keep = numpy.ones(order.shape, dtype=bool)
+            keep[numpy.arange(count), last] = False
+            order = order[keep].reshape(count, players - 1)
+
+        first = order[:, 0::2].copy()
+        second = order[:, 1::2].copy()
+        _removeRematches(first, second, played, rows)
+
+        repeated = played[rows, first, second]
+        rematches += int(repeated.sum())
+        pairs += repeated.size
+
+        # results: the first player wins with the Elo expected probability
+        expected = 1 / (1 + 10 ** ((strengths[second] - strengths[first]) /
+                                   400))
+        luck = rnd.random_sample(first.shape)
+        draw = luck < drawProbability
+        firstWins = ~draw & (luck < drawProbability +
+                             (1 - drawProbability) * expected)
+        scores[rows, first] += numpy.where(
+            draw, pointsForDraw, numpy.where(firstWins, pointsForWin, 0))
+        scores[rows, second] += numpy.where(
+            draw, pointsForDraw, numpy.where(firstWins, 0, pointsForWin))
+        played[rows, first, second] = True
+        played[rows, second, first] = True
+
+    # final standings: rankCounts[player, rank] += 1 for every tournament
+    order = _ranking(scores, rnd)
+    ranks = numpy.arange(players)[None, :]
+    rankCounts = numpy.bincount((order * players + ranks).ravel(),
+                                minlength=players * players)
+    return {
+        'rankCounts': rankCounts.reshape(players, players),
+        'rematches': rematches,
+        'pairs': pairs,
+        'byes': byes.sum(axis=0),
+        'repeatedByes': int((byes.max(axis=1) > 1).sum()),
+    }
+
+
+def _ranking(scores, rnd):
+    """Returns players of every tournament ordered by score, ties in random
+    order: array [tournament, place] of player indexes."""
+    tiebreak = rnd.random_sample(scores.shape)
+    return numpy.lexsort((tiebreak, -scores), axis=1)
+
+
+def _removeRematches(first, second, played, rows):
+    """Swaps partners of neighbouring pairs, where it reduces rematches.
+
+    Pairs (first[k], second[k]) and (first[k+1], second[k+1]) are replaced
+    either by (first[k], second[k+1]), (first[k+1], second[k]) or by
+    (first[k], first[k+1]), (second[k], second[k+1]). Even and odd
+    neighbours are handled in separate steps, so swaps never overlap.
+    """
+    pairCount = first.shape[1]
+    for i in range(SWAP_PASSES):
+        for offset in (0, 1):
+            k = numpy.arange(offset, pairCount - 1, 2)
+            if not len(k):
+                continue
+            a1, b1 = first[:, k], second[:, k]
+            a2, b2 = first[:, k + 1], second[:, k + 1]
+            current = (played[rows, a1, b1].astype(int) +
+                       played[rows, a2, b2])
+            crossed = played[rows, a1, b2].astype(int) + played[rows, a2, b1]
+            grouped = played[rows, a1, a2].astype(int) + played[rows, b1, b2]
+            useCrossed = crossed < current
+            useGrouped = ~useCrossed & (grouped < current)
+
+            second[:, k] = numpy.where(useCrossed, b2,
+                                       numpy.where(useGrouped, a2, b1))
+            second[:, k + 1] = numpy.where(useCrossed, b1, b2)
+            first[:, k + 1] = numpy.where(useGrouped, b1, a2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Monte Carlo simulation of Swiss-system tournaments")
+    parser.add_argument('--players', type=int, default=64)
+    parser.add_argument('--rounds', default='6',
+                        help="number of rounds, or comma separated numbers "
+                             "to compare")
+    parser.add_argument('--tournaments', type=int, default=10000)
+    parser.add_argument('--spread', type=float, default=800,
+                        help="Elo difference between the strongest and the "
+                             "weakest player (strengths are evenly spaced)")
+    parser.add_argument('--draw', type=float, default=0.0,
+                        help="probability of a draw")
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    strengths = numpy.linspace(1500 + args.spread / 2,
+                               1500 - args.spread / 2, args.players)
+    print("%6s %14s %12s %12s %10s %14s" % (
+        'rounds', 'strongest wins', 'top 3 wins', 'rematches', '2+ byes',
+        'tournaments/s'))
+    for rounds in [int(r) for r in args.rounds.split(',')]:
+        result = simulate(strengths, rounds, args.tournaments, args.draw,
+                          args.processes, args.seed)
+        print("%6d %14.3f %12.3f %12.4f %10.4f %14.0f" % (
+            rounds, result['strongestWins'],
+            result['winProbability'][:3].sum(), result['rematchRate'],
+            result['repeatedByeRate'], result['tournamentsPerSecond']))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,20 @@
 # If you do add any of the extra credit options, be sure to add/modify these test cases
 # as appropriate to account for your module's added functionality.
 
+import json
+import logging
+import logging.handlers
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+import psycopg2
+
 from tournament import *
+from tournament_metrics import HistogramSink, StatsdSink
+import tournament_transfer
 
 
 def testCount():
@@ -260,12 +273,750 @@ def drawResults():
     print "17. Players get correct points for draw"
 
 
+def pooledConnections():
+    """
+    Test that module functions reuse pooled connections and that pooling
+    can be resized and disabled
+    """
+    configurePool(minSize=1, maxSize=2)
+    deleteMatches()
+    deletePlayers()
+    registerPlayer("Twilight Sparkle")
+    registerPlayer("Fluttershy")
+    playerStandings()
+    swissPairings()
+
+    stats = poolStats()
+    if stats['checkouts'] < 6:
+        raise ValueError("Module functions should check out pooled "
+                         "connections. Got {n} checkouts".format(
+                             n=stats['checkouts']))
+    if stats['created'] != 1 or stats['size'] != 1:
+        raise ValueError("Sequential calls should reuse one connection")
+
+    configurePool(enabled=False)
+    if countPlayers() != 2 or poolStats() != {}:
+        raise ValueError("Pooling should be possible to disable")
+    configurePool()
+    print "18. Connections are reused from the pool"
+
+
+def bulkOperations():
+    """
+    Test that players and matches can be registered and reported in bulk
+    """
+    deleteMatches()
+    deletePlayers()
+
+    names = ["Player %d" % i for i in range(10)]
+    pids = registerPlayers(names)
+    if len(pids) != 10 or len(set(pids)) != 10:
+        raise ValueError("registerPlayers should return one id per player")
+    registered = dict((row[0], row[1]) for row in playerStandings())
+    if [registered.get(pid) for pid in pids] != names:
+        raise ValueError("registerPlayers should return ids in input order")
+
+    results = [(pids[i], pids[i + 1], i == 8) for i in range(0, 10, 2)]
+    mids = reportMatches(results)
+    if len(mids) != 5 or mids != sorted(mids):
+        raise ValueError("reportMatches should return ids in input order")
+    points = dict((row[0], row[2]) for row in playerStandings())
+    if points[pids[0]] != POINTS_FOR_WIN or points[pids[1]] != 0:
+        raise ValueError("Bulk reported results are recorded incorrectly")
+
+    try:
+        reportMatches([(pids[0], pids[2]), (pids[0], -1)])
+    except Exception:
+        pass
+    else:
+        raise ValueError("reportMatches should fail for unknown players")
+    if sum(row[3] for row in playerStandings()) != 10:
+        raise ValueError("Failed bulk report should not record any match")
+    print "19. Players and matches can be registered and reported in bulk"
+
+
+def maintainedStandings():
+    """
+    Test that standings follow match corrections and deletions
+    """
+    deleteMatches()
+    deletePlayers()
+    [id1, id2, id3] = registerPlayers(["Rarity", "Applejack", "Spike"])
+    mid = reportMatch(id1, id2)
+    reportMatch(id1, id3)
+    correctMatch(mid, id2, id1)
+    standings = dict((row[0], row[2:]) for row in playerStandings())
+    if standings != {id1: (POINTS_FOR_WIN, 2), id2: (POINTS_FOR_WIN, 1),
+                     id3: (0, 1)}:
+        raise ValueError("Corrected result is not reflected in standings")
+    deleteMatch(mid)
+    standings = dict((row[0], row[2:]) for row in playerStandings())
+    if standings != {id1: (POINTS_FOR_WIN, 1), id2: (0, 0), id3: (0, 1)}:
+        raise ValueError("Deleted match is not removed from standings")
+    if verifyStandings() != []:
+        raise ValueError("Maintained standings should not drift")
+    print "20. Standings follow match corrections and deletions"
+
+
+def schemaMigrations():
+    """
+    Test that the database schema is up to date and that standings and
+    pairing queries do not scan whole tables
+    """
+    import tournament_migrate
+
+    latest = tournament_migrate.availableMigrations()[-1][0]
+    if tournament_migrate.schemaVersion() != latest:
+        raise ValueError("New database should have all migrations applied")
+    if tournament_migrate.migrate() != []:
+        raise ValueError("Up to date database should not be migrated again")
+    problems = tournament_migrate.checkQueryPlans()
+    if problems:
+        raise ValueError("Hot queries use sequential scans: {p}".format(
+            p=problems))
+    print "21. Schema is up to date and hot queries use indexes"
+
+
+def rematchesAvoided():
+    """
+    Test that players who already played each other are not paired again
+    while another partner is available
+    """
+    deleteMatches()
+    deletePlayers()
+    [id1, id2, id3, id4] = registerPlayers(["Rarity", "Applejack",
+                                            "Fluttershy", "Pinkie Pie"])
+    reportMatch(id1, id2)
+    reportMatch(id3, id4)
+    reportMatch(id1, id3)
+    reportMatch(id2, id4)
+    pairs = set(frozenset([p[0], p[2]]) for p in swissPairings())
+    if pairs != set([frozenset([id1, id4]), frozenset([id2, id3])]):
+        raise ValueError("Players should not be paired for a rematch")
+    print "22. Players are not paired for a rematch"
+
+
+def optimalPairing():
+    """
+    Test that optimal pairing avoids a rematch, which greedy pairing of the
+    last two players can not avoid
+    """
+    deleteMatches()
+    deletePlayers()
+    p = registerPlayers(["Twilight Sparkle", "Fluttershy", "Applejack",
+                         "Pinkie Pie", "Rarity", "Rainbow Dash"])
+    reportMatches([(p[1], p[0]), (p[3], p[2]), (p[4], p[5]),
+                   (p[1], p[3]), (p[0], p[4]), (p[2], p[5])])
+
+    greedy = pairingQuality(swissPairings())
+    optimal = pairingQuality(swissPairings(mode=PAIRING_OPTIMAL))
+    if greedy['rematches'] != 1:
+        raise ValueError("Greedy pairing is expected to make a rematch here")
+    if optimal['rematches'] != 0 or optimal['pairs'] != 3:
+        raise ValueError("Optimal pairing should avoid the rematch")
+    if optimal['totalScoreGap'] > greedy['totalScoreGap'] + 2:
+        raise ValueError("Optimal pairing should keep score gaps small")
+    print "23. Optimal pairing avoids rematches"
+
+
+def driftedStandings():
+    """
+    Test that drifted standings can be found and rebuilt
+    """
+    deleteMatches()
+    deletePlayers()
+    [id1, id2] = registerPlayers(["Rarity", "Applejack"])
+    reportMatch(id1, id2)
+
+    with getConnection() as conn:
+        conn.cursor().execute("UPDATE Standings SET points = 5 "
+                              "WHERE pid = %s", (id2,))
+    if len(verifyStandings(0)) != 1 or len(rebuildStandings()) != 1:
+        raise ValueError("Drifted standings row should be reported")
+    if verifyStandings() != []:
+        raise ValueError("Rebuild should fix drifted standings")
+    print "24. Drifted standings are found and rebuilt"
+
+
+def simulatedTournaments():
+    """
+    Test that simulated tournaments favour stronger players
+    """
+    from tournament_sim import simulate
+    result = simulate([1900, 1700, 1500, 1300, 1100], 3, tournaments=500,
+                      seed=1)
+    ranks = result['rankDistribution']
+    if abs(ranks.sum(axis=0) - 1).max() > 1e-9:
+        raise ValueError("Every rank should be taken in every tournament")
+    if result['winProbability'][0] <= result['winProbability'][4]:
+        raise ValueError("The strongest player should win more often")
+    if abs(result['meanByes'].sum() - 3) > 1e-9:
+        raise ValueError("One player should get a bye every round")
+    print "25. Simulated tournaments favour stronger players"
+
+
+def tiebreakStandings():
+    """
+    Test that players with equal points are ordered by tiebreaks
+    """
+    deleteMatches()
+    deletePlayers()
+    [id1, id2, id3, id4] = registerPlayers(["Zecora", "Cheerilee", "Derpy",
+                                            "Trixie"])
+    reportMatch(id1, id4)
+    reportMatch(id3, id2)
+    reportMatch(id1, id3)
+    reportMatch(id2, id4)
+    standings = playerStandingsWithTiebreaks()
+    if [row[0] for row in standings] != [id1, id3, id2, id4]:
+        raise ValueError("Equal points should be ordered by Buchholz")
+    (pid, name, points, matches, buchholz, sb, omw) = standings[1]
+    if (points, matches, buchholz) != (1, 2, 3) or sb != 1.0 or omw != 0.75:
+        raise ValueError("Wrong tiebreaks: {row}".format(row=standings[1]))
+
+    registerPlayer("Lyra")
+    standings = playerStandingsWithTiebreaks()
+    byes = [row for row in standings if row[3] == 0]
+    if byes[0][2] != 2 * POINTS_FOR_BYE or byes[0][4:] != (0, 0, 0):
+        raise ValueError("Byes should count to points but not to tiebreaks")
+    print "26. Tiebreaks order players with equal points"
+
+
+def cachedStandings():
+    """
+    Test that cached standings are served until the tournament changes,
+    also when another process changes it
+    """
+    deleteMatches()
+    deletePlayers()
+    configureCache(maxTournaments=1)
+    try:
+        [id1, id2] = registerPlayers(["Spike", "Big Mac"])
+        standings = playerStandings()
+        standings.append("garbage")
+        if playerStandings() == standings or cacheStats()['hits'] != 1:
+            raise ValueError("Standings should be copied from the cache")
+        reportMatch(id1, id2)
+        if playerStandings()[0][2:] != (1, 1):
+            raise ValueError("A reported match should invalidate the cache")
+        playerStandings(1)
+        if cacheStats()['evictions'] != 1:
+            raise ValueError("Least recently used tournament should be "
+                             "evicted")
+
+        configureCache(mode=CACHE_SHARED)
+        swissPairings()
+        swissPairings()
+        with getConnection() as conn:
+            # the same as a match reported by another process
+            c = conn.cursor()
+            c.execute("INSERT INTO Matches (player1, p1points, player2, "
+                      "p2points, tournament) VALUES (%s, 1, %s, 0, 0)",
+                      (id2, id1))
+            c.execute("UPDATE Standings SET matches = matches + 1, "
+                      "points = points + (pid = %s)::int WHERE tid = 0",
+                      (id2,))
+            c.execute("UPDATE TournamentVersions SET version = version + 1 "
+                      "WHERE tid = 0")
+        if [row[2] for row in playerStandings()] != [1, 1]:
+            raise ValueError("Version in the database should invalidate "
+                             "the cache")
+        if cacheStats()['hits'] != 1:
+            raise ValueError("Pairings should be served from the cache")
+    finally:
+        configureCache(enabled=False)
+    print "27. Standings are cached until the tournament changes"
+
+
+def batchPairings():
+    """
+    Test that many tournaments are paired in one batch and that a failed
+    tournament does not fail the others
+    """
+    deleteMatches()
+    deletePlayers()
+    for tid, count in ((1, 4), (2, 5), (3, 6)):
+        pids = registerPlayers(["Pony %d" % i for i in range(count)], tid)
+        reportMatch(pids[0], pids[1], tid=tid)
+    pairings, report = swissPairingsBatch([1, 2, 3, 4], processes=2)
+    for tid in (1, 2, 3, 4):
+        if pairings[tid] != swissPairings(tid):
+            raise ValueError("Batch pairing should equal swissPairings")
+    if report[3]['players'] != 6 or report[3]['pairs'] != 3:
+        raise ValueError("Report should count players and pairs")
+
+    pairings, report = swissPairingsBatch([1, 2], mode='unknown')
+    if pairings != {} or 'ValueError' not in report[2]['error']:
+        raise ValueError("Failed tournaments should be reported")
+    print "28. Many tournaments are paired in one batch"
+
+
+def pagedStandings():
+    """
+    Test that standings can be streamed and read page by page
+    """
+    deleteMatches()
+    deletePlayers()
+    pids = registerPlayers(["Pony %d" % i for i in range(7)])
+    reportMatches([(pids[6], pids[0]), (pids[5], pids[1], True)])
+    standings = playerStandings()
+    if list(iterStandings(batchSize=2)) != standings:
+        raise ValueError("Streamed standings should equal playerStandings")
+
+    pages = [standingsPage(limit=3)]
+    while len(pages[-1]) == 3:
+        pages.append(standingsPage(limit=3, after=pages[-1][-1]))
+    if [len(page) for page in pages] != [3, 3, 1]:
+        raise ValueError("Pages should have at most limit rows")
+    if sum(pages, []) != standings:
+        raise ValueError("Pages should continue after the previous page")
+    if standingsPage(limit=2, offset=5) != standings[5:7]:
+        raise ValueError("Offset should skip rows")
+    print "29. Standings can be streamed and read page by page"
+
+
+def sessionTransactions():
+    """
+    Test that a session commits all its calls in one transaction and that
+    a savepoint rolls back only its block
+    """
+    deleteMatches()
+    deletePlayers()
+    try:
+        with Tournament() as session:
+            pids = session.registerPlayers(["Pony %d" % i for i in range(4)])
+            session.reportMatches([(pids[0], pids[1]), (pids[2], pids[3])])
+            if len(session.swissPairings()) != 2:
+                raise ValueError("A session should see its own changes")
+            raise KeyError("the round is cancelled")
+    except KeyError:
+        pass
+    if countPlayers() != 0:
+        raise ValueError("A failed session should be rolled back")
+
+    with Tournament() as session:
+        pids = session.registerPlayers(["Pony %d" % i for i in range(4)])
+        session.reportMatches([(pids[0], pids[1]), (pids[2], pids[3])])
+        try:
+            with session.savepoint():
+                session.reportMatch(pids[0], pids[2])
+                session.reportMatch(pids[1], -1)
+        except Exception:
+            pass
+        pairings = session.swissPairings()
+    if [row[3] for row in playerStandings()] != [1, 1, 1, 1]:
+        raise ValueError("A savepoint should roll back only its block")
+    if pairings != swissPairings():
+        raise ValueError("Session should continue after a savepoint")
+    print "30. Sessions commit many calls in one transaction"
+
+
+def instrumentedCalls():
+    """
+    Test that calls, statements and slow statements are measured
+    """
+    deleteMatches()
+    deletePlayers()
+    histogram = HistogramSink()
+    directory = tempfile.mkdtemp()
+    statsd = StatsdSink(os.path.join(directory, 'metrics.txt'))
+    slowQueries = logging.handlers.BufferingHandler(1000)
+    logging.getLogger('tournament.slowquery').addHandler(slowQueries)
+    configureMetrics([histogram, statsd], slowQueryThreshold=0)
+    try:
+        registerPlayers(["Pony %d" % i for i in range(4)])
+        playerStandings()
+        swissPairings()
+    finally:
+        configureMetrics(enabled=False)
+        logging.getLogger('tournament.slowquery').removeHandler(slowQueries)
+        statsd.close()
+
+    stats = histogram.stats()
+    if (stats['function:playerStandings']['rows'] != 4 or
+            stats['query:playerStandings#1']['rows'] != 4):
+        raise ValueError("Calls and statements should count rows")
+    if (stats['pairing:swissPairings']['calls'] != 1 or
+            stats['checkout:getConnection']['calls'] != 3):
+        raise ValueError("Pairing and connection checkouts should be "
+                         "measured")
+    if not any("FROM Standings" in record.getMessage()
+               for record in slowQueries.buffer):
+        raise ValueError("Slow statements should be logged with their SQL")
+    with open(os.path.join(directory, 'metrics.txt')) as f:
+        if "tournament.function.playerStandings.rows:4|c\n" not in f:
+            raise ValueError("Records should be written as statsd lines")
+    shutil.rmtree(directory)
+    print "31. Calls and statements are measured"
+
+
+def archivedTournaments():
+    """
+    Test that one tournament can be deleted or archived without changing
+    the others
+    """
+    deleteMatches()
+    deletePlayers()
+    for tid in (1, 2, 3):
+        pids = registerPlayers(["Pony %d" % i for i in range(4)], tid)
+        reportMatches([(pids[0], pids[1]), (pids[2], pids[3])], tid)
+    standings = playerStandings(3)
+    deleteTournament(1)
+    archiveTournament(2)
+    if playerStandings(1) or playerStandings(2) or swissPairings(2):
+        raise ValueError("Deleted and archived tournaments should be empty")
+    if playerStandings(3) != standings:
+        raise ValueError("Other tournaments should not change")
+    try:
+        archiveTournament(2)
+    except ValueError:
+        pass
+    else:
+        raise ValueError("A tournament should be archived only once")
+
+    registerPlayers(["Pony 4"], 1)
+    if len(playerStandings(1)) != 1:
+        raise ValueError("A deleted tournament should be ready for new "
+                         "players")
+    deleteTournament(2)
+    deleteMatches()
+    deletePlayers()
+    print "32. Tournaments can be deleted and archived one by one"
+
+
+def ratedPairings():
+    """
+    Test that reported matches update ratings, that recomputed ratings are
+    the same and that the first round can be paired by rating
+    """
+    deleteMatches()
+    deletePlayers()
+    a, b, c, d = registerPlayers(["Rook", "Knight", "Bishop", "Pawn"], 1)
+    reportMatch(a, b, tid=1)
+    reportMatch(c, d, isDraw=True, tid=1)
+    ratings = playerRatings(1)
+    if [row[0] for row in ratings] != [a, c, d, b]:
+        raise ValueError("Players should be sorted by rating")
+    if abs(ratings[0][2] - 1516) > 1e-9 or ratings[0][3] != 1:
+        raise ValueError("The winner should gain 16 points from 1500")
+    if abs(ratings[1][2] - 1500) > 1e-9:
+        raise ValueError("A draw of equal players should not change ratings")
+
+    for pid in (a, b, c, d):
+        registerPlayerForTournament(pid, 2)
+    pairs = set(frozenset(pair[::2]) for pair in swissPairings(2, seeded=True))
+    if pairs != set([frozenset([a, d]), frozenset([c, b])]):
+        raise ValueError("Upper half should be paired against lower half")
+
+    if recomputeRatings() != 4:
+        raise ValueError("All players who played should be rated")
+    recomputed = playerRatings(1)
+    if any(row[:2] != old[:2] or abs(row[2] - old[2]) > 1e-9
+           for row, old in zip(recomputed, ratings)):
+        raise ValueError("Recomputed ratings should be the same")
+    deleteMatches()
+    if any(row[2] != 1500 or row[3] for row in playerRatings(1)):
+        raise ValueError("Ratings should be reset with the matches")
+    deletePlayers()
+    print "33. Ratings follow results and seed the first round"
+
+
+def transferredHistory():
+    """
+    Test that tournament history can be exported and imported with new ids,
+    that a failed import can be resumed and that standings are exported
+    """
+    deleteMatches()
+    deletePlayers()
+    pids = registerPlayers(["Pony %d" % i for i in range(6)], 1)
+    reportMatches([(pids[0], pids[1]), (pids[2], pids[3], True),
+                   (pids[4], pids[5]), (pids[0], pids[2])], 1)
+    registerPlayers(["Other pony"], 2)
+    standings = [row[1:] for row in playerStandings(1)]
+    directory = tempfile.mkdtemp()
+    try:
+        report = tournament_transfer.exportHistory(directory, [1])
+        if report[tournament_transfer.MATCHES_FILE]['rows'] != 4:
+            raise ValueError("All matches of the tournament should be "
+                             "exported")
+
+        # the first import fails at the matches, the second one continues
+        matches = os.path.join(directory, tournament_transfer.MATCHES_FILE)
+        shutil.move(matches, matches + '.good')
+        with open(matches, 'w') as f:
+            f.write("mid,player1,p1points,player2,p2points,tournament\n"
+                    "x,1,1,2,0,1\n")
+        try:
+            tournament_transfer.importHistory(directory, tids={1: 3})
+        except Exception:
+            pass
+        else:
+            raise ValueError("A broken file should fail the import")
+        shutil.move(matches + '.good', matches)
+        report = tournament_transfer.importHistory(directory, tids={1: 3})
+        if (not report[tournament_transfer.PLAYERS_FILE]['resumed'] or
+                report[tournament_transfer.MATCHES_FILE]['resumed']):
+            raise ValueError("The import should continue with the failed "
+                             "step")
+        if countPlayers() != 13:
+            raise ValueError("Imported players should get new ids")
+        if [row[1:] for row in playerStandings(3)] != standings:
+            raise ValueError("Imported tournament should have the same "
+                             "standings")
+        tournament_transfer.importHistory(directory, tids={1: 3})
+        if countPlayers() != 13:
+            raise ValueError("A finished import should not be repeated")
+
+        path = os.path.join(directory, 'standings.ndjson')
+        with open(path, 'w') as f:
+            tournament_transfer.exportStandings(
+                f, 3, tournament_transfer.FORMAT_NDJSON)
+        with open(path) as f:
+            rows = [json.loads(line) for line in f]
+        if [(row['pid'], row['points']) for row in rows] != [
+                (row[0], row[2]) for row in playerStandingsWithBye(3)]:
+            raise ValueError("Exported standings should be in order")
+    finally:
+        shutil.rmtree(directory)
+    deleteMatches()
+    deletePlayers()
+    print "34. History is exported and imported in bulk"
+
+
+def storedRounds():
+    """
+    Test that a started round is stored with its bye, paired only once and
+    linked to reported results, and that stored byes give bye points
+    """
+    deleteMatches()
+    deletePlayers()
+    pids = registerPlayers(["Pony %d" % i for i in range(5)], 1)
+    number, pairs, bye = startRound(1)
+    if number != 1 or len(pairs) != 2 or bye not in pids:
+        raise ValueError("Five players should get two pairs and a bye")
+    if startRound(1) != (1, pairs, bye) or swissPairings(1) != pairs:
+        raise ValueError("A started round should not be paired again")
+
+    reportMatch(pairs[0][2], pairs[0][0], tid=1)
+    mid = reportMatch(pairs[1][0], pairs[1][2], tid=1)
+    if [row[4] is None for row in roundPairings(1)] != [False, False, True]:
+        raise ValueError("Results should be linked to their pairings")
+    deleteMatch(mid)
+    if swissPairings(1) != pairs or roundPairings(1)[1][4] is not None:
+        raise ValueError("A deleted result should be waited for again")
+    reportMatch(pairs[1][0], pairs[1][2], tid=1)
+
+    late = registerPlayer("Late pony", 1)
+    points = dict((row[0], row[2]) for row in playerStandingsWithBye(1))
+    if points[bye] != POINTS_FOR_BYE or points[late] != 0:
+        raise ValueError("Only stored byes should give bye points")
+    number, pairs, bye = startRound(1, mode=PAIRING_OPTIMAL)
+    if number != 2 or len(pairs) != 3 or bye is not None:
+        raise ValueError("The next round should be paired when all results "
+                         "are reported")
+    if roundPairings(1, 1)[-1][2:] != (None, None, None):
+        raise ValueError("The bye should be stored with its round")
+    if verifyStandings(1):
+        raise ValueError("Stored byes should not drift")
+    deleteMatches()
+    if roundPairings(1):
+        raise ValueError("Rounds should be deleted with the matches")
+    deletePlayers()
+    print "35. Rounds are stored with their pairings and byes"
+
+
+def roundStandings():
+    """
+    Test that standings are read after any round and that a corrected result
+    changes the standings of its round and later rounds only
+    """
+    deleteMatches()
+    deletePlayers()
+    registerPlayers(["Pony %d" % i for i in range(5)], 1)
+    after = {}
+    mids = {}
+    for number in range(1, SNAPSHOT_INTERVAL + 3):
+        number, pairs, bye = startRound(1)
+        mids[number] = reportMatches([(p[0], p[2]) for p in pairs], 1)
+        after[number] = playerStandings(1)
+    startRound(1)
+    for number in after:
+        if playerStandings(1, number) != after[number]:
+            raise ValueError("Standings after round %d should be kept" %
+                             number)
+
+    match = roundPairings(1, 2)[0]
+    correctMatch(mids[2][0], match[2], match[0])
+    if playerStandings(1, 1) != after[1]:
+        raise ValueError("Earlier rounds should not change")
+    for number in (2, SNAPSHOT_INTERVAL, SNAPSHOT_INTERVAL + 2):
+        points = dict((row[0], row[2]) for row in after[number])
+        points[match[0]] -= POINTS_FOR_WIN
+        points[match[2]] += POINTS_FOR_WIN
+        if dict((row[0], row[2])
+                for row in playerStandings(1, number)) != points:
+            raise ValueError("A correction should change later rounds")
+    if playerStandings(1, SNAPSHOT_INTERVAL + 2) != playerStandings(1):
+        raise ValueError("Standings after the last finished round should "
+                         "be the current ones")
+    deleteMatches()
+    deletePlayers()
+    print "36. Standings are read after any round"
+
+
+def bufferedReports():
+    """
+    Test that buffered results are committed in groups, fail one by one and
+    are written before players are paired
+    """
+    deleteMatches()
+    deletePlayers()
+    ids = registerPlayers(["Player %d" % i for i in range(16)])
+    # only a full batch is written, however slowly the threads start
+    configureReportBuffer(maxBatch=8, maxDelay=30)
+    try:
+        mids = []
+        threads = [threading.Thread(
+            target=lambda i=i: mids.append(reportMatch(ids[i], ids[i + 8])))
+            for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if len(set(mids)) != 8 or reportBufferStats()['batches'] != 1:
+            raise ValueError("Concurrent results should be committed in "
+                             "one batch")
+
+        tickets = [queueMatch(ids[0], ids[1]), queueMatch(ids[2], -1),
+                   queueMatch(ids[3], ids[4])]
+        swissPairings()
+        if not all(ticket.done() for ticket in tickets):
+            raise ValueError("Queued results should be written before "
+                             "players are paired")
+        try:
+            tickets[1].result()
+            raise ValueError("A result of an unknown player should fail")
+        except psycopg2.IntegrityError:
+            pass
+        if tickets[0].result() == tickets[2].result():
+            raise ValueError("Other results of a batch should be recorded")
+        if sum(row[2] for row in playerStandings()) != 10:
+            raise ValueError("Standings should count buffered results")
+
+        ticket = queueMatch(ids[5], ids[6])
+        configureReportBuffer(enabled=False)
+        if not ticket.done() or reportBufferStats() != {}:
+            raise ValueError("Disabling the buffer should write the queued "
+                             "results")
+    finally:
+        configureReportBuffer(enabled=False)
+    print "37. Results are buffered and committed in groups"
+
+
+def concurrentWriters():
+    """
+    Test that concurrent registrations get their own ids and that a pairing
+    of a started round is given one result
+    """
+    deleteMatches()
+    deletePlayers()
+    pids = []
+
+    def register():
+        pids.extend(registerPlayer("Scorekeeper", 1) for i in range(5))
+    threads = [threading.Thread(target=register) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if len(set(pids)) != 20 or len(playerStandings(1)) != 20:
+        raise ValueError("Concurrent registrations should get distinct ids")
+
+    number, pairings, bye = startRound(1)
+    reportMatch(pairings[0][0], pairings[0][2], tid=1)
+    try:
+        reportMatch(pairings[0][2], pairings[0][0], tid=1)
+    except Exception:
+        pass
+    else:
+        raise ValueError("A pairing should not get a second result in its "
+                         "round")
+    mids = reportMatches([(row[0], row[2]) for row in pairings[1:]], 1)
+    try:
+        correctMatch(mids[0], pairings[0][0], pairings[0][2])
+    except Exception:
+        pass
+    else:
+        raise ValueError("A correction should not repeat a result of the "
+                         "round")
+    if sum(row[3] for row in playerStandings(1)) != 20:
+        raise ValueError("Rejected results should not be counted")
+    print "38. Concurrent writers get own ids and one result per pairing"
+
+
+def playerRecords():
+    """
+    Test that career, per-tournament and head-to-head records of players
+    follow their results in all tournaments
+    """
+    deleteMatches()
+    deletePlayers()
+    a, b, c = registerPlayers(["Career A", "Career B", "Career C"], 5)
+    registerPlayerForTournament(a, 6)
+    registerPlayerForTournament(b, 6)
+    reportMatches([(a, b), (a, c), (c, b, True)], 5)
+    mid = reportMatch(b, a, tid=6)
+    reportMatch(a, b, tid=6)
+    win, draw = POINTS_FOR_WIN, POINTS_FOR_DRAW
+    if playerHistory(a) != [(5, 2, 2, 0, 0, 2 * win),
+                            (6, 2, 1, 0, 1, win)]:
+        raise ValueError("History should have the record of every "
+                         "tournament")
+    if playerCareer(a) != (4, 3, 0, 1, 3 * win, 2):
+        raise ValueError("Career should sum up all tournaments")
+    if (headToHead(a, b) != (3, 2, 0, 1, 2 * win, win) or
+            headToHead(b, a) != (3, 1, 0, 2, win, 2 * win) or
+            headToHead(c, b) != (1, 0, 1, 0, draw, draw)):
+        raise ValueError("Head-to-head records should count matches of "
+                         "both players in all tournaments")
+    correctMatch(mid, a, b)
+    if headToHead(a, b) != (3, 3, 0, 0, 3 * win, 0):
+        raise ValueError("Records should follow corrected results")
+    deleteMatch(mid)
+    deleteTournament(6)
+    if (playerHistory(a) != [(5, 2, 2, 0, 0, 2 * win)] or
+            headToHead(a, b) != (1, 1, 0, 0, win, 0) or
+            headToHead(a, a) != (0, 0, 0, 0, 0, 0) or
+            playerCareer(-1) != (0, 0, 0, 0, 0, 0)):
+        raise ValueError("Records should not count deleted results")
+    print "39. Players have career and head-to-head records"
+
+
+# All tests, in order. Every backend has to pass them (conformance suite),
+# except the tests of PostgreSQL specific functionality
+TESTS = [testCount, testStandingsBeforeMatches, testReportMatches,
+         testPairings, multiplyTournaments, oddPlayers, drawResults,
+         pooledConnections, bulkOperations, maintainedStandings,
+         schemaMigrations, rematchesAvoided, optimalPairing,
+         driftedStandings, simulatedTournaments, tiebreakStandings,
+         cachedStandings, batchPairings, pagedStandings,
+         sessionTransactions, instrumentedCalls, archivedTournaments,
+         ratedPairings, transferredHistory, storedRounds, roundStandings,
+         bufferedReports, concurrentWriters, playerRecords]
+POSTGRES_TESTS = [pooledConnections, schemaMigrations, driftedStandings,
+                  cachedStandings, instrumentedCalls, transferredHistory,
+                  bufferedReports]
+
+
 if __name__ == '__main__':
-    testCount()
-    testStandingsBeforeMatches()
-    testReportMatches()
-    testPairings()
-    multiplyTournaments()
-    oddPlayers()
-    drawResults()
+    # backends to test can be given as arguments, e.g. "postgres memory"
+    backends = sys.argv[1:] or [BACKEND_POSTGRES]
+    for backend in backends:
+        if len(backends) > 1:
+            print "Backend: " + backend
+        setBackend(backend)
+        for test in TESTS:
+            if backend == BACKEND_POSTGRES or test not in POSTGRES_TESTS:
+                test()
+    setBackend(BACKEND_POSTGRES)
     print "Success!  All tests pass!"
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+#
+# Test cases for the modules which need Python 3 (tournament_async.py and
+# tournament_daemon.py). tournament_test.py is written for Python 2.7, so
+# these tests are kept apart. They take the same backend arguments.
+
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+
+import psycopg2
+
+from tournament import *
+import tournament_async
+import tournament_daemon
+
+
+def asyncInterface():
+    """
+    Test that coroutines of tournament_async give the results of the module
+    functions, also when they run at the same time
+    """
+    deleteMatches()
+    deletePlayers()
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        ids = loop.run_until_complete(tournament_async.registerPlayers(
+            ["Async %d" % i for i in range(8)], 2))
+        if loop.run_until_complete(tournament_async.countPlayers()) != 8:
+            raise ValueError("Players registered by a coroutine should be "
+                             "counted")
+        mids = loop.run_until_complete(asyncio.gather(*[
+            tournament_async.reportMatch(ids[i], ids[i + 4], tid=2)
+            for i in range(4)]))
+        if len(set(mids)) != 4:
+            raise ValueError("Concurrent results should get their own ids")
+        for name in ('playerStandings', 'playerStandingsWithBye',
+                     'playerStandingsWithTiebreaks', 'swissPairings',
+                     'playerRatings'):
+            if loop.run_until_complete(
+                    getattr(tournament_async, name)(2)) != globals()[name](2):
+                raise ValueError("Coroutine %s should return the result of "
+                                 "the function" % name)
+        number, pairings, bye = loop.run_until_complete(
+            tournament_async.startRound(2))
+        if loop.run_until_complete(tournament_async.swissPairings(2)) != (
+                pairings):
+            raise ValueError("A started round should be paired once")
+        loop.run_until_complete(tournament_async.reportMatches(
+            [(row[0], row[2]) for row in pairings], 2))
+        if (loop.run_until_complete(tournament_async.playerStandings(2, 0))
+                != playerStandings(2, 0) or verifyStandings(2)):
+            raise ValueError("Results reported by coroutines should be "
+                             "counted in the standings")
+    finally:
+        tournament_async.configurePool()
+        asyncio.set_event_loop(None)
+        loop.close()
+    print("1. Coroutines return the results of the functions")
+
+
+def daemonBackend():
+    """
+    Test that the daemon serves the results of the database from memory,
+    writes through to it and loads them again after a restart
+    """
+    deleteMatches()
+    deletePlayers()
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'tournament.sock')
+    daemon = tournament_daemon.TournamentDaemon(path).start()
+    client = tournament_daemon.DaemonBackend(path)
+    try:
+        ids = client.registerPlayers(["Daemon %d" % i for i in range(9)], 4)
+        number, pairings, bye = client.startRound(4)
+        if (number, pairings, bye) != startRound(4):
+            raise ValueError("A round started by the daemon should be stored "
+                             "in the database")
+        mids = client.reportMatches([(row[0], row[2])
+                                     for row in pairings[:2]], 4)
+        try:
+            client.reportMatch(pairings[0][2], pairings[0][0], tid=4)
+            raise ValueError("The daemon should reject a second result")
+        except psycopg2.IntegrityError:
+            pass
+        client.reportMatch(pairings[2][0], pairings[2][2], True, 4)
+        for name in ('playerStandings', 'playerStandingsWithBye',
+                     'playerStandingsWithTiebreaks', 'swissPairings',
+                     'roundPairings'):
+            if getattr(client, name)(4) != globals()[name](4):
+                raise ValueError("The daemon should return the result of %s "
+                                 "of the database" % name)
+
+        # a crash loses memory, the database has every write
+        daemon.shutdown()
+        reportMatch(pairings[3][0], pairings[3][2], tid=4)
+        daemon = tournament_daemon.TournamentDaemon(path).start()
+        client.correctMatch(mids[0], pairings[0][2], pairings[0][0])
+        if (client.playerStandings(4) != playerStandings(4) or
+                client.playerStandings(4, 0) != playerStandings(4, 0) or
+                client.roundPairings(4) != roundPairings(4) or
+                verifyStandings(4)):
+            raise ValueError("A restarted daemon should load the tournament "
+                             "from the database")
+        setBackend(client)
+        try:
+            if len(playerStandings(4)) != len(ids):
+                raise ValueError("The daemon should be usable as backend")
+        finally:
+            setBackend(BACKEND_POSTGRES)
+    finally:
+        client.close()
+        daemon.shutdown()
+        shutil.rmtree(directory)
+    print("2. The daemon serves and writes through to the database")
+
+
+def daemonLargeIds():
+    """
+    Test that the daemon loads tournaments of players with large ids into
+    memory which grows with the number of players, not with their ids
+    """
+    deleteMatches()
+    deletePlayers()
+    with getConnection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT pg_get_serial_sequence('players', 'pid')")
+        sequence = c.fetchone()[0]
+        c.execute("SELECT last_value, is_called FROM " + sequence)
+        lastValue, isCalled = c.fetchone()
+        c.execute("SELECT setval(%s, 5000000)", (sequence,))
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, 'tournament.sock')
+    daemon = client = None
+    try:
+        tids = list(range(1, 11))
+        for tid in tids:
+            ids = registerPlayers(["Large %d-%d" % (tid, i)
+                                   for i in range(8)], tid)
+            reportMatches([(ids[i], ids[i + 1]) for i in range(0, 8, 2)],
+                          tid)
+        daemon = tournament_daemon.TournamentDaemon(path, tids).start()
+        client = tournament_daemon.DaemonBackend(path)
+        for tid in tids:
+            if client.playerStandings(tid) != playerStandings(tid):
+                raise ValueError("The daemon should load players with large "
+                                 "ids")
+        rows = sum(len(t.points)
+                   for t in daemon.memory._tournaments.values())
+        if rows != 8 * len(tids):
+            raise ValueError("Standings in memory should have a row per "
+                             "player, not per id")
+    finally:
+        if client is not None:
+            client.close()
+        if daemon is not None:
+            daemon.shutdown()
+        shutil.rmtree(directory)
+        # later players get the ids they would have got without this test
+        deleteMatches()
+        deletePlayers()
+        with getConnection() as conn:
+            conn.cursor().execute("SELECT setval(%s, %s, %s)",
+                                  (sequence, lastValue, isCalled))
+    print("3. The daemon loads players with large ids")
+
+
+# All tests, in order. Every backend has to pass them (conformance suite),
+# except the tests of PostgreSQL specific functionality
+TESTS = [asyncInterface, daemonBackend, daemonLargeIds]
+POSTGRES_TESTS = [daemonBackend, daemonLargeIds]
+
+
+if __name__ == '__main__':
+    # backends to test can be given as arguments, e.g. "postgres memory"
+    backends = sys.argv[1:] or [BACKEND_POSTGRES]
+    for backend in backends:
+        if len(backends) > 1:
+            print("Backend: " + backend)
+        setBackend(backend)
+        for test in TESTS:
+            if backend == BACKEND_POSTGRES or test not in POSTGRES_TESTS:
+                test()
+    setBackend(BACKEND_POSTGRES)
+    print("Success!  All tests pass!")
@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+#
+# tournament_transfer.py -- bulk import and export of tournament history
+#
+# Players, tournament members and matches are exported to CSV files and
+# imported from them with PostgreSQL COPY, which streams the rows between the
+# files and the database, so neither side holds a whole table in memory.
+# Imported players and matches get new ids (pid and mid are serial columns,
+# so the exported ids may be taken already). An import runs in steps, every
+# step is one transaction recorded in the ImportSteps table, so an import
+# which failed continues with the failed step when it is run again.
+# Standings are exported as CSV or newline-delimited JSON.
+#
+
+import json
+import os
+from timeit import default_timer as timer
+
+import tournament
+
+# Files of an exported history, in the order they are imported
+PLAYERS_FILE = 'players.csv'
+MEMBERS_FILE = 'tournamentmembers.csv'
+MATCHES_FILE = 'matches.csv'
+
+FORMAT_CSV = 'csv'
+FORMAT_NDJSON = 'ndjson'  # one JSON object per line
+
+# (file, rows) of every exported table. Players are those who are members of
+# or played in the exported tournaments; matches keep the order they were
+# reported in (ratings are replayed in this order)
+_EXPORT_QUERIES = [
+    (PLAYERS_FILE, '''SELECT pid, name
+                   FROM Players
+                   WHERE %(all)s
+                   OR pid IN (SELECT pid
+                              FROM TournamentMembers
+                              WHERE tid = ANY (%(tids)s::integer[]))
+                   OR pid IN (SELECT player1
+                              FROM Matches
+                              WHERE tournament = ANY (%(tids)s::integer[]))
+                   OR pid IN (SELECT player2
+                              FROM Matches
+                              WHERE tournament = ANY (%(tids)s::integer[]))
+                   ORDER BY pid'''),
+    (MEMBERS_FILE, '''SELECT tid, pid
+                   FROM TournamentMembers
+                   WHERE %(all)s OR tid = ANY (%(tids)s::integer[])
+                   ORDER BY tid, pid'''),
+    (MATCHES_FILE, '''SELECT mid, player1, p1points, player2, p2points,
+                          tournament
+                   FROM Matches
+                   WHERE %(all)s OR tournament = ANY (%(tids)s::integer[])
+                   ORDER BY mid'''),
+]
+
+# Temporary tables the files are copied to by import steps, dropped at the
+# end of the step
+_STAGING_TABLES = {
+    PLAYERS_FILE: ('import_players',
+                   '''CREATE TEMPORARY TABLE import_players (
+                          pid integer, name text) ON COMMIT DROP'''),
+    MEMBERS_FILE: ('import_members',
+                   '''CREATE TEMPORARY TABLE import_members (
+                          tid integer, pid integer) ON COMMIT DROP'''),
+    MATCHES_FILE: ('import_matches',
+                   '''CREATE TEMPORARY TABLE import_matches (
+                          mid integer, player1 integer, p1points integer,
+                          player2 integer, p2points integer,
+                          tournament integer) ON COMMIT DROP'''),
+}
+
+# Join with the tids mapping of importHistory: imported tournament {tid} is
+# stored as coalesce(map.new, {tid}). The arrays are joined by subscript
+# (unnest of several arrays needs PostgreSQL 9.4)
+_TID_MAP_JOIN = '''LEFT JOIN (SELECT (%(old)s::integer[])[i] AS old,
+                           (%(new)s::integer[])[i] AS new
+                    FROM generate_subscripts(%(old)s::integer[], 1) AS i)
+                    AS map
+                    ON map.old = {tid}'''
+
+
+def exportHistory(directory, tids=None):
+    """Writes players, tournament members and matches to CSV files.
+
+    Every table is copied by one COPY statement straight to its file in
+    directory (PLAYERS_FILE, MEMBERS_FILE and MATCHES_FILE, with a header
+    line), all of them from one snapshot of the database.
+
+    Args:
+      directory: existing directory to write the files to
+      tids: iterable of tournament IDs to export (None exports everything)
+
+    Returns:
+      A dict {file: stats} with rows, seconds and rowsPerSecond.
+    """
+    params = {'all': tids is None,
+              'tids': sorted(set(tids)) if tids is not None else []}
+    report = {}
+    with tournament.getConnection() as conn:
+        c = conn.cursor()
+        c.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+        for name, query in _EXPORT_QUERIES:
+            query = c.mogrify(query, params)
+            start = timer()
+            with open(os.path.join(directory, name), 'w') as f:
+                c.copy_expert(_copyTo(query), f)
+            report[name] = _stats(c.rowcount, timer() - start)
+    return report
+
+
+def importHistory(directory, job=None, tids=None):
+    """Adds players, tournament members and matches from files written by
+    exportHistory.
+
+    Players and matches get new ids from the sequences of the database,
+    members and matches refer to the new player ids. The import runs in
+    three steps, one per file. Every step is one transaction, which loads
+    the file into a temporary table with COPY and inserts the rows from
+    there; members and matches are added to the standings in the same
+    transaction. Finished steps are recorded under the job name, so calling
+    this again with the same job after a failure continues with the failed
+    step, and a finished import is not repeated. Ratings are not changed,
+    see tournament.recomputeRatings.
+
+    Args:
+      directory: directory with the exported files
+      job: name of the import (the absolute path of directory by default)
+      tids: dict {exported tournament ID: new ID} of tournaments to import
+        under other ids, other tournaments keep theirs
+
+    Returns:
+      A dict {file: stats} with rows, seconds, rowsPerSecond and resumed
+      (True if the step was finished by an earlier call).
+    """
+    if job is None:
+        job = os.path.abspath(directory)
+    tids = dict(tids or {})
+    params = {'job': job, 'old': list(tids), 'new': list(tids.values())}
+
+    report = {}
+    for step, importRows in ((PLAYERS_FILE, _importPlayers),
+                             (MEMBERS_FILE, _importMembers),
+                             (MATCHES_FILE, _importMatches)):
+        with tournament.Tournament() as session:
+            c = session._cursor
+            # concurrent runs of one job wait for each other
+            c.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (job,))
+            c.execute("""SELECT rows, seconds
+                        FROM ImportSteps
+                        WHERE job = (%s)
+                        AND step = (%s)""", (job, step))
+            row = c.fetchone()
+            if row is not None:
+                report[step] = dict(_stats(*row), resumed=True)
+                continue
+
+            start = timer()
+            table, create = _STAGING_TABLES[step]
+            c.execute(create)
+            with open(os.path.join(directory, step)) as f:
+                c.copy_expert(_copyFrom(table), f)
+            rows = c.rowcount
+            # without statistics of the staged rows and of the players mapped
+            # by earlier steps the planner expects a few rows and joins them
+            # by nested loops
+            c.execute("ANALYZE " + table)
+            c.execute("ANALYZE ImportedPlayers")
+            changed = importRows(session, params, tids)
+            tournament._bumpVersions(c, changed)
+            session._recordChange(changed)
+
+            seconds = timer() - start
+            c.execute("""INSERT INTO ImportSteps (job, step, rows, seconds)
+                        VALUES (%s, %s, %s, %s)""", (job, step, rows, seconds))
+            report[step] = dict(_stats(rows, seconds), resumed=False)
+    return report
+
+
+def exportStandings(output, tid=0, format=FORMAT_CSV):
+    """Writes standings with points for "Bye" (see
+    tournament.playerStandingsWithBye) to a file.
+
+    CSV is written by COPY with a header line (pid, name, points, matches).
+    Newline-delimited JSON has one object with these keys per line, read
+    from a server-side cursor tournament.STREAM_BATCH_SIZE rows at a time.
+    Either way the standings are never held in memory as a whole.
+
+    Args:
+      output: file object to write to
+      tid: tournament ID (0 is default tournament)
+      format: FORMAT_CSV or FORMAT_NDJSON
+
+    Returns:
+      Stats with rows, seconds and rowsPerSecond.
+    """
+    if format not in (FORMAT_CSV, FORMAT_NDJSON):
+        raise ValueError("Unknown format {format}".format(format=format))
+
+    start = timer()
+    with tournament.getConnection() as conn:
+        params = {'bye': tournament.POINTS_FOR_BYE, 'tid': tid}
+        if format == FORMAT_CSV:
+            c = conn.cursor()
+            c.copy_expert(_copyTo(c.mogrify(
+                tournament.STANDINGS_WITH_BYE_SQL, params)), output)
+            rows = c.rowcount
+        else:
+            c = conn.cursor('exportStandings')
+            c.itersize = tournament.STREAM_BATCH_SIZE
+            c.execute(tournament.STANDINGS_WITH_BYE_SQL, params)
+            rows = 0
+            for pid, name, points, matches in c:
+                output.write(json.dumps({'pid': pid, 'name': name,
+                                         'points': points,
+                                         'matches': matches}) + '\n')
+                rows += 1
+            c.close()
+    return _stats(rows, timer() - start)
+
+
+def _importPlayers(session, params, tids):
+    """Gives imported players new ids, remembered in ImportedPlayers.
+    Returns the changed tournament IDs (none)."""
+    c = session._cursor
+    # the subquery is sorted before nextval() is called, so new ids keep
+    # the order of the exported ones
+    c.execute("""INSERT INTO ImportedPlayers (job, oldPid, pid)
+                SELECT %(job)s, pid, nextval(%(sequence)s::regclass)
+                FROM (SELECT pid FROM import_players ORDER BY pid) AS ordered
+                """, dict(params, sequence=_sequence(c, 'Players', 'pid')))
+    c.execute("""INSERT INTO Players (pid, name)
+                SELECT ImportedPlayers.pid, import_players.name
+                FROM import_players, ImportedPlayers
+                WHERE ImportedPlayers.job = %(job)s
+                AND ImportedPlayers.oldPid = import_players.pid""", params)
+    return []
+
+
+def _importMembers(session, params, tids):
+    """Adds imported members with their new player ids, and their rows in
+    Standings. Returns the changed tournament IDs."""
+    c = session._cursor
+    changed = _stagedTids(c, 'import_members', 'tid', tids)
+    session._ensurePartitions(changed)
+    c.execute("""CREATE TEMPORARY TABLE import_new_members ON COMMIT DROP AS
+                SELECT DISTINCT coalesce(map.new, import_members.tid) AS tid,
+                       ImportedPlayers.pid
+                FROM import_members
+                JOIN ImportedPlayers
+                    ON ImportedPlayers.job = %(job)s
+                    AND ImportedPlayers.oldPid = import_members.pid
+                """ + _TID_MAP_JOIN.format(tid='import_members.tid'), params)
+    # imported players are new, so they are not members of anything yet
+    c.execute("""INSERT INTO TournamentMembers (tid, pid)
+                SELECT tid, pid FROM import_new_members""")
+    c.execute("""INSERT INTO Standings (tid, pid)
+                SELECT tid, pid FROM import_new_members""")
+    return changed
+
+
+def _importMatches(session, params, tids):
+    """Adds imported matches with new ids, in the exported order, and their
+    results to Standings and PlayerResults. Returns the changed tournament
+    IDs."""
+    c = session._cursor
+    changed = _stagedTids(c, 'import_matches', 'tournament', tids)
+    session._ensurePartitions(changed)
+    # the subquery is sorted before nextval() is called, so new ids keep the
+    # order of the exported ones (ratings are replayed in this order)
+    c.execute("""CREATE TEMPORARY TABLE import_results ON COMMIT DROP AS
+                WITH inserted AS (
+                    INSERT INTO Matches (mid, player1, p1points, player2,
+                                         p2points, tournament)
+                    SELECT nextval(%(sequence)s::regclass), player1,
+                           p1points, player2, p2points, tid
+                    FROM (SELECT first.pid AS player1,
+                                 import_matches.p1points,
+                                 second.pid AS player2,
+                                 import_matches.p2points,
+                                 coalesce(map.new, import_matches.tournament)
+                                     AS tid
+                          FROM import_matches
+                          JOIN ImportedPlayers AS first
+                              ON first.job = %(job)s
+                              AND first.oldPid = import_matches.player1
+                          JOIN ImportedPlayers AS second
+                              ON second.job = %(job)s
+                              AND second.oldPid = import_matches.player2
+                          """ + _TID_MAP_JOIN.format(
+                              tid='import_matches.tournament') + """
+                          ORDER BY import_matches.mid) AS ordered
+                    RETURNING mid, tournament, player1, p1points,
+                              player2, p2points
+                ),
+                history AS (
+                    INSERT INTO PlayerResults (pid, opponent, mid, tid,
+                                               points, opponentPoints)
+                    SELECT player1, player2, mid, tournament, p1points,
+                           p2points
+                    FROM inserted
+                    UNION ALL
+                    SELECT player2, player1, mid, tournament, p2points,
+                           p1points
+                    FROM inserted
+                )
+                SELECT tid, pid, sum(points) AS points, count(*) AS matches
+                FROM (SELECT tournament AS tid, player1 AS pid,
+                             p1points AS points
+                      FROM inserted
+                      UNION ALL
+                      SELECT tournament, player2, p2points
+                      FROM inserted) AS results
+                GROUP BY tid, pid""",
+              dict(params, sequence=_sequence(c, 'Matches', 'mid')))
+    c.execute("""UPDATE Standings
+                SET points = Standings.points + import_results.points,
+                    matches = Standings.matches + import_results.matches
+                FROM import_results
+                WHERE Standings.tid = import_results.tid
+                AND Standings.pid = import_results.pid""")
+    # players may play without being members of the tournament, their rows
+    # are inserted with the results, not inserted and then updated
+    c.execute("""INSERT INTO Standings (tid, pid, points, matches)
+                SELECT tid, pid, points, matches
+                FROM import_results
+                WHERE NOT EXISTS (SELECT 1
+                                  FROM Standings
+                                  WHERE Standings.tid = import_results.tid
+                                  AND Standings.pid = import_results.pid)""")
+    return changed
+
+
+def _stagedTids(c, table, column, tids):
+    """Returns the distinct tournament IDs of a staging table, changed by
+    the mapping tids."""
+    c.execute("SELECT DISTINCT {column} FROM {table}".format(column=column,
+                                                             table=table))
+    return sorted(set(tids.get(row[0], row[0]) for row in c.fetchall()))
+
+
+def _sequence(c, table, column):
+    """Returns the name of the serial sequence of table.column, which is
+    given to nextval() as a constant, not looked up for every row."""
+    c.execute("SELECT pg_get_serial_sequence(%s, %s)", (table, column))
+    return c.fetchone()[0]
+
+
+def _copyTo(query):
+    """Returns COPY of the rows of query to the client as CSV."""
+    if isinstance(query, bytes):
+        query = query.decode('utf-8')
+    return "COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true)".format(
+        query=query)
+
+
+def _copyFrom(table):
+    """Returns COPY of CSV rows from the client to table."""
+    return "COPY {table} FROM STDIN WITH (FORMAT csv, HEADER true)".format(
+        table=table)
+
+
+def _stats(rows, seconds):
+    """Returns stats of one transfer."""
+    return {'rows': rows, 'seconds': seconds,
+            'rowsPerSecond': rows / seconds if seconds else None}